@@ -0,0 +1,13 @@
+"""
+pytunes benchmarks
+
+Benchmarks for library, index database and command line hot paths, run against synthetic
+libraries with the synthetic Apple Event bridge (see pytunes.bridge). Each benchmark runs
+in a separate process and reports wall time, Apple Event counts and peak RSS as JSON.
+
+Usage:
+
+python -m benchmarks --sizes 1000,10000 --output results.json
+python -m benchmarks --sizes 200000 --benchmarks update_index_full,lookup_index
+python -m benchmarks --compare baseline.json results.json
+"""
@@ -0,0 +1,664 @@
+"""
+Benchmark cases
+
+Each benchmark is a function receiving BenchmarkEnvironment. It prepares the benchmark
+and returns a function running the measured part, which can return a dictionary of
+additional metrics.
+"""
+
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import time
+
+from collections import OrderedDict
+
+BENCHMARKS = OrderedDict()
+
+# Page sizes compared by library_page_sizes
+PAGE_SIZES = (
+    50,
+    200,
+    500,
+    2000,
+)
+
+# Number of single path lookups in lookup_index
+LOOKUP_SAMPLE_SIZE = 1000
+
+# Number of queries in search benchmarks
+SEARCH_QUERIES = 100
+
+# Number of processes started by cold start benchmark
+COLD_START_RUNS = 5
+
+# Number of reader processes in concurrent_readers
+READER_PROCESSES = 2
+
+# Fraction of library tracks modified before incremental update
+MODIFIED_TRACKS_RATIO = 0.01
+
+# Import time budgets in milliseconds for pytunes subcommands run by cli_import_time
+IMPORT_TIME_BUDGETS = OrderedDict((
+    ('lookup-index', 150),
+    ('search', 150),
+    ('info', 200),
+    ('volume', 200),
+))
+
+# Modules which should not be imported by subcommands reading only the index database
+HEAVY_MODULES = (
+    'appscript',
+    'mactypes',
+    'oodi',
+    'pytz',
+    'pytunes.terminology',
+    'systematic.process',
+)
+
+# Subcommands which should not import HEAVY_MODULES
+INDEX_ONLY_COMMANDS = (
+    'lookup-index',
+    'search',
+)
+
+# pytunes subcommands compared with and without warm client server by server_latency
+SERVER_COMMANDS = (
+    ('info',),
+    ('volume',),
+    ('volume', '+5'),
+    ('shuffle',),
+    ('next',),
+)
+
+# Runs of each subcommand by server_latency, fastest run is reported
+SERVER_RUNS = 5
+
+# Number of status requests timed by server_latency
+SERVER_RPC_CALLS = 100
+
+# Seconds to wait for warm client server to start
+SERVER_START_TIMEOUT = 60
+
+SERVER_COMMAND = """
+import sys
+sys.argv = ['pytunes-server'] + sys.argv[1:]
+from pytunes.bin.pytunes_server import main
+main()
+"""
+
+CLI_COMMAND = """
+import sys
+sys.argv = ['pytunes'] + sys.argv[1:]
+from pytunes.bin.pytunes import main
+main()
+"""
+
+COLD_START_PATH_INDEX = """
+import sys
+from pytunes.pathindex import PathIndex
+with PathIndex(sys.argv[1]) as index:
+    index.lookup(sys.argv[2])
+"""
+
+COLD_START_DATABASE = """
+import sys
+from pytunes.database import TrackIndexReader
+TrackIndexReader(sys.argv[1]).lookup_index(sys.argv[2])
+"""
+
+
+def benchmark(function):
+    """
+    Register benchmark function
+    """
+    BENCHMARKS[function.__name__] = function
+    return function
+
+
+def percentile(values, fraction):
+    """
+    Return percentile of values, or None for no values
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def run_cli(main, argv):
+    """
+    Run console script main function with given arguments
+    """
+    saved = sys.argv
+    sys.argv = argv
+    try:
+        main()
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            raise RuntimeError('{} failed with exit code {}'.format(argv[0], e.code))
+    finally:
+        sys.argv = saved
+
+
+def parse_import_time(output):
+    """
+    Parse python -X importtime output
+
+    Returns tuple of total import time in milliseconds and set of imported module names
+    """
+    total = 0
+    modules = set()
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        fields = line.split('|')
+        name = fields[2][1:]
+        modules.add(name.strip())
+        if not name.startswith(' '):
+            total += int(fields[1])
+    return total / 1000, modules
+
+
+def sample(items, count, seed=0):
+    """
+    Return reproducible random sample of at most count items
+    """
+    return random.Random(seed).sample(items, min(count, len(items)))
+
+
+@benchmark
+def library_iteration(env):
+    """
+    Iterate all library tracks and resolve paths
+    """
+    library = env.client.library
+
+    def run():
+        count = 0
+        for track in library:
+            track.path
+            count += 1
+        return {'tracks': count}
+    return run
+
+
+@benchmark
+def library_page_sizes(env):
+    """
+    Iterate library with different playlist iterator page sizes
+    """
+    from pytunes.playlist import Playlist
+    client = env.client
+
+    def run():
+        results = {}
+        for page_size in PAGE_SIZES:
+            events = env.application.counters['events']
+            start = time.perf_counter()
+            count = sum(1 for track in Playlist(client, page_size=page_size))
+            results[str(page_size)] = {
+                'tracks': count,
+                'seconds': time.perf_counter() - start,
+                'events': env.application.counters['events'] - events,
+            }
+        return results
+    return run
+
+
+@benchmark
+def library_fetch(env):
+    """
+    Fetch default fields for all library tracks
+    """
+    from pytunes.playlist import DEFAULT_FETCH_FIELDS
+    library = env.client.library
+
+    def run():
+        return {'tracks': len(library.fetch(DEFAULT_FETCH_FIELDS))}
+    return run
+
+
+@benchmark
+def track_properties(env):
+    """
+    Read all properties of library tracks one track at a time
+    """
+    tracks = env.client.library.tracks(0, LOOKUP_SAMPLE_SIZE, fields=())
+
+    def run():
+        for track in tracks:
+            track.items()
+        return {'tracks': len(tracks)}
+    return run
+
+
+@benchmark
+def playlist_catalog(env):
+    """
+    Load playlist catalog and build playlist paths
+    """
+    from pytunes.playlist import PlaylistCatalog
+    catalog = PlaylistCatalog(env.client)
+
+    def run():
+        catalog.load()
+        return {'playlists': len(catalog.paths(smart=None))}
+    return run
+
+
+@benchmark
+def playlist_export(env):
+    """
+    Export all playlists as m3u files with pytunes-playlists export
+    """
+    from pytunes.bin.pytunes_playlists import main
+    directory = os.path.join(env.workdir, 'Playlists')
+
+    def run():
+        run_cli(main, ['pytunes-playlists', '-D', directory, 'export', '--smart-playlists'])
+        return {'files': sum(len(filenames) for path, dirs, filenames in os.walk(directory))}
+    return run
+
+
+@benchmark
+def pytunes_update(env):
+    """
+    Compare library against music tree with pytunes-update
+    """
+    from pytunes.bin.pytunes_update import main
+    env.files
+
+    def run():
+        run_cli(main, ['pytunes-update', '--music-path', env.root])
+    return run
+
+
+@benchmark
+def update_index_full(env):
+    """
+    Full track index update
+    """
+    env.files
+    indexdb = env.client.indexdb
+
+    def run():
+        start = time.perf_counter()
+        processed, removed = indexdb.update(full=True)
+        return {
+            'processed': processed,
+            'removed': removed,
+            'rows_per_second': processed / (time.perf_counter() - start),
+        }
+    return run
+
+
+@benchmark
+def update_index_per_row(env):
+    """
+    Full track index update with one add_track and commit per track
+
+    Baseline for update_index_full, which writes tracks in batched upsert transactions
+    """
+    from pytunes.database import WATERMARK_FIELDS
+    from pytunes.track import Track
+    env.files
+    client = env.client
+    indexdb = client.indexdb
+
+    def run():
+        start = time.perf_counter()
+        tracks = client.library.fetch(('persistent_ID',) + WATERMARK_FIELDS)
+        for persistent_id, values in tracks:
+            indexdb.add_track(Track(client, client.track_reference(persistent_id), values=values))
+        return {
+            'processed': len(tracks),
+            'rows_per_second': len(tracks) / (time.perf_counter() - start),
+        }
+    return run
+
+
+@benchmark
+def update_index_incremental(env):
+    """
+    Incremental track index update after modifying tracks
+    """
+    env.files
+    indexdb = env.client.indexdb
+    indexdb.update(full=True)
+    env.modify_tracks(max(int(env.size * MODIFIED_TRACKS_RATIO), 1))
+
+    def run():
+        processed, removed = indexdb.update()
+        return {'processed': processed, 'removed': removed}
+    return run
+
+
+@benchmark
+def update_index_metadata(env):
+    """
+    Full track index update with metadata and playlist mirror
+    """
+    env.files
+    indexdb = env.client.indexdb
+
+    def run():
+        processed, removed = indexdb.update(full=True, metadata=True)
+        return {'processed': processed, 'removed': removed}
+    return run
+
+
+@benchmark
+def stat_tracks_parallel(env):
+    """
+    Read track file modification times with parallel directory listings
+    """
+    from pytunes.database import stat_tracks
+    tracks = [(index, index, path) for index, path in enumerate(env.files)]
+
+    def run():
+        return {'files': sum(1 for result in stat_tracks(tracks) if result[3] is not None)}
+    return run
+
+
+@benchmark
+def stat_tracks_serial(env):
+    """
+    Read track file modification times with os.stat for each file
+    """
+    paths = env.files
+
+    def run():
+        return {'files': sum(1 for path in paths if os.stat(path).st_mtime is not None)}
+    return run
+
+
+@benchmark
+def lookup_index(env):
+    """
+    Lookup single paths from track index database
+    """
+    env.files
+    indexdb = env.client.indexdb
+    indexdb.update(full=True)
+    paths = sample(env.paths, LOOKUP_SAMPLE_SIZE)
+
+    def run():
+        start = time.perf_counter()
+        for path in paths:
+            indexdb.lookup_index(path)
+        return {'lookup_ms': (time.perf_counter() - start) * 1000 / len(paths)}
+    return run
+
+
+@benchmark
+def lookup_index_batched(env):
+    """
+    Lookup all library paths from track index database in batches
+    """
+    env.files
+    indexdb = env.client.indexdb
+    indexdb.update(full=True)
+    paths = env.paths
+
+    def run():
+        start = time.perf_counter()
+        found = sum(1 for path, persistent_id in indexdb.lookup_indexes(iter(paths)) if persistent_id is not None)
+        return {'found': found, 'paths_per_second': len(paths) / (time.perf_counter() - start)}
+    return run
+
+
+@benchmark
+def path_index(env):
+    """
+    Lookup all library paths from memory mapped path index
+    """
+    from pytunes.pathindex import PathIndex
+    env.files
+    indexdb = env.client.indexdb
+    indexdb.update(full=True)
+    paths = env.paths
+
+    def run():
+        start = time.perf_counter()
+        with PathIndex(indexdb.path_index_path) as index:
+            found = sum(1 for path in paths if index.lookup(path) is not None)
+        return {'found': found, 'lookups_per_second': len(paths) / (time.perf_counter() - start)}
+    return run
+
+
+@benchmark
+def lookup_cold_start(env):
+    """
+    Lookup one path in a new python process from path index and sqlite database
+    """
+    env.files
+    indexdb = env.client.indexdb
+    indexdb.update(full=True)
+    path = env.paths[len(env.paths) // 2]
+
+    def measure(script, filename):
+        timings = []
+        for run in range(COLD_START_RUNS):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', script, filename, path], check=True)
+            timings.append((time.perf_counter() - start) * 1000)
+        return min(timings)
+
+    def run():
+        return {
+            'path_index_ms': measure(COLD_START_PATH_INDEX, indexdb.path_index_path),
+            'database_ms': measure(COLD_START_DATABASE, indexdb.db_path),
+        }
+    return run
+
+
+@benchmark
+def cli_import_time(env):
+    """
+    Import time of pytunes subcommands with python -X importtime against budgets
+    """
+    arguments = {
+        'lookup-index': [env.paths[0]],
+        'search': ['track'],
+    }
+
+    def run():
+        results = {}
+        for command, budget in IMPORT_TIME_BUDGETS.items():
+            start = time.perf_counter()
+            process = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c', CLI_COMMAND, command] + arguments.get(command, []),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                universal_newlines=True,
+            )
+            wall_ms = (time.perf_counter() - start) * 1000
+            import_ms, modules = parse_import_time(process.stderr)
+            heavy = sorted(
+                name for name in modules
+                if any(name == heavy or name.startswith(heavy + '.') for heavy in HEAVY_MODULES)
+            )
+            results[command] = {
+                'wall_ms': wall_ms,
+                'import_ms': import_ms,
+                'budget_ms': budget,
+                'heavy_modules': heavy,
+                'within_budget': import_ms <= budget and not (command in INDEX_ONLY_COMMANDS and heavy),
+            }
+        return results
+    return run
+
+
+@benchmark
+def search(env):
+    """
+    Full text search from metadata mirror
+    """
+    indexdb = env.client.indexdb
+    indexdb.update(full=True, metadata=True)
+    queries = [
+        '{} {}'.format(track.values['artist'], track.values['name'].split()[0][:3])
+        for track in sample(env.library.library.tracks, SEARCH_QUERIES)
+    ]
+
+    def run():
+        start = time.perf_counter()
+        results = sum(len(indexdb.search(query)) for query in queries)
+        return {'results': results, 'queries_per_second': len(queries) / (time.perf_counter() - start)}
+    return run
+
+
+@benchmark
+def search_whose(env):
+    """
+    Find tracks with whose filters sent to music player, for comparison with search
+    """
+    library = env.client.library
+    artists = [track.values['artist'] for track in sample(env.library.library.tracks, SEARCH_QUERIES // 10)]
+
+    def run():
+        start = time.perf_counter()
+        results = sum(len(library.find(artist=artist)) for artist in artists)
+        return {'results': results, 'queries_per_second': len(artists) / (time.perf_counter() - start)}
+    return run
+
+
+def lookup_reader(db_path, paths, ready, stop, latencies, errors):
+    """
+    Reader process for concurrent_readers benchmark
+    """
+    from pytunes import MusicPlayerError
+    from pytunes.database import TrackIndexReader
+    indexdb = TrackIndexReader(db_path)
+    ready.put(True)
+    timings = []
+    failures = 0
+    index = 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            indexdb.lookup_index(paths[index % len(paths)])
+        except MusicPlayerError as e:
+            if 'locked' in str(e):
+                failures += 1
+        timings.append((time.perf_counter() - start) * 1000)
+        index += 1
+    latencies.put(timings)
+    errors.put(failures)
+
+
+@benchmark
+def concurrent_readers(env):
+    """
+    Lookup paths in reader processes while full index update is running
+    """
+    env.files
+    indexdb = env.client.indexdb
+    paths = sample(env.paths, LOOKUP_SAMPLE_SIZE)
+    context = multiprocessing.get_context('spawn')
+
+    def run():
+        ready = context.Queue()
+        stop = context.Event()
+        latencies = context.Queue()
+        errors = context.Queue()
+        readers = [
+            context.Process(target=lookup_reader, args=(indexdb.db_path, paths, ready, stop, latencies, errors))
+            for reader in range(READER_PROCESSES)
+        ]
+        for reader in readers:
+            reader.start()
+        for reader in readers:
+            ready.get()
+        indexdb.update(full=True)
+        stop.set()
+
+        timings = []
+        failures = 0
+        for reader in readers:
+            timings.extend(latencies.get())
+            failures += errors.get()
+        for reader in readers:
+            reader.join()
+
+        return {
+            'lookups': len(timings),
+            'locked_errors': failures,
+            'p50_ms': percentile(timings, 0.5),
+            'p99_ms': percentile(timings, 0.99),
+            'max_ms': max(timings) if timings else None,
+        }
+    return run
+
+
+@benchmark
+def server_latency(env):
+    """
+    Wall time of pytunes subcommands with in-process client and with warm client server
+    """
+    from pytunes.server import connect_server
+    path = os.path.join(env.workdir, 'pytunes.sock')
+    environment = dict(
+        os.environ,
+        PYTUNES_BRIDGE='synthetic:{:d}:{}'.format(env.size, env.latency),
+        PYTUNES_SERVER_SOCKET=path,
+    )
+
+    def measure(command, server):
+        timings = []
+        for run in range(SERVER_RUNS):
+            start = time.perf_counter()
+            subprocess.run(
+                [sys.executable, '-c', CLI_COMMAND] + list(command),
+                env=dict(environment, PYTUNES_SERVER=server and '1' or '0'),
+                stdout=subprocess.DEVNULL,
+                check=True,
+            )
+            timings.append((time.perf_counter() - start) * 1000)
+        return min(timings)
+
+    def start_server():
+        process = subprocess.Popen([sys.executable, '-c', SERVER_COMMAND, '--socket', path], env=environment)
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while time.monotonic() < deadline:
+            client = connect_server(path)
+            if client is not None:
+                # Server accepts connections before it has connected to music player
+                client.call('ping')
+                return process, client
+            if process.poll() is not None:
+                raise RuntimeError('Server exited with code {}'.format(process.returncode))
+            time.sleep(0.1)
+        process.terminate()
+        raise RuntimeError('Server did not start in {} seconds'.format(SERVER_START_TIMEOUT))
+
+    def run():
+        results = OrderedDict()
+        for command in SERVER_COMMANDS:
+            results[' '.join(command)] = {'in_process_ms': measure(command, False)}
+
+        process, client = start_server()
+        try:
+            timings = []
+            for run in range(SERVER_RPC_CALLS):
+                start = time.perf_counter()
+                client.status
+                timings.append((time.perf_counter() - start) * 1000)
+            client.close()
+            for command in SERVER_COMMANDS:
+                result = results[' '.join(command)]
+                result['server_ms'] = measure(command, True)
+                result['speedup'] = result['in_process_ms'] / result['server_ms']
+        finally:
+            process.terminate()
+            process.wait()
+
+        results['rpc'] = {
+            'p50_ms': percentile(timings, 0.5),
+            'p99_ms': percentile(timings, 0.99),
+        }
+        return results
+    return run
@@ -0,0 +1,127 @@
+"""
+Benchmark environment
+
+Synthetic library, on-disk music tree and music player client for one benchmark process.
+The process environment must select the synthetic bridge before pytunes is imported
+(see runner).
+"""
+
+import os
+import resource
+import sys
+import time
+
+from pytunes.bridge import BRIDGE, synthetic
+
+# Number of user playlists generated per 1000 library tracks
+PLAYLISTS_PER_1000_TRACKS = 5
+
+# Minimum and maximum number of generated user playlists
+MIN_PLAYLISTS = 10
+MAX_PLAYLISTS = 500
+
+
+def peak_rss_kb():
+    """
+    Return peak resident set size of this process in kilobytes
+    """
+    value = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        value = value // 1024
+    return value
+
+
+class BenchmarkEnvironment(object):
+    """
+    Benchmark environment
+
+    Generates synthetic library with size tracks in working directory. Track files are
+    created on disk on first access to files.
+    """
+    def __init__(self, workdir, size, latency=0.0, seed=0):
+        if BRIDGE != 'synthetic':
+            raise RuntimeError('Benchmarks must be run with synthetic bridge')
+
+        self.workdir = workdir
+        self.size = size
+        self.latency = latency
+        self.root = os.path.join(workdir, 'Music')
+        self.application = synthetic.configure(
+            tracks=size,
+            playlists=min(max(size * PLAYLISTS_PER_1000_TRACKS // 1000, MIN_PLAYLISTS), MAX_PLAYLISTS),
+            latency=latency,
+            seed=seed,
+            root=self.root,
+        )
+        self.__client__ = None
+        self.__files__ = None
+
+    @property
+    def library(self):
+        """
+        Synthetic library
+        """
+        return self.application.library
+
+    @property
+    def client(self):
+        """
+        pytunes client connected to synthetic application
+        """
+        if self.__client__ is None:
+            from pytunes.client import Client
+            self.__client__ = Client()
+        return self.__client__
+
+    @property
+    def paths(self):
+        """
+        Track file paths in library order
+        """
+        return [track.values['location'].path for track in self.library.library.tracks]
+
+    @property
+    def files(self):
+        """
+        Track file paths, created as empty files on first access
+        """
+        if self.__files__ is None:
+            directories = set()
+            paths = self.paths
+            for path in paths:
+                directory = os.path.dirname(path)
+                if directory not in directories:
+                    os.makedirs(directory, exist_ok=True)
+                    directories.add(directory)
+                open(path, 'w').close()
+            self.__files__ = paths
+        return self.__files__
+
+    def modify_tracks(self, count):
+        """
+        Modify count tracks spread over the library
+        """
+        tracks = self.library.library.tracks
+        step = max(len(tracks) // max(count, 1), 1)
+        for track in tracks[::step][:count]:
+            self.library.modify_track(track, comment='modified')
+
+    def measure(self, run):
+        """
+        Measure benchmark
+
+        Returns dictionary with wall time, Apple Event counts and peak RSS of run, and
+        metrics returned by run.
+        """
+        self.application.reset_counters()
+        start = time.perf_counter()
+        metrics = run()
+        wall_seconds = time.perf_counter() - start
+        counters = dict(self.application.counters)
+        return {
+            'wall_seconds': wall_seconds,
+            'events': counters.pop('events'),
+            'event_counts': counters,
+            'peak_rss_kb': peak_rss_kb(),
+            'metrics': metrics or {},
+        }
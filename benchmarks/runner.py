@@ -0,0 +1,159 @@
+"""
+Benchmark runner
+
+Runs each benchmark and library size in a separate process with the synthetic bridge and
+a temporary home directory, and collects results as JSON.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from datetime import datetime
+
+# Default library sizes in tracks
+DEFAULT_SIZES = (
+    1000,
+    10000,
+)
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='benchmarks', description='Run pytunes benchmarks')
+    parser.add_argument('-s', '--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+                        help='Comma separated library sizes in tracks')
+    parser.add_argument('-b', '--benchmarks', help='Comma separated benchmarks to run, default all')
+    parser.add_argument('-l', '--latency', type=float, default=0.0, help='Apple Event latency in seconds')
+    parser.add_argument('-o', '--output', help='Output JSON file, default stdout')
+    parser.add_argument('--list', action='store_true', help='List benchmarks')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'RESULTS'), help='Compare result files')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def run_worker(args):
+    """
+    Run one benchmark in this process and write result to args.result
+    """
+    from .cases import BENCHMARKS
+    from .environment import BenchmarkEnvironment
+
+    env = BenchmarkEnvironment(args.workdir, args.size, latency=args.latency)
+    result = env.measure(BENCHMARKS[args.worker](env))
+    with open(args.result, 'w') as fileobj:
+        json.dump(result, fileobj)
+
+
+def run_benchmark(name, size, latency):
+    """
+    Run benchmark in a new process
+
+    Returns result dictionary
+    """
+    workdir = tempfile.mkdtemp(prefix='pytunes-benchmark-')
+    result_path = os.path.join(workdir, 'result.json')
+    env = dict(os.environ, PYTUNES_BRIDGE='synthetic', HOME=workdir)
+    command = [
+        sys.executable, '-m', 'benchmarks',
+        '--worker', name,
+        '--size', str(size),
+        '--latency', str(latency),
+        '--workdir', workdir,
+        '--result', result_path,
+    ]
+    result = {'name': name, 'size': size, 'latency': latency}
+    try:
+        process = subprocess.run(command, cwd=REPOSITORY_ROOT, env=env, stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE, universal_newlines=True)
+        if process.returncode != 0:
+            lines = process.stderr.strip().splitlines()
+            result['error'] = lines[-1] if lines else 'exit code {}'.format(process.returncode)
+        else:
+            with open(result_path, 'r') as fileobj:
+                result.update(json.load(fileobj))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def compare(baseline_path, results_path):
+    """
+    Print wall time and event count changes between two result files
+    """
+    with open(baseline_path, 'r') as fileobj:
+        baseline = dict(((result['name'], result['size']), result) for result in json.load(fileobj)['results'])
+    with open(results_path, 'r') as fileobj:
+        results = json.load(fileobj)['results']
+
+    for result in results:
+        previous = baseline.get((result['name'], result['size']))
+        if previous is None or 'error' in result or 'error' in previous:
+            continue
+        print('{:28s} {:>8d} {:>10.3f}s {:>7.2f}x {:>10d} events ({:+d})'.format(
+            result['name'],
+            result['size'],
+            result['wall_seconds'],
+            result['wall_seconds'] / previous['wall_seconds'] if previous['wall_seconds'] else 0,
+            result['events'],
+            result['events'] - previous['events'],
+        ))
+
+
+def main():
+    args = parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    from .cases import BENCHMARKS
+    if args.list:
+        for name, function in BENCHMARKS.items():
+            print('{:28s} {}'.format(name, function.__doc__.strip().splitlines()[0]))
+        return
+
+    names = args.benchmarks.split(',') if args.benchmarks else list(BENCHMARKS.keys())
+    for name in names:
+        if name not in BENCHMARKS:
+            sys.exit('Unknown benchmark: {}'.format(name))
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    results = []
+    for size in sizes:
+        for name in names:
+            result = run_benchmark(name, size, args.latency)
+            if 'error' in result:
+                sys.stderr.write('{:28s} {:>8d} ERROR {}\n'.format(name, size, result['error']))
+            else:
+                sys.stderr.write('{:28s} {:>8d} {:>10.3f}s {:>10d} events {:>10d} KB\n'.format(
+                    name, size, result['wall_seconds'], result['events'], result['peak_rss_kb']
+                ))
+            results.append(result)
+
+    report = {
+        'created': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'latency': args.latency,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as fileobj:
+            json.dump(report, fileobj, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
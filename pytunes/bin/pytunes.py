@@ -3,12 +3,19 @@
 Example script to view and control macos music player playback status
 """
 
+import argparse
+import json
+import sys
 import time
 
 from systematic.shell import Script, ScriptCommand
 
 from pytunes import MusicPlayerError
+from pytunes.bridge.profiler import add_profile_events_argument
 from pytunes.client import Client
+from pytunes.database import DEFAULT_LOOKUP_BATCH_SIZE, DEFAULT_SEARCH_LIMIT
+from pytunes.server import connect_server
+from pytunes.tracing import add_profile_arguments, span
 
 INFO_FORMAT = """
 Artist  %(artist)s
@@ -22,18 +29,49 @@ BPM     %(bpm)s
 Comment %(comment)s
 """
 
+# Persistent ID column value for paths not found in lookup-index tab separated output
+NOT_FOUND_MARKER = '-'
+
+SEARCH_FORMAT = '%(persistent_ID)s %(artist)s - %(album)s - %(name)s'
+
+
+def positive_int(value):
+    """
+    Argument type for integers greater than zero
+    """
+    try:
+        value = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid integer value: {}'.format(value))
+    if value < 1:
+        raise argparse.ArgumentTypeError('value must be at least 1: {}'.format(value))
+    return value
+
 
 class CLICommand(ScriptCommand):
     """
     Base class for CLI commands
+
+    Music player client is created on first use by the command. Commands with use_server
+    set use the warm client server when it is running (see pytunes.server).
     """
+    use_server = True
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-
-        try:
-            self.client = Client()
-        except MusicPlayerError as e:
-            self.exit(1, 'Error connecting to music player: {}'.format(e))
+        self.__client__ = None
+
+    @property
+    def client(self):
+        if self.__client__ is None and self.use_server:
+            with span('connect server'):
+                self.__client__ = connect_server()
+        if self.__client__ is None:
+            try:
+                self.__client__ = Client()
+            except MusicPlayerError as e:
+                self.exit(1, 'Error connecting to music player: {}'.format(e))
+        return self.__client__
 
 
 class InfoCommand(CLICommand):
@@ -42,11 +80,15 @@ class InfoCommand(CLICommand):
     Show info about playing track
     """
     def run(self, args):
-        if self.client.current_track:
-            track = self.client.current_track
+        snapshot = self.client.snapshot()
+        if snapshot.track is not None:
+            track = dict(snapshot.track, title=snapshot.track.get('name'))
             if args.verbose:
-                self.message(track.path)
-            self.message(INFO_FORMAT % (track))
+                self.message(track.get('path'))
+            try:
+                self.message(INFO_FORMAT % (track))
+            except KeyError as e:
+                self.exit(1, 'Error formatting track info: {}'.format(e))
         else:
             self.message('No song playing')
 
@@ -59,7 +101,7 @@ class PlayCommand(CLICommand):
         if args.track:
             self.client.play(args.track)
         else:
-            if self.client.status == 'playing':
+            if self.client.snapshot(track=False).status == 'playing':
                 self.client.pause()
             else:
                 self.client.play()
@@ -149,10 +191,16 @@ class UpdateIndexCommand(CLICommand):
 
     Update music player track index database
     """
+    use_server = False
+
     def run(self, args):
         try:
             self.message('Update: {}'.format(self.client.indexdb))
-            self.client.indexdb.update()
+            processed, removed = self.client.indexdb.update(
+                full=args.full,
+                metadata=args.metadata or None,
+            )
+            self.message('Indexed {:d} tracks, removed {:d} tracks'.format(processed, removed))
         except MusicPlayerError as e:
             self.error('Error updating {}: {}'.format(self.client.indexdb, e))
 
@@ -160,21 +208,72 @@ class UpdateIndexCommand(CLICommand):
 class LookupDBCommand(CLICommand):
     """Lookup track index
 
-    Lookup track index by path from database
+    Lookup track persistent IDs by path from database. Paths are read from stdin if no
+    paths are given or path is -.
     """
-    def run(self, args):
+    # Index database is read in process, lookups do not need music player connection
+    use_server = False
+
+    def __read_paths__(self, args):
         for path in args.paths:
-            try:
-                index = self.client.indexdb.lookup_index(path)
-                if index:
-                    self.message('{:6} {}'.format(index, path))
-            except MusicPlayerError as e:
-                self.error('{}'.format(e))
+            if path != '-':
+                yield path
+                continue
+            for line in sys.stdin:
+                line = line.rstrip('\n')
+                if line:
+                    yield line
+
+    def __format_result__(self, args, path, persistent_id):
+        if args.format == 'jsonl':
+            return json.dumps({'path': path, 'persistent_id': persistent_id})
+        if args.format == 'tsv':
+            return '{}\t{}'.format(persistent_id if persistent_id is not None else NOT_FOUND_MARKER, path)
+        return '{} {}'.format(persistent_id, path)
+
+    def run(self, args):
+        if not args.paths:
+            args.paths = ['-']
+
+        # Results are flushed after each batch for consumers reading output while writing paths
+        try:
+            results = self.client.index_reader.lookup_indexes(self.__read_paths__(args), args.batch_size)
+            for count, (path, persistent_id) in enumerate(results, 1):
+                if persistent_id is None and args.format == 'text':
+                    self.error('Track not in index database: {}'.format(path))
+                else:
+                    sys.stdout.write('{}\n'.format(self.__format_result__(args, path, persistent_id)))
+                if count % args.batch_size == 0:
+                    sys.stdout.flush()
+        except MusicPlayerError as e:
+            self.exit(1, e)
+
+
+class SearchCommand(CLICommand):
+    """Search tracks
+
+    Full text search of tracks from track metadata mirrored to index database
+    """
+    use_server = False
+
+    def run(self, args):
+        fields = ('artist', 'album', 'name', 'location')
+        try:
+            tracks = self.client.index_reader.search(' '.join(args.words), fields=fields, limit=args.limit)
+        except MusicPlayerError as e:
+            self.exit(1, e)
+
+        for persistent_id, values in tracks:
+            self.message(SEARCH_FORMAT % dict(values, persistent_ID=persistent_id))
+            if args.verbose:
+                self.message('  {}'.format(values['location']))
 
 
 def main():
 
     script = Script()
+    add_profile_events_argument(script)
+    add_profile_arguments(script)
 
     c = script.add_subcommand(InfoCommand('info', 'Show playing track information'))
     c.add_argument('-v', '--verbose', action='store_true', help='Verbose messages')
@@ -194,8 +293,18 @@ def main():
     c.add_argument('volume',  nargs='?', help='Value to set')
 
     c = script.add_subcommand(UpdateIndexCommand('update-index', 'Update track index database'))
+    c.add_argument('-f', '--full', action='store_true', help='Check all library tracks')
+    c.add_argument('-m', '--metadata', action='store_true', help='Mirror track metadata and playlists')
 
     c = script.add_subcommand(LookupDBCommand('lookup-index', 'Lookup track index from database'))
-    c.add_argument('paths', nargs='*', help='Track paths to lookup')
+    c.add_argument('-F', '--format', choices=('text', 'tsv', 'jsonl'), default='text', help='Output format')
+    c.add_argument('-b', '--batch-size', type=positive_int, default=DEFAULT_LOOKUP_BATCH_SIZE, help='Paths per query')
+    c.add_argument('paths', nargs='*', help='Track paths to lookup, - or no paths to read from stdin')
+
+    c = script.add_subcommand(SearchCommand('search', 'Search tracks from track index database'))
+    c.add_argument('-v', '--verbose', action='store_true', help='Show track paths')
+    c.add_argument('-l', '--limit', type=int, default=DEFAULT_SEARCH_LIMIT, help='Maximum number of results')
+    c.add_argument('words', nargs='+', help='Words to search, matched as prefixes')
 
-    script.run()
+    with span('run'):
+        script.run()
@@ -2,46 +2,89 @@
 
 
 import os
+import re
 import fnmatch
 import shutil
 
-from operator import attrgetter
+from operator import itemgetter
 
 from systematic.shell import Script, ScriptCommand
-from oodi.metadata.playlist import m3uPlaylist, m3uPlaylistDirectory, PlaylistError
 
 from pytunes import MusicPlayerError
+from pytunes.bridge.profiler import add_profile_events_argument
 from pytunes.client import Client
+from pytunes.server import connect_server
+from pytunes.tracing import add_profile_arguments, span
 
 DEFAULT_DIRECTORY = os.path.expanduser('~/Music/Playlists')
 
+RE_FORMAT_FIELD = re.compile(r'%\(([^)]+)\)')
+
 
 class PlaylistProcessorCommand(ScriptCommand):
     def setup(self, args):
-        self.client = Client()
+        self.client = Client(offline='offline' in args and args.offline)
         self.playlists = []
 
+        smart = False
+        if 'smart_playlists' in args and args.smart_playlists:
+            smart = None
+        with span('load playlists'):
+            playlists = self.client.catalog.paths(smart=smart)
+
         if 'playlists' in args and args.playlists:
-            for playlist in self.client.playlists:
-                path = playlist.path
-                for match in args.playlists:
-                    if fnmatch.fnmatch(match, path):
-                        self.playlists.append(playlist)
-
-            if 'smart_playlists' in args and args.smart_playlists:
-                for playlist in self.client.smart_playlists:
-                    path = playlist.path
-                    for match in args.playlists:
-                        if fnmatch.fnmatch(match, path):
-                            self.playlists.append(playlist)
+            for match in args.playlists:
+                matches = [playlist for path, playlist in playlists if path == match]
+                if not matches:
+                    matches = [playlist for path, playlist in playlists if fnmatch.fnmatch(path, match)]
+                self.playlists.extend(matches)
         else:
-            self.playlists.extend(self.client.playlists)
-            if 'smart_playlists' in args and args.smart_playlists:
-                self.playlists.extend(self.client.smart_playlists)
+            self.playlists.extend(playlist for path, playlist in playlists)
+
+    def reload_server_catalog(self):
+        """Reload warm client server playlist catalog
+
+        Called after playlists are created or removed, if server is running
+        """
+        server = connect_server()
+        if server is not None:
+            try:
+                server.call('reload')
+            except MusicPlayerError as e:
+                self.error('Error reloading server playlists: {}'.format(e))
+            server.close()
+
+    def fetch_tracks(self, playlist, fields, format=None):
+        """Fetch playlist tracks
+
+        Fetch given fields and fields referred in format string for all playlist tracks
+        """
+        fields = list(fields)
+        if format:
+            fields.extend(field for field in RE_FORMAT_FIELD.findall(format) if field not in fields)
+        try:
+            with span('fetch tracks'):
+                return [track for persistent_id, track in playlist.fetch(fields)]
+        except ValueError as e:
+            self.exit(1, 'Error formatting tracks on {}: {}'.format(playlist, e))
+        except MusicPlayerError as e:
+            self.exit(1, e)
 
 
 class ListCommand(PlaylistProcessorCommand):
     def run(self, args):
+        # Playlist paths are listed from warm client server catalog when server is running
+        if not args.playlists and not args.offline:
+            server = connect_server()
+            if server is not None:
+                try:
+                    paths = server.playlists(smart=None if args.smart_playlists else False)
+                except MusicPlayerError as e:
+                    self.exit(1, e)
+                for path in paths:
+                    self.message(path)
+                return
+
         super(ListCommand, self).setup(args)
 
         if not args.playlists:
@@ -52,25 +95,25 @@ class ListCommand(PlaylistProcessorCommand):
             for playlist in self.playlists:
 
                 years = {}
-                for track in playlist:
+                for track in self.fetch_tracks(playlist, ('path', 'year', 'artist', 'album', 'name'), args.format):
                     if args.yearly:
-                        if track.year not in years:
-                            years[track.year] = []
+                        if track['year'] not in years:
+                            years[track['year']] = []
 
-                        years[track.year].append(track)
+                        years[track['year']].append(track)
 
                     elif args.format:
                         try:
                             self.message(args.format % track)
                         except KeyError as e:
-                            self.exit(1, 'Error formatting track {}: {}'.format(track.path, e))
+                            self.exit(1, 'Error formatting track {}: {}'.format(track['path'], e))
 
                     else:
-                        self.message(track)
+                        self.message('{} - {} - {}'.format(track['artist'], track['album'], track['name']))
 
                 if args.yearly:
                     for year in sorted(years.keys()):
-                        years[year].sort(key=attrgetter('artist'))
+                        years[year].sort(key=itemgetter('artist'))
 
                         first = True
                         for track in years[year]:
@@ -78,7 +121,7 @@ class ListCommand(PlaylistProcessorCommand):
                                 try:
                                     self.message(args.format % track)
                                 except KeyError as e:
-                                    self.exit(1, 'Error formatting track {}: {}'.format(track.path, e))
+                                    self.exit(1, 'Error formatting track {}: {}'.format(track['path'], e))
                             elif first:
                                 self.message('%(year)4s\t%(artist)s\t%(name)s' % track)
                                 first = False
@@ -104,37 +147,37 @@ class ExportFilesCommand(PlaylistProcessorCommand):
             tracks = []
             if args.yearly:
                 years = {}
-                for track in playlist:
-                    if track.year not in years:
-                        years[track.year] = []
-                    years[track.year].append(track)
+                for track in self.fetch_tracks(playlist, ('path', 'extension', 'year', 'artist', 'name')):
+                    if track['year'] not in years:
+                        years[track['year']] = []
+                    years[track['year']].append(track)
 
                 for year in sorted(years.keys()):
-                    years[year].sort(key=attrgetter('artist'))
+                    years[year].sort(key=itemgetter('artist'))
                     for track in years[year]:
-                        name = '{} - {}.{}'.format(track.artist, track.name, track.extension)
+                        name = '{} - {}.{}'.format(track['artist'], track['name'], track['extension'])
                         filename = os.path.join('{}'.format(year, name.replace(os.sep, '')))
                         tracks.append((filename, track))
 
             elif args.format:
                 index = 1
-                for track in playlist:
+                for track in self.fetch_tracks(playlist, ('path', 'extension'), args.format):
                     try:
                         name = '{}'.format(args.format % track)
                         filename = '{:03d} {}.{}'.format(
                             index,
                             os.path.join(path, name.replace(os.sep, '')),
-                            track.extension
+                            track['extension']
                         )
                         tracks.append((filename, track))
                     except KeyError as e:
-                        self.exit(1, 'Error formatting track {}: {}'.format(track.path, e))
+                        self.exit(1, 'Error formatting track {}: {}'.format(track['path'], e))
                     index += 1
 
             else:
                 index = 1
-                for track in playlist:
-                    filename = '{:03d} {}'.format(index, track.path)
+                for track in self.fetch_tracks(playlist, ('path',)):
+                    filename = '{:03d} {}'.format(index, track['path'])
                     tracks.append((filename, track))
 
             for filename, original in tracks:
@@ -152,13 +195,14 @@ class ExportFilesCommand(PlaylistProcessorCommand):
 
                 try:
                     self.message('Writing {}'.format(filename))
-                    shutil.copyfile(original.path, filename)
+                    shutil.copyfile(original['path'], filename)
                 except OSError as e:
                     self.exit(1, 'Error writing file {}: {}'.format(filename, e))
 
 
 class ExportCommand(PlaylistProcessorCommand):
     def run(self, args):
+        from oodi.metadata.playlist import m3uPlaylist, PlaylistError
         super(ExportCommand, self).setup(args)
 
         if not os.path.isdir(args.directory):
@@ -177,15 +221,16 @@ class ExportCommand(PlaylistProcessorCommand):
                 folder = None
 
             m3u = m3uPlaylist(playlist.name, folder=folder)
-            for track in playlist:
-                m3u.append(track.path)
+            for track in self.fetch_tracks(playlist, ('path',)):
+                m3u.append(track['path'])
 
             if args.ignore_empty and len(m3u) == 0:
                 self.script.log.debug('Ignore empty playlist: {}'.format(m3u))
                 continue
 
             try:
-                m3u.write()
+                with span('write playlist'):
+                    m3u.write()
             except PlaylistError as e:
                 self.script.log.info('Error writing playlist {}: {}'.format(m3u.path, e))
                 continue
@@ -195,6 +240,7 @@ class ExportCommand(PlaylistProcessorCommand):
 
 class ImportCommand(PlaylistProcessorCommand):
     def run(self, args):
+        from oodi.metadata.playlist import m3uPlaylistDirectory
         from pytunes.playlist import Playlist
         super(ImportCommand, self).setup(args)
 
@@ -217,6 +263,7 @@ class CreateCommand(PlaylistProcessorCommand):
 
         for name in args.names:
             self.client.create_playlist(name)
+        self.reload_server_catalog()
 
 
 class RemoveCommand(PlaylistProcessorCommand):
@@ -228,27 +275,33 @@ class RemoveCommand(PlaylistProcessorCommand):
                 self.client.delete_playlist(name)
             except MusicPlayerError as e:
                 self.error('Error removing playlist {}: {}'.format(name, e))
+        self.reload_server_catalog()
 
 
 def main():
     script = Script('pytunes-playlists', 'Import and export music player playlists')
+    add_profile_events_argument(script)
+    add_profile_arguments(script)
 
     c = script.add_subcommand(ListCommand('list', 'List playlists'))
     c.add_argument('-s', '--smart-playlists', action='store_true', help='Include smart playlists')
     c.add_argument('-y', '--yearly', action='store_true', help='Order listed tracks by year')
     c.add_argument('-f', '--format', help='List formatting string')
+    c.add_argument('-o', '--offline', action='store_true', help='Read playlists from track index database')
     c.add_argument('playlists', nargs='*', help='Playlists to process')
 
     c = script.add_subcommand(ExportFilesCommand('export-files', 'Export playlists as files'))
     c.add_argument('-s', '--smart-playlists', action='store_true', help='Include smart playlists')
     c.add_argument('-y', '--yearly', action='store_true', help='Order exported tracks by year')
     c.add_argument('-f', '--format', help='Filename formatting string')
+    c.add_argument('-o', '--offline', action='store_true', help='Read playlists from track index database')
     c.add_argument('playlists', nargs='*', help='Playlists to process')
 
     c = script.add_subcommand(ExportCommand('export', 'Export m3u playlists'))
     script.add_argument('-D', '--directory', default=DEFAULT_DIRECTORY, help='Playlist directory for m3u files')
     c.add_argument('-s', '--smart-playlists', action='store_true', help='Include smart playlists')
     c.add_argument('-E', '--ignore-empty', action='store_true', help='Ignore empty playlists')
+    c.add_argument('-o', '--offline', action='store_true', help='Read playlists from track index database')
     c.add_argument('playlists', nargs='*', help='Playlists to process')
 
     c = script.add_subcommand(ImportCommand('import', 'Import playlists'))
@@ -261,4 +314,5 @@ def main():
     c = script.add_subcommand(RemoveCommand('remove', 'Remove playlists'))
     c.add_argument('names', nargs='*', help='Names of playlists to create')
 
-    script.run()
+    with span('run'):
+        script.run()
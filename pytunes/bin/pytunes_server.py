@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+"""
+Warm client server for pytunes console scripts
+"""
+
+import signal
+import sys
+
+from systematic.shell import Script
+from pytunes import MusicPlayerError
+from pytunes.bridge.profiler import add_profile_events_argument
+from pytunes.server import ClientServer, DEFAULT_SOCKET_PATH
+from pytunes.tracing import add_profile_arguments, span
+
+
+def main():
+
+    script = Script()
+    add_profile_events_argument(script)
+    add_profile_arguments(script)
+    script.add_argument('-s', '--socket', help='Server socket path (default {})'.format(DEFAULT_SOCKET_PATH))
+    args = script.parse_args()
+
+    try:
+        with span('start'):
+            server = ClientServer(args.socket)
+            server.warm()
+    except MusicPlayerError as e:
+        script.exit(1, e)
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        with span('run'):
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -10,128 +10,136 @@ from systematic.shell import Script, normalized
 from oodi.library.track import Track
 
 from pytunes import MusicPlayerError
-from pytunes.client import Client, MusicTree
+from pytunes.bridge.profiler import add_profile_events_argument
+from pytunes.client import Client
+from pytunes.tracing import add_profile_arguments, span
+from pytunes.tree import MusicTree
 
-# How often we report something
+# Default number of library entries between progress messages
 PROGRESS_INTERVAL = 1000
 
 
 def main():
 
     script = Script(description='Update music player library metadata')
+    add_profile_events_argument(script)
+    add_profile_arguments(script)
     script.add_argument('-c', '--codec', help='Music library default codec')
     script.add_argument('-l', '--music-path', help='Music library path')
     script.add_argument('-p', '--position', type=int, help='Start from given position in library')
     script.add_argument('-m', '--metadata', action='store_true', help='Update metadata')
+    script.add_argument('-i', '--progress-interval', type=int, default=PROGRESS_INTERVAL,
+                        help='Library entries between progress messages')
     args = script.parse_args()
 
+    if args.progress_interval < 1:
+        script.exit(1, 'Invalid progress interval: {0}'.format(args.progress_interval))
+
     client = Client()
+    library = client.library
 
     script.log.info('Loading music player library playlist')
 
-    if args.position:
-        try:
-            client.library.jump(args.position)
-        except ValueError:
-            script.exit(1, 'Invalid position: {0} ({1:d} entries)'.format((
-                args.position,
-                len(client.library)
-            )))
+    if args.position and (args.position < 0 or args.position > len(library)):
+        script.exit(1, 'Invalid position: {0} ({1:d} entries)'.format(
+            args.position,
+            len(library)
+        ))
 
     try:
-        tree = MusicTree(tree_path=args.music_path)
-        tree.load()
-        tree_paths = tree.realpaths
+        with span('load tree'):
+            tree = MusicTree(tree_path=args.music_path)
+            tree.load()
+            tree_paths = tree.realpaths
     except Exception as e:
         script.exit(1, e)
 
+    script.log.info('Checking library files against music player database')
+
+    try:
+        with span('scan library'):
+            entries = library.fetch(('path', 'modification_date'), start=args.position)
+    except MusicPlayerError as e:
+        script.exit(1, e)
+
+    # Changes found in diff, applied to the library after comparing all entries
+    removed = []
+    updated = []
+    added = []
+
     processed = 0
-    progress_interval = PROGRESS_INTERVAL
     progress_start = time.time()
     start = time.time()
     app_files = {}
 
-    script.log.info('Checking library files against music player database')
-
-    for entry in client.library:
-        processed += 1
-        if processed % progress_interval == 0:
-            progress_time = float(time.time() - progress_start)
-            progress_rate = int(progress_interval / progress_time)
-            script.log.info('Index {0:d} ({1:d} entries per second)'.format(processed, progress_rate))
-            progress_start = time.time()
-
-        try:
-            if entry.path is None:
-                try:
-                    client.library.delete(entry)
-                except MusicPlayerError as e:
-                    print(e)
+    with span('diff', entries=len(entries)):
+        for persistent_id, entry in entries:
+            processed += 1
+            if processed % args.progress_interval == 0:
+                progress_time = float(time.time() - progress_start)
+                progress_rate = int(args.progress_interval / progress_time)
+                script.log.info('Index {0:d} ({1:d} entries per second)'.format(processed, progress_rate))
+                progress_start = time.time()
+
+            if entry['path'] is None:
+                removed.append((persistent_id, 'Removing invalid entry (no path defined)'))
                 continue
-        except TypeError as e:
-            print('Error processing entry {0}: {1}'.format(entry, e))
-            continue
-
-        try:
-            path = normalized(os.path.realpath(entry.path))
-        except AttributeError:
-            script.log.info('Removing invalid entry (no path defined)')
-            try:
-                client.library.delete(entry)
-            except MusicPlayerError as e:
-                print(e)
-            continue
-
-        if path not in tree_paths:
-            if not os.path.isfile(path):
-                script.log.info('Removing non-existing: "}0}"'.format(path))
-                try:
-                    client.library.delete(entry)
-                except MusicPlayerError as e:
-                    print(e)
-            else:
-                script.log.info('File outside tree: {0}'.format(path))
 
-        elif path not in app_files:
-            app_files[path] = entry
-            if args.metadata:
-                mtime = os.stat(path).st_mtime
-                if int(entry.modification_date.strftime('%s')) >= mtime:
-                    continue
+            path = normalized(os.path.realpath(entry['path']))
 
-                song = Track(entry.path)
-                if entry.syncTags(song):
-                    client.library.__next = entry.index
+            if path not in tree_paths:
+                if not os.path.isfile(path):
+                    removed.append((persistent_id, 'Removing non-existing: "{0}"'.format(path)))
+                else:
+                    script.log.info('File outside tree: {0}'.format(path))
 
-        else:
-            script.log.info('Removing duplicate: {0}'.format(entry.path))
-            try:
-                client.library.delete(entry)
-            except MusicPlayerError as e:
-                print(e)
+            elif path not in app_files:
+                app_files[path] = persistent_id
+                if args.metadata:
+                    mtime = os.stat(path).st_mtime
+                    if int(entry['modification_date'].strftime('%s')) < mtime:
+                        updated.append((persistent_id, entry['path']))
+
+            else:
+                removed.append((persistent_id, 'Removing duplicate: {0}'.format(entry['path'])))
+
+        if args.position is None:
+            script.log.info('Checking music player database against tree files')
+            added = [path for path in sorted(tree_paths.keys()) if path not in app_files]
 
     loadtime = float(time.time() - start)
     script.log.info('Checked {0:d} files in {1:4.2f} seconds'.format(processed, loadtime))
 
     start = time.time()
-    processed = 0
-
-    script.log.info('Checking music player database against tree files')
 
-    if args.position is None:
+    with span('apply', removed=len(removed), updated=len(updated), added=len(added)):
+        for persistent_id, message in removed:
+            script.log.info(message)
+            try:
+                library.delete(library.get_track(persistent_id))
+            except MusicPlayerError as e:
+                print(e)
 
-        for path in sorted(tree_paths.keys()):
+        for persistent_id, path in updated:
+            try:
+                library.get_track(persistent_id).syncTags(Track(path))
+            except MusicPlayerError as e:
+                print(e)
 
-            if path not in app_files:
-                script.log.info('Adding: {0}'.format(path))
-                try:
-                    client.library.add(path)
-                except ValueError as e:
-                    print(e)
+        for index, path in enumerate(added, 1):
+            script.log.info('Adding: {0}'.format(path))
+            try:
+                library.add(path)
+            except ValueError as e:
+                print(e)
 
-            processed += 1
-            if processed % 1000 == 0:
-                script.log.debug('Processed: {0:d} entries'.format(processed))
+            if index % args.progress_interval == 0:
+                script.log.debug('Processed: {0:d} entries'.format(index))
 
     loadtime = float(time.time() - start)
-    script.log.info('Checked {0:d} files in {1:2.2f} seconds'.format(processed, loadtime))
+    script.log.info('Removed {0:d}, updated {1:d} and added {2:d} files in {3:2.2f} seconds'.format(
+        len(removed),
+        len(updated),
+        len(added),
+        loadtime
+    ))
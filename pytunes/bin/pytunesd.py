@@ -5,7 +5,9 @@ Daemon process to log songs played by MacOS music player
 
 from systematic.shell import Script
 from pytunes import MusicPlayerError
+from pytunes.bridge.profiler import add_profile_events_argument
 from pytunes.daemon import Daemon, DaemonConfiguration, DEFAULT_CONFIGURATION_PATH
+from pytunes.tracing import add_profile_arguments, span
 
 DEFAULT_LOGFILE = '~/Library/Logs/pytunes.log'
 
@@ -13,6 +15,8 @@ DEFAULT_LOGFILE = '~/Library/Logs/pytunes.log'
 def main():
 
     script = Script()
+    add_profile_events_argument(script)
+    add_profile_arguments(script)
     script.add_argument('-f', '--log-file', default=DEFAULT_LOGFILE, help='Log file')
     script.add_argument('-c', '--configuration-file', default=DEFAULT_CONFIGURATION_PATH, help='Log file')
     script.add_argument('-h', '--redis-host', help='Redis host')
@@ -20,16 +24,18 @@ def main():
     args = script.parse_args()
 
     try:
-        configuration = DaemonConfiguration(
-            args.configuration_file,
-            args.log_file,
-            args.redis_host,
-            args.redis_auth,
-        )
+        with span('configure'):
+            configuration = DaemonConfiguration(
+                args.configuration_file,
+                args.log_file,
+                args.redis_host,
+                args.redis_auth,
+            )
     except Exception as e:
         script.exit(1, e)
 
     try:
-        Daemon(**configuration).run()
+        with span('run'):
+            Daemon(**configuration).run()
     except MusicPlayerError as e:
         script.exit(1, e)
@@ -0,0 +1,122 @@
+"""
+Apple Event bridge
+
+Music player is accessed through a bridge selected with PYTUNES_BRIDGE environment
+variable when pytunes is imported:
+
+appscript                         appscript connection to music player (default)
+record:<cassette>                 appscript connection, events are logged to cassette file
+synthetic[:<tracks>[:<latency>]]  in-memory synthetic library, latency in seconds per event
+replay:<cassette>[:<tracks>]      synthetic library with event latencies from cassette file
+
+Modules use k, its, CommandError and Alias from this module instead of appscript and
+mactypes, so the same code runs against all bridges. The names are resolved from the bridge
+backend on first access, so appscript is not imported until it is used.
+
+With any bridge, Apple Events can be profiled by call site with PYTUNES_PROFILE_EVENTS
+environment variable (see pytunes.bridge.profiler).
+"""
+
+import os
+
+from .. import MusicPlayerError
+
+BRIDGE_ENVIRONMENT_VARIABLE = 'PYTUNES_BRIDGE'
+DEFAULT_BRIDGE = 'appscript'
+
+BRIDGES = (
+    'appscript',
+    'record',
+    'synthetic',
+    'replay',
+)
+
+
+def parse_bridge(value):
+    """
+    Parse bridge specification
+
+    Returns tuple of bridge name and list of bridge arguments
+    """
+    if not value:
+        value = DEFAULT_BRIDGE
+    name, *args = value.split(':')
+    if name not in BRIDGES:
+        raise MusicPlayerError('Unknown {} bridge: {}'.format(BRIDGE_ENVIRONMENT_VARIABLE, name))
+    if name in ('record', 'replay') and not args:
+        raise MusicPlayerError('Bridge {} requires cassette file path'.format(name))
+    return name, args
+
+
+BRIDGE, BRIDGE_ARGS = parse_bridge(os.environ.get(BRIDGE_ENVIRONMENT_VARIABLE))
+
+# Names provided by the bridge backend module, imported on first access
+BACKEND_NAMES = (
+    'k',
+    'its',
+    'CommandError',
+    'Alias',
+    'Reference',
+    'application_installed',
+    'is_running',
+)
+
+
+def backend():
+    """
+    Return backend module of the bridge selected with PYTUNES_BRIDGE
+    """
+    if BRIDGE in ('appscript', 'record'):
+        from . import native
+        return native
+    from . import synthetic
+    return synthetic
+
+
+def __getattr__(name):
+    if name in BACKEND_NAMES:
+        value = getattr(backend(), name)
+        globals()[name] = value
+        return value
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+def connect(app_name, terms):
+    """
+    Connect to music player
+
+    Returns application object for the bridge selected with PYTUNES_BRIDGE. Application is
+    wrapped with recording application when events are recorded or profiled.
+    """
+    from .profiler import event_profiler
+    recorders = []
+    if BRIDGE == 'record':
+        from .cassette import Cassette
+        recorders.append(Cassette(BRIDGE_ARGS[0]))
+    profiler = event_profiler()
+    if profiler is not None:
+        recorders.append(profiler)
+
+    if BRIDGE == 'synthetic':
+        from .synthetic import configure
+        try:
+            tracks = int(BRIDGE_ARGS[0]) if len(BRIDGE_ARGS) > 0 else None
+            latency = float(BRIDGE_ARGS[1]) if len(BRIDGE_ARGS) > 1 else None
+        except ValueError:
+            raise MusicPlayerError('Invalid synthetic bridge arguments: {}'.format(':'.join(BRIDGE_ARGS)))
+        configure(tracks=tracks, latency=latency, reset=False)
+
+    if BRIDGE == 'replay':
+        from .cassette import read_latencies
+        from .synthetic import configure
+        try:
+            tracks = int(BRIDGE_ARGS[1]) if len(BRIDGE_ARGS) > 1 else None
+        except ValueError:
+            raise MusicPlayerError('Invalid replay bridge arguments: {}'.format(':'.join(BRIDGE_ARGS)))
+        configure(tracks=tracks, latencies=read_latencies(BRIDGE_ARGS[0]), reset=False)
+
+    application = backend().connect(app_name, terms)
+    if recorders:
+        from .recording import RecordingApplication
+        return RecordingApplication(application, recorders)
+    return application
@@ -0,0 +1,58 @@
+"""
+Event cassette files
+
+Cassette files contain one JSON object per recorded event:
+
+{"event": "get", "reference": "app(...).current_track.name", "property": "name", "seconds": 0.0021, "error": false}
+
+Latencies recorded to cassettes can be replayed with the synthetic bridge.
+"""
+
+import json
+
+
+class Cassette(object):
+    """
+    Cassette file for recorded events
+
+    Events are appended to the file
+    """
+    def __init__(self, path):
+        self.path = path
+        self.__file__ = open(path, 'a')
+
+    def __repr__(self):
+        return self.path
+
+    def record(self, event, reference, property, seconds, error=False):
+        self.__file__.write('{}\n'.format(json.dumps({
+            'event': event,
+            'reference': reference,
+            'property': property,
+            'seconds': seconds,
+            'error': error,
+        })))
+        self.__file__.flush()
+
+    def close(self):
+        self.__file__.close()
+
+
+def read_latencies(path):
+    """
+    Read event latencies from cassette
+
+    Returns dictionary of mean latency in seconds by event name. Key None contains mean
+    latency of all events.
+    """
+    totals = {}
+    with open(path, 'r') as fileobj:
+        for line in fileobj:
+            line = line.strip()
+            if not line:
+                continue
+            event = json.loads(line)
+            for key in (event['event'], None):
+                count, seconds = totals.get(key, (0, 0.0))
+                totals[key] = (count + 1, seconds + event['seconds'])
+    return dict((key, seconds / count) for key, (count, seconds) in totals.items())
@@ -0,0 +1,53 @@
+"""
+appscript bridge
+
+Apple Events sent to music player with appscript. appscript and mactypes are imported on
+first access to their names, so importing this module is cheap.
+"""
+
+import importlib
+import os
+
+# Module and name for names imported on first access
+APPSCRIPT_NAMES = {
+    'k': ('appscript', 'k'),
+    'its': ('appscript', 'its'),
+    'CommandError': ('appscript.reference', 'CommandError'),
+    'Reference': ('appscript.reference', 'Reference'),
+    'Alias': ('mactypes', 'Alias'),
+}
+
+
+def __getattr__(name):
+    if name in APPSCRIPT_NAMES:
+        module, attr = APPSCRIPT_NAMES[name]
+        value = getattr(importlib.import_module(module), attr)
+        globals()[name] = value
+        return value
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+def application_installed(binary):
+    """
+    Check if music player application binary exists
+    """
+    return os.path.isfile(binary)
+
+
+def is_running(binary):
+    """
+    Check if music player process exists for this user
+    """
+    from systematic.process import Processes
+    for process in Processes().filter(command=binary):
+        if process.userid == os.geteuid():
+            return True
+    return False
+
+
+def connect(app_name, terms):
+    """
+    Return appscript application for music player
+    """
+    from appscript import app
+    return app(app_name, terms=terms)
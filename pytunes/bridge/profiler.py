@@ -0,0 +1,257 @@
+"""
+Apple Event profiler
+
+Counts Apple Events sent to music player with latency histograms, grouped by calling
+pytunes function and by event and property name. Profiler is enabled with
+PYTUNES_PROFILE_EVENTS environment variable or --profile-events option of console scripts,
+and report of top call sites is printed to stderr at exit.
+
+PYTUNES_PROFILE_EVENTS value is number of rows in report tables, or any other value except
+0 for DEFAULT_REPORT_ROWS rows.
+"""
+
+import atexit
+import os
+import sys
+import threading
+
+PROFILER_ENVIRONMENT_VARIABLE = 'PYTUNES_PROFILE_EVENTS'
+PROFILE_EVENTS_ARGUMENT = '--profile-events'
+
+DEFAULT_REPORT_ROWS = 20
+
+# Upper limits of latency histogram buckets in seconds. Last bucket has slower events.
+LATENCY_BUCKETS = (
+    0.0001,
+    0.001,
+    0.01,
+    0.1,
+    1.0,
+)
+
+LATENCY_BUCKET_LABELS = (
+    '<0.1ms',
+    '<1ms',
+    '<10ms',
+    '<100ms',
+    '<1s',
+    '>=1s',
+)
+
+# Modules skipped when looking for calling function
+BRIDGE_MODULE = __name__.rpartition('.')[0]
+PACKAGE_NAME = BRIDGE_MODULE.partition('.')[0]
+
+__profiler__ = None
+
+
+def call_site(frame):
+    """
+    Return name of function sending event from frame
+
+    Returns qualified name of first pytunes function outside the bridge, or first function
+    outside the bridge if event was not sent from pytunes. Nested functions and generator
+    expressions are reported as the enclosing function.
+    """
+    caller = None
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module != BRIDGE_MODULE and not module.startswith(BRIDGE_MODULE + '.'):
+            if caller is None:
+                caller = frame
+            if module == PACKAGE_NAME or module.startswith(PACKAGE_NAME + '.'):
+                caller = frame
+                break
+        frame = frame.f_back
+    if caller is None:
+        return '<unknown>'
+
+    code = caller.f_code
+    name = getattr(code, 'co_qualname', None)
+    if name is None:
+        instance = caller.f_locals.get('self')
+        name = '{}.{}'.format(type(instance).__name__, code.co_name) if instance is not None else code.co_name
+    return name.split('.<locals>.')[0]
+
+
+class EventStatistics(object):
+    """
+    Event counts and latency histogram
+    """
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, seconds, error=False):
+        self.count += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        if error:
+            self.errors += 1
+        for index, limit in enumerate(LATENCY_BUCKETS):
+            if seconds < limit:
+                self.histogram[index] += 1
+                break
+        else:
+            self.histogram[-1] += 1
+
+    @property
+    def mean_seconds(self):
+        return self.seconds / self.count if self.count else 0.0
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'seconds': self.seconds,
+            'mean_seconds': self.mean_seconds,
+            'max_seconds': self.max_seconds,
+            'histogram': dict(zip(LATENCY_BUCKET_LABELS, self.histogram)),
+        }
+
+
+class EventProfiler(object):
+    """
+    Apple Event profiler
+
+    Event recorder for recording bridge (see pytunes.bridge.recording)
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Clear recorded events
+        """
+        self.total = EventStatistics()
+        self.call_sites = {}
+        self.properties = {}
+
+    def record(self, event, reference, property, seconds, error=False):
+        site = call_site(sys._getframe(1))
+        with self.lock:
+            self.total.add(seconds, error)
+            for statistics, key in ((self.call_sites, site), (self.properties, (event, property))):
+                if key not in statistics:
+                    statistics[key] = EventStatistics()
+                statistics[key].add(seconds, error)
+
+    def as_dict(self):
+        """
+        Return recorded events as dictionary
+        """
+        with self.lock:
+            return {
+                'total': self.total.as_dict(),
+                'call_sites': dict((site, value.as_dict()) for site, value in self.call_sites.items()),
+                'properties': [
+                    dict(value.as_dict(), event=event, property=property)
+                    for (event, property), value in self.properties.items()
+                ],
+            }
+
+    def __format_table__(self, title, statistics, rows):
+        lines = [
+            title,
+            '{:>8s} {:>10s} {:>9s} {:>9s} {:>6s}  {}'.format(
+                'events',
+                'seconds',
+                'mean ms',
+                'max ms',
+                'errors',
+                'name',
+            ),
+        ]
+        ordered = sorted(statistics.items(), key=lambda item: item[1].seconds, reverse=True)
+        for name, value in ordered[:rows]:
+            lines.append('{:8d} {:10.3f} {:9.3f} {:9.3f} {:6d}  {}'.format(
+                value.count,
+                value.seconds,
+                value.mean_seconds * 1000,
+                value.max_seconds * 1000,
+                value.errors,
+                name,
+            ))
+        return lines
+
+    def report(self, rows=DEFAULT_REPORT_ROWS):
+        """
+        Return report of top rows call sites and properties by total event time as string
+        """
+        with self.lock:
+            lines = [
+                'Apple Events: {:d} events in {:.3f} seconds, {:d} errors'.format(
+                    self.total.count,
+                    self.total.seconds,
+                    self.total.errors,
+                ),
+                '',
+                '  '.join(
+                    '{}: {:d}'.format(label, count)
+                    for label, count in zip(LATENCY_BUCKET_LABELS, self.total.histogram)
+                ),
+                '',
+            ]
+            lines.extend(self.__format_table__('Events by call site', self.call_sites, rows))
+            lines.append('')
+            lines.extend(self.__format_table__(
+                'Events by property',
+                dict(
+                    ('{} {}'.format(event, property or '-'), value)
+                    for (event, property), value in self.properties.items()
+                ),
+                rows,
+            ))
+        return '\n'.join(lines)
+
+
+def event_profiler():
+    """
+    Return enabled event profiler, or None
+
+    Profiler is enabled on first call when PYTUNES_PROFILE_EVENTS environment variable is set
+    """
+    value = os.environ.get(PROFILER_ENVIRONMENT_VARIABLE, '')
+    if __profiler__ is None and value not in ('', '0'):
+        enable(rows=int(value) if value.isdigit() and int(value) > 0 else DEFAULT_REPORT_ROWS)
+    return __profiler__
+
+
+def enable(rows=DEFAULT_REPORT_ROWS, stream=None):
+    """
+    Enable event profiler
+
+    Events are recorded from music player connections opened after this call. Report with
+    top rows is written to stream, by default stderr, at exit.
+    """
+    global __profiler__
+    if __profiler__ is None:
+        __profiler__ = EventProfiler()
+
+        def write_report():
+            output = stream if stream is not None else sys.stderr
+            output.write('{}\n'.format(__profiler__.report(rows)))
+            output.flush()
+        atexit.register(write_report)
+    return __profiler__
+
+
+def add_profile_events_argument(script, argv=None):
+    """
+    Add --profile-events option to console script
+
+    The option is handled before arguments are parsed and removed from argv, so profiling
+    is enabled before script subcommands are created and the option can be given anywhere
+    in command line.
+    """
+    if argv is None:
+        argv = sys.argv
+    script.add_argument(PROFILE_EVENTS_ARGUMENT, action='store_true', help='Print Apple Event profile at exit')
+    if PROFILE_EVENTS_ARGUMENT in argv[1:]:
+        while PROFILE_EVENTS_ARGUMENT in argv:
+            argv.remove(PROFILE_EVENTS_ARGUMENT)
+        enable()
@@ -0,0 +1,128 @@
+"""
+Recording bridge
+
+Wraps bridge application and references to pass every Apple Event sent to music player
+with timing to recorders, like cassette files (see pytunes.bridge.cassette) and event
+profiler (see pytunes.bridge.profiler).
+
+Recorders are objects with method record(event, reference, property, seconds, error).
+"""
+
+import time
+
+from . import CommandError, Reference
+
+# Reference methods which build new references without sending events
+REFERENCE_METHODS = (
+    'ID',
+    'AND',
+    'OR',
+    'NOT',
+    'beginswith',
+    'endswith',
+    'contains',
+    'isin',
+)
+
+
+def unwrap(value):
+    """
+    Return bridge objects for recording wrappers in value
+    """
+    if isinstance(value, RecordingReference):
+        return value.__reference__
+    if isinstance(value, list):
+        return [unwrap(item) for item in value]
+    if isinstance(value, tuple):
+        return tuple(unwrap(item) for item in value)
+    if isinstance(value, dict):
+        return dict((unwrap(key), unwrap(item)) for key, item in value.items())
+    return value
+
+
+class RecordingReference(object):
+    """
+    Recording reference
+
+    Attribute and item access return wrapped references. Calls are Apple Events and are
+    passed to recorders with timing, except for reference methods in REFERENCE_METHODS.
+
+    Events are recorded with the reference they target: first reference argument of
+    commands like get(reference), or the reference the command was accessed from.
+    Calling a reference is recorded as get event.
+    """
+    __slots__ = ('__reference__', '__recorders__', '__event__', '__property__', '__parent__')
+
+    def __init__(self, reference, recorders, name=None, property=None, parent=None):
+        object.__setattr__(self, '__reference__', reference)
+        object.__setattr__(self, '__recorders__', recorders)
+        object.__setattr__(self, '__event__', name)
+        object.__setattr__(self, '__property__', property)
+        object.__setattr__(self, '__parent__', parent)
+
+    def __repr__(self):
+        return repr(self.__reference__)
+
+    def __str__(self):
+        return str(self.__reference__)
+
+    def __eq__(self, other):
+        return self.__reference__ == unwrap(other)
+
+    def __hash__(self):
+        return hash(self.__reference__)
+
+    def __wrap__(self, value, property=None):
+        if isinstance(value, Reference):
+            return RecordingReference(value, self.__recorders__, property=property)
+        if isinstance(value, list):
+            return [self.__wrap__(item, property) for item in value]
+        return value
+
+    def __target__(self, args):
+        if args and isinstance(args[0], RecordingReference):
+            return args[0]
+        if not isinstance(self.__reference__, Reference) and self.__parent__ is not None:
+            return self.__parent__
+        return self
+
+    def __record__(self, event, target, seconds, error=False):
+        for recorder in self.__recorders__:
+            recorder.record(event, repr(target.__reference__), target.__property__, seconds, error)
+
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        value = getattr(self.__reference__, attr)
+        property = attr if isinstance(value, Reference) else self.__property__
+        return RecordingReference(value, self.__recorders__, attr, property, self)
+
+    def __getitem__(self, key):
+        return self.__wrap__(self.__reference__[unwrap(key)], self.__property__)
+
+    def __call__(self, *args, **kwargs):
+        if self.__event__ in REFERENCE_METHODS:
+            return self.__wrap__(self.__reference__(*unwrap(args), **unwrap(kwargs)), self.__property__)
+
+        target = self.__target__(args)
+        event = 'get' if isinstance(self.__reference__, Reference) else self.__event__
+        start = time.perf_counter()
+        try:
+            result = self.__reference__(*unwrap(args), **unwrap(kwargs))
+        except CommandError:
+            self.__record__(event, target, time.perf_counter() - start, True)
+            raise
+        self.__record__(event, target, time.perf_counter() - start)
+        return self.__wrap__(result)
+
+
+class RecordingApplication(RecordingReference):
+    """
+    Recording application
+
+    Application wrapper passing all events to recorders
+    """
+    __slots__ = ()
+
+    def __init__(self, application, recorders):
+        super().__init__(application, tuple(recorders))
@@ -0,0 +1,864 @@
+"""
+Synthetic bridge
+
+In-memory music player with a generated library, implementing the subset of music player
+scripting interface used by pytunes. Every get, set and command is counted as an event
+and delayed by configurable latency, so request patterns and round trip costs can be
+measured without macOS.
+
+Configure the library with configure() before creating Client, or with PYTUNES_BRIDGE
+environment variable (see pytunes.bridge).
+"""
+
+import operator
+import os
+import random
+import time
+
+from datetime import datetime, timedelta
+
+APP_NAME = 'Music'
+
+# Default number of tracks in synthetic library
+DEFAULT_TRACKS = 1000
+
+# Default number of user playlists in synthetic library
+DEFAULT_PLAYLISTS = 20
+
+# Default latency for each event in seconds
+DEFAULT_LATENCY = 0.0
+
+# Root directory for synthetic track paths
+DEFAULT_ROOT = '/Synthetic/Music'
+
+# Tracks per album and albums per artist in generated library
+ALBUM_TRACKS = 10
+ARTIST_ALBUMS = 3
+
+GENRES = (
+    'Ambient',
+    'Blues',
+    'Classical',
+    'Electronic',
+    'Folk',
+    'Jazz',
+    'Pop',
+    'Rock',
+)
+
+BOOLEAN_FIELDS = (
+    'bookmarkable',
+    'compilation',
+    'enabled',
+    'gapless',
+    'podcast',
+    'shufflable',
+    'unplayed',
+)
+
+KEYWORD_FIELDS = {
+    'album_rating_kind': 'computed',
+    'rating_kind': 'computed',
+    'video_kind': 'none',
+}
+
+
+class CommandError(Exception):
+    """
+    Synthetic event error
+    """
+    pass
+
+
+class Keyword(object):
+    """
+    Synthetic keyword
+    """
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return 'k.{}'.format(self.name)
+
+    def __eq__(self, other):
+        return isinstance(other, Keyword) and other.name == self.name
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((Keyword, self.name))
+
+
+class Keywords(object):
+    """
+    Keyword namespace, like appscript.k
+    """
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        return Keyword(attr)
+
+
+class Alias(object):
+    """
+    File alias, like mactypes.Alias
+    """
+    __slots__ = ('path',)
+
+    def __init__(self, path):
+        self.path = path
+
+    def __repr__(self):
+        return 'Alias({!r})'.format(self.path)
+
+    def __eq__(self, other):
+        return isinstance(other, Alias) and other.path == self.path
+
+    def __hash__(self):
+        return hash((Alias, self.path))
+
+
+k = Keywords()
+
+
+class Test(object):
+    """
+    Element filter test
+    """
+    def evaluate(self, element, context):
+        raise NotImplementedError
+
+    def AND(self, *tests):
+        return Conjunction(all, (self,) + tests)
+
+    def OR(self, *tests):
+        return Conjunction(any, (self,) + tests)
+
+    @property
+    def NOT(self):
+        return Negation(self)
+
+
+class Conjunction(Test):
+    def __init__(self, function, tests):
+        self.function = function
+        self.tests = tests
+
+    def evaluate(self, element, context):
+        return self.function(test.evaluate(element, context) for test in self.tests)
+
+
+class Negation(Test):
+    def __init__(self, test):
+        self.test = test
+
+    def evaluate(self, element, context):
+        return not self.test.evaluate(element, context)
+
+
+class Comparison(Test):
+    def __init__(self, field, function, value):
+        self.field = field
+        self.function = function
+        self.value = value
+
+    def evaluate(self, element, context):
+        # Fields of referenced objects are given as dotted path, like parent.persistent_ID
+        try:
+            value = element
+            for field in self.field.split('.'):
+                if not isinstance(value, (SyntheticTrack, SyntheticPlaylist)):
+                    return False
+                value = value.value(field, context)
+                context = None
+        except CommandError:
+            return False
+        if value is None or value == k.missing_value:
+            return False
+        try:
+            return self.function(value, self.value) and True or False
+        except TypeError:
+            return False
+
+
+class Field(object):
+    """
+    Element field in filter tests, like appscript.its.field
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        return Field('{}.{}'.format(self.name, attr))
+
+    def __eq__(self, value):
+        return Comparison(self.name, operator.eq, value)
+
+    def __ne__(self, value):
+        return Comparison(self.name, operator.ne, value)
+
+    def __gt__(self, value):
+        return Comparison(self.name, operator.gt, value)
+
+    def __ge__(self, value):
+        return Comparison(self.name, operator.ge, value)
+
+    def __lt__(self, value):
+        return Comparison(self.name, operator.lt, value)
+
+    def __le__(self, value):
+        return Comparison(self.name, operator.le, value)
+
+    __hash__ = None
+
+    def contains(self, value):
+        return Comparison(self.name, lambda a, b: str(b).lower() in str(a).lower(), value)
+
+    def beginswith(self, value):
+        return Comparison(self.name, lambda a, b: str(a).lower().startswith(str(b).lower()), value)
+
+    def endswith(self, value):
+        return Comparison(self.name, lambda a, b: str(a).lower().endswith(str(b).lower()), value)
+
+
+class Its(object):
+    """
+    Filter test builder, like appscript.its
+    """
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        return Field(attr)
+
+
+its = Its()
+
+
+class SyntheticTrack(object):
+    """
+    Track in synthetic library
+    """
+    def __init__(self, values):
+        self.values = values
+
+    def __repr__(self):
+        return 'track:{}'.format(self.values['persistent_ID'])
+
+    def value(self, field, context=None):
+        if field == 'index':
+            if context is None:
+                raise CommandError('Track index requires playlist')
+            return context.position(self)
+        if field == 'properties':
+            values = dict((Keyword(key), value) for key, value in self.values.items())
+            if context is not None:
+                values[Keyword('index')] = context.position(self)
+            return values
+        try:
+            return self.values[field]
+        except KeyError:
+            raise CommandError('Invalid track property: {}'.format(field))
+
+
+class SyntheticPlaylist(object):
+    """
+    Playlist in synthetic library
+    """
+    def __init__(self, playlist_id, persistent_id, name, tracks=None, smart=False, parent=None, folder=False):
+        self.values = {
+            'id': playlist_id,
+            'persistent_ID': persistent_id,
+            'name': name,
+            'smart': smart,
+            'special_kind': k.folder if folder else k.none,
+            'song_repeat': k.off,
+        }
+        self.parent = parent
+        self.tracks = tracks if tracks is not None else []
+        self.__positions__ = None
+
+    def __repr__(self):
+        return 'playlist:{}'.format(self.values['name'])
+
+    def position(self, track):
+        """
+        Return 1 based position of track on playlist
+        """
+        if self.__positions__ is None:
+            self.__positions__ = dict((id(item), index) for index, item in enumerate(self.tracks, 1))
+        try:
+            return self.__positions__[id(track)]
+        except KeyError:
+            raise CommandError('Track is not on playlist {}'.format(self))
+
+    def modified(self):
+        self.__positions__ = None
+
+    def value(self, field, context=None):
+        if field == 'parent':
+            if self.parent is None:
+                raise CommandError('Playlist {} has no parent'.format(self))
+            return self.parent
+        if field in ('file_tracks', 'tracks'):
+            return Elements(self.tracks, self)
+        if field == 'properties':
+            return dict((Keyword(key), value) for key, value in self.values.items())
+        if field in ('size', 'duration'):
+            return sum(track.values[field] for track in self.tracks)
+        try:
+            return self.values[field]
+        except KeyError:
+            raise CommandError('Invalid playlist property: {}'.format(field))
+
+
+class Elements(list):
+    """
+    List of elements with container playlist
+    """
+    def __init__(self, items, container=None):
+        super().__init__(items)
+        self.container = container
+
+
+class SyntheticLibrary(object):
+    """
+    Synthetic music library
+
+    Generates tracks in library playlist and user playlists containing slices of library
+    with random generator seeded with seed, so libraries are reproducible.
+    """
+    def __init__(self, tracks=DEFAULT_TRACKS, playlists=DEFAULT_PLAYLISTS, seed=0, root=DEFAULT_ROOT):
+        from ..constants import TRACK_FIELDS, TRACK_INT_FIELDS, TRACK_FLOAT_FIELDS, TRACK_DATE_FIELDS
+
+        self.root = root
+        self.__random__ = random.Random(seed)
+        self.__next_id__ = 1
+        self.__fields__ = (TRACK_FIELDS, TRACK_INT_FIELDS, TRACK_FLOAT_FIELDS, TRACK_DATE_FIELDS)
+        self.epoch = datetime(2020, 1, 1)
+
+        self.library = SyntheticPlaylist(self.__allocate_id__(), self.__persistent_id__(), 'Library')
+        for index in range(tracks):
+            self.library.tracks.append(self.create_track(index))
+
+        self.playlists = []
+        folder = None
+        for index in range(playlists):
+            if index % 5 == 0:
+                folder = SyntheticPlaylist(
+                    self.__allocate_id__(),
+                    self.__persistent_id__(),
+                    'Folder {:d}'.format(index // 5 + 1),
+                    folder=True,
+                )
+                self.playlists.append(folder)
+                continue
+            size = self.__random__.randint(0, min(tracks, 200))
+            start = self.__random__.randint(0, max(tracks - size, 0))
+            self.playlists.append(SyntheticPlaylist(
+                self.__allocate_id__(),
+                self.__persistent_id__(),
+                'Playlist {:d}'.format(index + 1),
+                tracks=self.library.tracks[start:start + size],
+                smart=index % 7 == 3,
+                parent=folder if index % 2 == 0 else None,
+            ))
+
+    def __allocate_id__(self):
+        value = self.__next_id__
+        self.__next_id__ += 1
+        return value
+
+    def __persistent_id__(self):
+        return '{:016X}'.format(self.__random__.getrandbits(64))
+
+    def path(self, values):
+        """
+        Return file path for track values
+        """
+        return os.path.join(
+            self.root,
+            values['album_artist'],
+            values['album'],
+            '{:02d} {}.m4a'.format(values['track_number'], values['name']),
+        )
+
+    def create_track(self, index, path=None):
+        """
+        Create track
+
+        Values for all track fields are generated from track index. Returns SyntheticTrack
+        """
+        track_fields, int_fields, float_fields, date_fields = self.__fields__
+        album = index // ALBUM_TRACKS
+        artist = album // ARTIST_ALBUMS
+
+        values = {}
+        for field in track_fields:
+            if field in int_fields:
+                values[field] = 0
+            elif field in float_fields:
+                values[field] = 0.0
+            elif field in date_fields:
+                values[field] = k.missing_value
+            elif field in BOOLEAN_FIELDS:
+                values[field] = False
+            elif field in KEYWORD_FIELDS:
+                values[field] = Keyword(KEYWORD_FIELDS[field])
+            else:
+                values[field] = ''
+
+        duration = float(self.__random__.randint(90, 600))
+        added = self.epoch + timedelta(minutes=index)
+        values.update({
+            'id': self.__allocate_id__(),
+            'persistent_ID': self.__persistent_id__(),
+            'database_ID': index + 1,
+            'name': 'Track {:d}'.format(index + 1),
+            'artist': 'Artist {:d}'.format(artist + 1),
+            'album_artist': 'Artist {:d}'.format(artist + 1),
+            'album': 'Album {:d}'.format(album + 1),
+            'composer': 'Composer {:d}'.format(artist % 50 + 1),
+            'genre': GENRES[artist % len(GENRES)],
+            'comment': '',
+            'year': 1960 + album % 60,
+            'track_number': index % ALBUM_TRACKS + 1,
+            'track_count': ALBUM_TRACKS,
+            'disc_number': 1,
+            'disc_count': 1,
+            'duration': duration,
+            'time': '{:d}:{:02d}'.format(int(duration) // 60, int(duration) % 60),
+            'bit_rate': 256,
+            'sample_rate': 44100,
+            'size': int(duration * 32000),
+            'kind': 'AAC audio file',
+            'enabled': True,
+            'shufflable': True,
+            'unplayed': True,
+            'date_added': added,
+            'modification_date': added,
+        })
+        values['location'] = Alias(path if path is not None else self.path(values))
+        return SyntheticTrack(values)
+
+    def modify_track(self, track, **values):
+        """
+        Modify track values and update track modification date
+        """
+        track.values.update(values)
+        track.values['modification_date'] = datetime.now().replace(microsecond=0)
+
+    def find_path(self, path):
+        """
+        Return library track with location path, or None
+        """
+        for track in self.library.tracks:
+            if track.values['location'].path == path:
+                return track
+        return None
+
+
+class Reference(object):
+    """
+    Synthetic reference
+
+    References are built with attribute and item access like appscript references, and
+    resolved only when events are sent.
+    """
+    __slots__ = ('__application__', '__steps__')
+
+    def __init__(self, application, steps=()):
+        object.__setattr__(self, '__application__', application)
+        object.__setattr__(self, '__steps__', steps)
+
+    def __repr__(self):
+        path = ['app({!r})'.format(APP_NAME)]
+        for step in self.__steps__:
+            if step[0] == 'property':
+                path.append('.{}'.format(step[1]))
+            elif step[0] == 'object':
+                path.append('.{!r}'.format(step[1]))
+            elif step[0] == 'range':
+                path.append('[{:d}:{:d}]'.format(step[1], step[2]))
+            elif step[0] == 'id':
+                path.append('.ID({!r})'.format(step[1]))
+            else:
+                path.append('[{!r}]'.format(step[1]))
+        return ''.join(path)
+
+    def __eq__(self, other):
+        return isinstance(other, Reference) and other.__steps__ == self.__steps__
+
+    def __hash__(self):
+        return hash(self.__steps__)
+
+    def __step__(self, *step):
+        return Reference(self.__application__, self.__steps__ + (step,))
+
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        return self.__step__('property', attr)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.__step__('range', key.start, key.stop)
+        if isinstance(key, Test):
+            return self.__step__('filter', key)
+        if isinstance(key, int):
+            return self.__step__('index', key)
+        return self.__step__('name', key)
+
+    def __call__(self):
+        return self.__application__.get(self)
+
+    def ID(self, value):
+        return self.__step__('id', value)
+
+    def get(self):
+        return self.__application__.get(self)
+
+    def set(self, to=None):
+        return self.__application__.set(self, to=to)
+
+
+class SyntheticApplication(object):
+    """
+    Synthetic music player application
+
+    Latency is delay in seconds for each event. Latencies can be given as dictionary by
+    event name, with key None for other events (see cassette.read_latencies).
+
+    Counters contain total number of events and number of events by event name.
+    """
+    def __init__(self, library=None, latency=DEFAULT_LATENCY, latencies=None, sleep=time.sleep):
+        self.library = library if library is not None else SyntheticLibrary()
+        self.latency = latency
+        self.latencies = latencies if latencies is not None else {}
+        self.sleep = sleep
+        self.counters = {'events': 0}
+
+        # Player state, stored separately from attributes which return references
+        self.state = {
+            'player_state': k.stopped,
+            'current_track': None,
+            'started': None,
+            'sound_volume': 50,
+            'shuffle_enabled': False,
+        }
+
+    def __repr__(self):
+        return 'app({!r})'.format(APP_NAME)
+
+    def __event__(self, name):
+        self.counters['events'] += 1
+        self.counters[name] = self.counters.get(name, 0) + 1
+        latency = self.latencies.get(name, self.latencies.get(None, self.latency))
+        if latency:
+            self.sleep(latency)
+
+    def reset_counters(self):
+        self.counters = {'events': 0}
+
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        return Reference(self, (('property', attr),))
+
+    def __application_value__(self, field):
+        if field == 'library_playlists':
+            return Elements([self.library.library])
+        if field in ('user_playlists', 'playlists'):
+            return Elements(self.library.playlists)
+        if field == 'current_track':
+            if self.state['current_track'] is None:
+                raise CommandError('No current track')
+            return self.state['current_track']
+        if field == 'current_playlist':
+            return self.library.library
+        if field == 'player_position':
+            if self.state['started'] is None:
+                return k.missing_value
+            return min(time.monotonic() - self.state['started'], self.state['current_track'].values['duration'])
+        if field == 'song_repeat':
+            return self.library.library.values['song_repeat']
+        if field == 'properties':
+            return dict(
+                (Keyword(name), self.__application_value__(name))
+                for name in ('player_state', 'player_position', 'sound_volume', 'shuffle_enabled', 'song_repeat')
+            )
+        if field in ('player_state', 'sound_volume', 'shuffle_enabled'):
+            return self.state[field]
+        raise CommandError('Invalid application property: {}'.format(field))
+
+    def __property__(self, value, field, context):
+        if isinstance(value, list):
+            container = value.container if isinstance(value, Elements) else None
+            return Elements(self.__property__(item, field, container) for item in value)
+        if isinstance(value, (SyntheticTrack, SyntheticPlaylist)):
+            return value.value(field, context)
+        raise CommandError('Invalid property {} for {!r}'.format(field, value))
+
+    def __element__(self, value, selector, key):
+        if not isinstance(value, list):
+            raise CommandError('Invalid element selector for {!r}'.format(value))
+        container = value.container if isinstance(value, Elements) else None
+
+        if selector == 'index':
+            if key == 0 or abs(key) > len(value):
+                raise CommandError('Invalid index: {}'.format(key))
+            return value[key - 1 if key > 0 else key]
+        if selector == 'range':
+            start, end = key
+            if start is None:
+                start = 1
+            if end is None:
+                end = len(value)
+            if start < 1 or end > len(value) or start > end:
+                raise CommandError('Invalid range: {}:{}'.format(start, end))
+            return Elements(value[start - 1:end], container)
+        if selector == 'filter':
+            return Elements((item for item in value if key.evaluate(item, container)), container)
+
+        for item in value:
+            if selector == 'name' and str(item.values.get('name')).lower() == str(key).lower():
+                return item
+            if selector == 'id' and item.values.get('id') == key:
+                return item
+        raise CommandError('No such element: {}'.format(key))
+
+    def resolve(self, reference):
+        """
+        Resolve reference
+
+        Returns tuple of resolved value and container playlist for resolved tracks
+        """
+        value = self
+        context = None
+        for step in reference.__steps__:
+            selector = step[0]
+            if selector == 'object':
+                value, context = step[1], step[2]
+            elif selector == 'property':
+                if step[1] == 'first':
+                    value = self.__element__(value, 'index', 1)
+                elif value is self:
+                    value = self.__application_value__(step[1])
+                    if isinstance(value, Elements):
+                        context = None
+                else:
+                    value = self.__property__(value, step[1], context)
+                if isinstance(value, Elements):
+                    context = value.container
+                elif isinstance(value, SyntheticPlaylist):
+                    context = None
+            elif selector == 'range':
+                value = self.__element__(value, 'range', (step[1], step[2]))
+            else:
+                if value is self:
+                    raise CommandError('Invalid application element')
+                value = self.__element__(value, selector, step[1])
+        return value, context
+
+    def __result__(self, value, context):
+        if isinstance(value, list):
+            return [self.__result__(item, context) for item in value]
+        if isinstance(value, SyntheticTrack):
+            return Reference(self, (('object', value, context),))
+        if isinstance(value, SyntheticPlaylist):
+            return Reference(self, (('object', value, None),))
+        return value
+
+    def __target__(self, reference):
+        value, context = self.resolve(reference)
+        if isinstance(value, list):
+            if not value:
+                raise CommandError('No elements: {!r}'.format(reference))
+            value = value[0]
+        return value, context
+
+    def get(self, reference=None):
+        self.__event__('get')
+        if reference is None:
+            raise CommandError('Missing reference')
+        return self.__result__(*self.resolve(reference))
+
+    def set(self, reference, to=None):
+        self.__event__('set')
+        steps = reference.__steps__
+        if not steps or steps[-1][0] != 'property':
+            raise CommandError('Can not set {!r}'.format(reference))
+        field = steps[-1][1]
+
+        if len(steps) == 1:
+            if field in ('sound_volume', 'shuffle_enabled'):
+                self.state[field] = to
+                return
+            raise CommandError('Can not set {!r}'.format(reference))
+
+        target, context = self.__target__(Reference(self, steps[:-1]))
+        if isinstance(target, SyntheticTrack):
+            if field not in target.values or field in ('id', 'persistent_ID', 'database_ID', 'location'):
+                raise CommandError('Can not set track {}'.format(field))
+            self.library.modify_track(target, **{field: to})
+        elif isinstance(target, SyntheticPlaylist):
+            if field not in ('name', 'song_repeat'):
+                raise CommandError('Can not set playlist {}'.format(field))
+            target.values[field] = to
+        else:
+            raise CommandError('Can not set {!r}'.format(reference))
+
+    def play(self, reference=None):
+        self.__event__('play')
+        if isinstance(reference, Alias):
+            track = self.library.find_path(reference.path)
+            if track is None:
+                track = self.library.create_track(len(self.library.library.tracks), reference.path)
+                self.library.library.tracks.append(track)
+                self.library.library.modified()
+        elif reference is not None:
+            track, context = self.__target__(reference)
+            if not isinstance(track, SyntheticTrack):
+                raise CommandError('Can not play {!r}'.format(reference))
+        elif self.state['current_track'] is not None:
+            track = self.state['current_track']
+        elif self.library.library.tracks:
+            track = self.library.library.tracks[0]
+        else:
+            raise CommandError('Library is empty')
+
+        self.state.update(current_track=track, player_state=k.playing, started=time.monotonic())
+
+    def stop(self):
+        self.__event__('stop')
+        self.state.update(current_track=None, player_state=k.stopped, started=None)
+
+    def pause(self):
+        self.__event__('pause')
+        if self.state['player_state'] == k.playing:
+            self.state['player_state'] = k.paused
+
+    def playpause(self):
+        self.__event__('playpause')
+        if self.state['player_state'] == k.playing:
+            self.state['player_state'] = k.paused
+        elif self.state['current_track'] is not None:
+            self.state['player_state'] = k.playing
+
+    def __skip__(self, offset):
+        tracks = self.library.library.tracks
+        if self.state['current_track'] is None or not tracks:
+            return
+        index = self.library.library.position(self.state['current_track']) - 1 + offset
+        self.state.update(current_track=tracks[index % len(tracks)], started=time.monotonic())
+
+    def next_track(self):
+        self.__event__('next_track')
+        self.__skip__(1)
+
+    def previous_track(self):
+        self.__event__('previous_track')
+        self.__skip__(-1)
+
+    def refresh(self, reference):
+        self.__event__('refresh')
+        self.__target__(reference)
+
+    def delete(self, reference):
+        """
+        Delete track or playlist
+
+        Tracks are removed from library and all playlists.
+        """
+        self.__event__('delete')
+        target, context = self.__target__(reference)
+        if isinstance(target, SyntheticPlaylist):
+            if target not in self.library.playlists:
+                raise CommandError('Can not delete {!r}'.format(reference))
+            self.library.playlists.remove(target)
+            for playlist in self.library.playlists:
+                if playlist.parent is target:
+                    playlist.parent = None
+            return
+        for playlist in [self.library.library] + self.library.playlists:
+            if target in playlist.tracks:
+                playlist.tracks.remove(target)
+                playlist.modified()
+        if self.state['current_track'] is target:
+            self.state.update(current_track=None, player_state=k.stopped, started=None)
+
+    def add(self, aliases, to=None):
+        self.__event__('add')
+        playlist, context = self.__target__(to)
+        if not isinstance(playlist, SyntheticPlaylist):
+            raise CommandError('Can not add tracks to {!r}'.format(to))
+        for alias in aliases:
+            track = self.library.find_path(alias.path)
+            if track is None:
+                track = self.library.create_track(len(self.library.library.tracks), alias.path)
+                self.library.library.tracks.append(track)
+                self.library.library.modified()
+            if playlist is not self.library.library:
+                playlist.tracks.append(track)
+                playlist.modified()
+
+    def make(self, new=None, at=None, with_properties=None):
+        self.__event__('make')
+        if new != k.user_playlist:
+            raise CommandError('Can not make {}'.format(new))
+        properties = dict((getattr(key, 'name', key), value) for key, value in (with_properties or {}).items())
+        self.library.playlists.append(SyntheticPlaylist(
+            self.library.__allocate_id__(),
+            self.library.__persistent_id__(),
+            properties.get('name', 'untitled playlist'),
+        ))
+
+
+__application__ = None
+
+
+def configure(tracks=None, playlists=None, latency=None, latencies=None, seed=0, root=DEFAULT_ROOT, reset=True):
+    """
+    Configure synthetic music player
+
+    Creates synthetic application returned by connect(). If reset is False and application
+    already exists, only given latencies are updated. Returns SyntheticApplication.
+    """
+    global __application__
+    if __application__ is None or reset:
+        library = SyntheticLibrary(
+            tracks=tracks if tracks is not None else DEFAULT_TRACKS,
+            playlists=playlists if playlists is not None else DEFAULT_PLAYLISTS,
+            seed=seed,
+            root=root,
+        )
+        __application__ = SyntheticApplication(library)
+    if latency is not None:
+        __application__.latency = latency
+    if latencies is not None:
+        __application__.latencies = latencies
+    return __application__
+
+
+def application_installed(binary):
+    """
+    Synthetic application is installed as Music
+    """
+    return os.path.basename(binary) == APP_NAME
+
+
+def is_running(binary):
+    return True
+
+
+def connect(app_name, terms):
+    """
+    Return synthetic application
+    """
+    if __application__ is None:
+        configure()
+    return __application__
@@ -2,24 +2,21 @@
 Simple abstraction to MacOS music library from python with appscript
 """
 
-import appscript
-import mactypes
 import os
 
-from systematic.process import Processes
-
-from oodi.library.tree import Tree
+from collections import namedtuple
+from types import MappingProxyType
 
 from . import MusicPlayerError
-from . import terminology
-from .constants import (
-    REPEAT_VALUES,
-    PLAYER_STATE_NAMES,
-    SKIPPED_PLAYLISTS
-)
-from .database import TrackIndexDB
-from .playlist import Playlist
-from .track import Track
+from . import bridge
+from . import constants
+from .bridge import application_installed, connect, is_running
+from .database import TrackIndexDB, TrackIndexReader
+from .offline import OfflinePlaylist, OfflinePlaylistCatalog
+from .pathindex import PathIndex, path_index_file
+from .playlist import Playlist, PlaylistCatalog
+from .track import Track, track_record_values
+from .tracing import span
 
 
 APPS = {
@@ -45,32 +42,35 @@ def detect_app():
     Detect application (iTunes or Music)
     """
     for app, config in APPS.items():
-        if os.path.isfile(config['binary']):
+        if application_installed(config['binary']):
             return app, config
     raise MusicPlayerError('Error detecting music player application')
 
 
-class MusicTree(Tree):
-    """
-    MacOS music tree, representing one folder on disk configured as music player library path
-    """
-    def __init__(self, tree_path=None):
-        app, config = detect_app()
+def __getattr__(name):
+    # MusicTree requires oodi and is imported from pytunes.tree on first use
+    if name == 'MusicTree':
+        from .tree import MusicTree
+        return MusicTree
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
 
-        if tree_path is None:
-            tree_path_file = os.path.join(config['data_directory'], config['library_path_filename'])
-            if os.path.isfile(tree_path_file):
-                try:
-                    tree_path = open(tree_path_file, 'r').read().strip()
-                except IOError as e:
-                    raise MusicPlayerError('Error opening {}: {}'.format(tree_path, e))
-                except OSError as e:
-                    raise MusicPlayerError('Error opening {}: {}'.format(tree_path, e))
 
-            else:
-                tree_path = config['music_directory']
+class PlayerSnapshot(namedtuple('PlayerSnapshot', (
+        'status',
+        'position',
+        'persistent_ID',
+        'duration',
+        'volume',
+        'shuffle',
+        'repeat',
+        'track'))):
+    """
+    Music player state snapshot
 
-        Tree.__init__(self, path=tree_path)
+    Immutable snapshot of music player state returned by Client.snapshot(). Track contains
+    read-only current track properties by field name, or None if track was not read.
+    """
+    __slots__ = ()
 
 
 class Client(object):
@@ -79,20 +79,26 @@ class Client(object):
     Singleton access to music player appscript API.
 
     Raises MusicPlayerError if music player was not running when initialized.
+
+    In offline mode the music player is not used: library, playlists and tracks
+    are read from metadata mirrored to track index database.
     """
     __instance__ = None
 
-    def __init__(self):
+    def __init__(self, offline=False):
+        self.offline = offline
         self.__app_name__ = None
         self.__binary__ = None
         self.__index_database__ = None
+        self.__catalog__ = None
+        self.__indexdb__ = None
+        self.__index_reader__ = None
         self.__detect_application__()
 
-        if Client.__instance__ is None:
-            Client.__instance__ = Client.Instance(self.__app_name__, self.__binary__)
-
-        self.__dict__['_Client__instance__'] = Client.__instance__
-        self.indexdb = TrackIndexDB(self, self.__index_database__)
+        if not offline:
+            if Client.__instance__ is None:
+                Client.__instance__ = Client.Instance(self.__app_name__, self.__binary__)
+            self.__dict__['_Client__instance__'] = Client.__instance__
 
     def __detect_application__(self):
         """
@@ -103,15 +109,54 @@ class Client(object):
         self.__binary__ = config['binary']
         self.__index_database__ = os.path.join(config['data_directory'], config['index_database'])
 
+    @property
+    def indexdb(self):
+        """Track index database
+
+        Opened on first access
+        """
+        if self.__indexdb__ is None:
+            self.__indexdb__ = TrackIndexDB(self, self.__index_database__)
+        return self.__indexdb__
+
+    @property
+    def index_reader(self):
+        """Track index database reader
+
+        Read-only connection for lookups and reads from the mirror tables, opened on first
+        access. Index database is used if it is already open.
+        """
+        if self.__indexdb__ is not None:
+            return self.__indexdb__
+        if self.__index_reader__ is None:
+            self.__index_reader__ = TrackIndexReader(self.__index_database__)
+        return self.__index_reader__
+
+    def lookup_path_index(self, path):
+        """Lookup track from path index file
+
+        Returns track persistent ID from memory mapped path index written by track index
+        database updates, or None if path or path index file was not found.
+        """
+        try:
+            with PathIndex(path_index_file(self.__index_database__)) as index:
+                return index.lookup(path)
+        except (OSError, ValueError):
+            return None
+
     @property
     def application(self):
         """MacOS music player appscript Instance
 
         Returns instance of appscript client
         """
+        if self.offline:
+            raise MusicPlayerError('Music player is not available in offline mode')
         return self.__instance__.application
 
     def __getattr__(self, attr):
+        if self.__dict__.get('offline'):
+            raise MusicPlayerError('Music player is not available in offline mode: {}'.format(attr))
         try:
             return getattr(self.__instance__, attr)
         except AttributeError as e:
@@ -130,7 +175,9 @@ class Client(object):
 
         def __connect__(self):
             if self.is_running:
-                self.application = appscript.app(self.__app_name__, terms=terminology)
+                from . import terminology
+                with span('connect'):
+                    self.application = connect(self.__app_name__, terminology)
             else:
                 self.application = None
                 raise MusicPlayerError('{} is not running'.format(self.__app_name__))
@@ -156,10 +203,21 @@ class Client(object):
 
             Check if music player process exists for this user
             """
-            for process in Processes().filter(command=self.__binary__):
-                if process.userid == os.geteuid():
-                    return True
-            return False
+            return is_running(self.__binary__)
+
+    @staticmethod
+    def __state_name__(state):
+        try:
+            return constants.PLAYER_STATE_NAMES[state]
+        except KeyError:
+            return 'Unknown ({})'.format(state)
+
+    @staticmethod
+    def __repeat_name__(value):
+        for key in constants.REPEAT_VALUES:
+            if value == constants.REPEAT_VALUES[key]:
+                return key
+        return None
 
     @property
     def status(self):
@@ -169,11 +227,48 @@ class Client(object):
         """
         if self.application is None:
             self.__connect__()
-        s = self.application.player_state.get()
+        return self.__state_name__(self.application.player_state.get())
+
+    def snapshot(self, track=True):
+        """Music player state snapshot
+
+        Read player state, position, volume, shuffle and repeat modes with one request for
+        application properties. If track is True, current track properties are read with
+        one more request.
+
+        Returns PlayerSnapshot
+        """
+        if self.application is None:
+            self.__connect__()
         try:
-            return PLAYER_STATE_NAMES[s]
-        except KeyError:
-            return 'Unknown ({}'.format(s)
+            values = dict(
+                (getattr(key, 'name', key), value)
+                for key, value in self.application.properties.get().items()
+            )
+        except bridge.CommandError as e:
+            raise MusicPlayerError('Error reading player state: {}'.format(e))
+
+        track_values = None
+        if track:
+            try:
+                track_values = MappingProxyType(track_record_values(self.application.current_track.properties.get()))
+            except bridge.CommandError:
+                track_values = None
+
+        position = values.get('player_position')
+        if position == bridge.k.missing_value:
+            position = None
+
+        return PlayerSnapshot(
+            status=self.__state_name__(values.get('player_state')),
+            position=position,
+            persistent_ID=track_values is not None and track_values.get('persistent_ID') or None,
+            duration=track_values is not None and track_values.get('duration') or None,
+            volume=values.get('sound_volume'),
+            shuffle=values.get('shuffle_enabled'),
+            repeat=self.__repeat_name__(values.get('song_repeat')),
+            track=track_values,
+        )
 
     @property
     def current_track(self):
@@ -186,22 +281,24 @@ class Client(object):
         try:
             return Track(self, self.application.current_track())
 
-        except appscript.reference.CommandError:
+        except bridge.CommandError:
             return None
 
     @property
     def repeat(self):
         """Get repeat
 
+        Returns repeat value from pytunes.constants.REPEAT_VALUES. PlayerSnapshot returns the
+        repeat mode name instead.
         """
         if self.application is None:
             self.__connect__()
         try:
             value = self.application.current_playlist.song_repeat.get()
-            for key in REPEAT_VALUES:
-                if value == REPEAT_VALUES[key]:
-                    return REPEAT_VALUES[key]
-        except appscript.reference.CommandError:
+            for key in constants.REPEAT_VALUES:
+                if value == constants.REPEAT_VALUES[key]:
+                    return constants.REPEAT_VALUES[key]
+        except bridge.CommandError:
             return None
 
     @repeat.setter
@@ -213,7 +310,7 @@ class Client(object):
         if self.application is None:
             self.__connect__()
         try:
-            self.application.current_playlist.song_repeat.set(to=REPEAT_VALUES[value])
+            self.application.current_playlist.song_repeat.set(to=constants.REPEAT_VALUES[value])
         except KeyError:
             raise MusicPlayerError('Invalid repeat value {}'.format(value))
 
@@ -226,7 +323,7 @@ class Client(object):
             self.__connect__()
         try:
             return self.application.shuffle_enabled.get()
-        except appscript.reference.CommandError:
+        except bridge.CommandError:
             return None
 
     @shuffle.setter
@@ -263,12 +360,27 @@ class Client(object):
             raise MusicPlayerError('Volume adjustment must be in range 0-100')
         self.application.sound_volume.set(to=value)
 
+    @property
+    def catalog(self):
+        """Playlist catalog
+
+        Return PlaylistCatalog for user playlists, loaded on first access
+        """
+        if self.__catalog__ is None:
+            if self.offline:
+                self.__catalog__ = OfflinePlaylistCatalog(self)
+            else:
+                self.__catalog__ = PlaylistCatalog(self)
+        return self.__catalog__
+
     @property
     def library(self):
         """Music player library
 
         Return configured music player library
         """
+        if self.offline:
+            return OfflinePlaylist(self)
         return Playlist(self)
 
     @property
@@ -276,14 +388,7 @@ class Client(object):
         """Return user smart playlists
 
         """
-        playlists = []
-        if self.application is None:
-            self.__connect__()
-        for pl in self.application.user_playlists.get():
-            name = pl.name.get()
-            if name not in SKIPPED_PLAYLISTS and pl.smart.get():
-                playlists.append(Playlist(self, name))
-        return playlists
+        return [playlist for path, playlist in self.catalog.paths(smart=True)]
 
     @property
     def playlists(self):
@@ -291,15 +396,7 @@ class Client(object):
 
         Skips smart playlists and playlists in pytunes.constants.SKIPPED_PLAYLISTS
         """
-        playlists = []
-        if self.application is None:
-            self.__connect__()
-        for pl in self.application.user_playlists.get():
-            name = pl.name.get()
-            if name in SKIPPED_PLAYLISTS or pl.smart.get():
-                continue
-            playlists.append(Playlist(self, name))
-        return playlists
+        return [playlist for path, playlist in self.catalog.paths(smart=False)]
 
     def create_playlist(self, name):
         """Create playlist
@@ -309,10 +406,11 @@ class Client(object):
         if self.application is None:
             self.__connect__()
         self.application.make(
-            new=appscript.k.user_playlist,
+            new=bridge.k.user_playlist,
             at='Playlists',
-            with_properties={appscript.k.name: name},
+            with_properties={bridge.k.name: name},
         )
+        self.catalog.reload()
         return Playlist(self, name)
 
     def delete_playlist(self, name):
@@ -320,22 +418,22 @@ class Client(object):
 
         Note: if there are multiple lists with same name, ALL are removed.
         """
-        if self.application is None:
-            self.__connect__()
-        for pl in self.application.user_playlists.get():
-            if pl.name.get() == name:
-                pl.delete()
+        entries = self.catalog.find(name)
+        if not entries:
+            return
+        try:
+            for entry in entries:
+                self.delete(self.user_playlists.ID(entry['id']))
+        except bridge.CommandError as e:
+            raise MusicPlayerError('Error deleting playlist {}: {}'.format(name, e))
+        finally:
+            self.catalog.reload()
 
     def get_playlist(self, name):
         """Get playlist by name
 
         """
-        if self.application is None:
-            self.__connect__()
-        for pl in self.application.user_playlists.get():
-            if pl.name.get() == name:
-                return Playlist(self, name)
-        raise MusicPlayerError('No such playlist: {}'.format(name))
+        return self.catalog.get(name)
 
     def get_playlist_track(self, playlist, index):
         """Get playlist track by index
@@ -368,24 +466,55 @@ class Client(object):
             self.__connect__()
         try:
             self.application.play(self.library.playlist.file_tracks[index])
-        except appscript.reference.CommandError:
+        except bridge.CommandError:
             raise MusicPlayerError('Invalid library index: {}'.format(index))
         return self.current_track
 
+    def track_reference(self, persistent_id):
+        """Track reference by persistent ID
+
+        Returns whose reference to library track with persistent ID. The reference is
+        resolved by the music player when used, so building it sends no events.
+        """
+        if self.application is None:
+            self.__connect__()
+        tracks = self.application.library_playlists['library'].file_tracks
+        return tracks[bridge.its.persistent_ID == persistent_id].first
+
+    def play_track(self, persistent_id):
+        """Play track by persistent ID
+
+        Track is resolved with a single whose lookup in library playlist
+        """
+        track = self.track_reference(persistent_id)
+        try:
+            self.application.play(track)
+        except bridge.CommandError:
+            raise MusicPlayerError('Invalid track persistent ID: {}'.format(persistent_id))
+        return self.current_track
+
     def play(self, path=None):
         """Play track by path
 
+        Track persistent ID is looked up from path index file and index database. If the
+        path is not in index, the file is played (and imported) by path.
         """
         if self.application is None:
             self.__connect__()
         if path is not None:
             if os.path.isdir(path):
                 path = os.path.join(path, os.listdir(path)[0])
+            persistent_id = self.lookup_path_index(path)
+            if persistent_id is not None:
+                try:
+                    return self.play_track(persistent_id)
+                except MusicPlayerError:
+                    pass
             try:
-                self.jump(self.indexdb.lookup_index(path))
+                return self.play_track(self.index_reader.lookup_index(path))
             except MusicPlayerError:
                 pass
-            self.application.play(mactypes.Alias(path))
+            self.application.play(bridge.Alias(path))
         else:
             self.application.play()
         return self.current_track
@@ -1,9 +1,9 @@
 # -*- coding: utf-8 -*-
 """
 Field and order specs
-"""
 
-import appscript
+REPEAT_VALUES and PLAYER_STATE_NAMES contain bridge keywords and are built on first access.
+"""
 
 SKIPPED_PLAYLISTS = (
     'iTunes U',
@@ -130,16 +130,42 @@ TRACK_DATE_FIELDS = (
 
 )
 
-REPEAT_VALUES = {
-    'off': appscript.k.off,
-    'one': appscript.k.one,
-    'all': appscript.k.all,
-}
 
-PLAYER_STATE_NAMES = {
-    appscript.k.playing: 'playing',
-    appscript.k.paused:  'paused',
-    appscript.k.stopped: 'stopped',
-    appscript.k.off: False,
-    appscript.k.off: False,
+def repeat_values():
+    """
+    Return song repeat keywords by repeat mode name
+    """
+    from .bridge import k
+    return {
+        'off': k.off,
+        'one': k.one,
+        'all': k.all,
+    }
+
+
+def player_state_names():
+    """
+    Return player state names by player state keyword
+    """
+    from .bridge import k
+    return {
+        k.playing: 'playing',
+        k.paused:  'paused',
+        k.stopped: 'stopped',
+        k.off: False,
+    }
+
+
+# Lazily built constants by name
+LAZY_CONSTANTS = {
+    'REPEAT_VALUES': repeat_values,
+    'PLAYER_STATE_NAMES': player_state_names,
 }
+
+
+def __getattr__(name):
+    if name in LAZY_CONSTANTS:
+        value = LAZY_CONSTANTS[name]()
+        globals()[name] = value
+        return value
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
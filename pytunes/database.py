@@ -1,149 +1,1110 @@
 """
-Sqlite database to cache music player track index / filename mappings
+Sqlite database to cache music player track persistent ID / filename mappings
 """
 
 import os
 
+from collections import OrderedDict
 from datetime import datetime
-from pytz import timezone
-from sqlite3 import OperationalError
+from sqlite3 import connect, OperationalError
+from urllib.parse import quote
 from systematic.sqlite import SQLiteDatabase
 
 from pytunes import MusicPlayerError
+from pytunes import bridge
+from pytunes.pathindex import PATH_NORMALIZATION, normalize_path, path_index_file, write_path_index
+from pytunes.tracing import span
+from pytunes.constants import (
+    TRACK_FIELDS,
+    TRACK_SYS_FIELDS,
+    TRACK_INT_FIELDS,
+    TRACK_FLOAT_FIELDS,
+    TRACK_DATE_FIELDS,
+    TRACK_DATE_FORMAT,
+    MUSIC_APP_IGNORED_FIELDS
+)
+
+# Track fields stored in metadata mirror table
+METADATA_FIELDS = tuple(field for field in TRACK_SYS_FIELDS + TRACK_FIELDS if field != 'persistent_ID')
+
+# Metadata fields indexed in track_search full text search table
+SEARCH_FIELDS = (
+    'artist',
+    'album_artist',
+    'album',
+    'name',
+    'composer',
+    'genre',
+    'comment',
+)
+
+# Relative bm25 weights of SEARCH_FIELDS in search result ranking
+SEARCH_FIELD_WEIGHTS = (
+    4.0,
+    2.0,
+    3.0,
+    4.0,
+    1.0,
+    1.0,
+    0.5,
+)
+
+# Version of track_search table contents, table is rebuilt when stored version differs
+SEARCH_INDEX_VERSION = '1'
+
+# Default maximum number of search results
+DEFAULT_SEARCH_LIMIT = 50
+
+
+def metadata_column_type(field):
+    """
+    Return sqlite column type for track field in metadata table
+    """
+    if field in TRACK_INT_FIELDS:
+        return 'INTEGER'
+    elif field in TRACK_FLOAT_FIELDS:
+        return 'REAL'
+    elif field in TRACK_DATE_FIELDS:
+        return 'TIMESTAMP'
+    return 'TEXT'
+
 
 TABLES_SQL = (
     """
     CREATE TABLE IF NOT EXISTS tracks (
-        key INTEGER PRIMARY KEY,
-        path STRING,
+        persistent_id TEXT PRIMARY KEY,
+        database_id INTEGER,
+        path TEXT,
         mtime INTEGER,
-        added DATE
+        added DATE,
+        normalized_path TEXT
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS settings (
+        key TEXT PRIMARY KEY,
+        value TEXT
     );
     """,
+    """
+    CREATE TABLE IF NOT EXISTS metadata (
+        persistent_id TEXT PRIMARY KEY,
+        {}
+    );
+    """.format(',\n        '.join('"{}" {}'.format(field, metadata_column_type(field)) for field in METADATA_FIELDS)),
+    """
+    CREATE TABLE IF NOT EXISTS playlists (
+        persistent_id TEXT PRIMARY KEY,
+        id INTEGER,
+        name TEXT,
+        smart BOOLEAN,
+        parent TEXT,
+        path TEXT,
+        size INTEGER,
+        duration REAL,
+        position INTEGER
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS playlist_tracks (
+        playlist_id TEXT,
+        position INTEGER,
+        track_id TEXT,
+        PRIMARY KEY (playlist_id, position)
+    );
+    """,
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS track_search USING fts5(
+        {},
+        content='metadata',
+        content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    );
+    """.format(', '.join(SEARCH_FIELDS)),
+    """
+    CREATE TRIGGER IF NOT EXISTS metadata_search_insert AFTER INSERT ON metadata BEGIN
+        INSERT INTO track_search (rowid, {0}) VALUES (new.rowid, {1});
+    END;
+    """.format(
+        ', '.join(SEARCH_FIELDS),
+        ', '.join('new."{}"'.format(field) for field in SEARCH_FIELDS),
+    ),
+    """
+    CREATE TRIGGER IF NOT EXISTS metadata_search_delete AFTER DELETE ON metadata BEGIN
+        INSERT INTO track_search (track_search, rowid, {0}) VALUES ('delete', old.rowid, {1});
+    END;
+    """.format(
+        ', '.join(SEARCH_FIELDS),
+        ', '.join('old."{}"'.format(field) for field in SEARCH_FIELDS),
+    ),
+    """
+    CREATE TRIGGER IF NOT EXISTS metadata_search_update AFTER UPDATE ON metadata BEGIN
+        INSERT INTO track_search (track_search, rowid, {0}) VALUES ('delete', old.rowid, {1});
+        INSERT INTO track_search (rowid, {0}) VALUES (new.rowid, {2});
+    END;
+    """.format(
+        ', '.join(SEARCH_FIELDS),
+        ', '.join('old."{}"'.format(field) for field in SEARCH_FIELDS),
+        ', '.join('new."{}"'.format(field) for field in SEARCH_FIELDS),
+    ),
 )
 
+# Number of tracks written to index database in one transaction
+DEFAULT_BATCH_SIZE = 5000
+
+# Milliseconds to wait for locks held by other database connections
+DEFAULT_BUSY_TIMEOUT = 5000
+
+# Number of threads used to read track file modification times
+DEFAULT_STAT_WORKERS = 8
+
+# Number of paths resolved with one query by lookup_indexes
+DEFAULT_LOOKUP_BATCH_SIZE = 1000
+
+# Track fields read for index updates
+WATERMARK_FIELDS = (
+    'database_ID',
+    'path',
+    'modification_date',
+    'date_added',
+)
+
+UPSERT_TRACK_SQL = """
+    INSERT INTO tracks (persistent_id, database_id, path, mtime, added, normalized_path) VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(persistent_id) DO UPDATE SET
+        database_id=excluded.database_id,
+        path=excluded.path,
+        mtime=excluded.mtime,
+        normalized_path=excluded.normalized_path
+    WHERE tracks.path IS NOT excluded.path OR tracks.mtime IS NOT excluded.mtime
+        OR tracks.database_id IS NOT excluded.database_id
+"""
+
+UPSERT_PLAYLIST_SQL = """
+    INSERT INTO playlists (persistent_id, id, name, smart, parent, path, size, duration, position)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(persistent_id) DO UPDATE SET
+        id=excluded.id,
+        name=excluded.name,
+        smart=excluded.smart,
+        parent=excluded.parent,
+        path=excluded.path,
+        size=excluded.size,
+        duration=excluded.duration,
+        position=excluded.position
+"""
+
 
-class TrackIndexDB(SQLiteDatabase):
+def search_query(text):
     """
-    Track index database
+    Build full text search query
 
-    SQlite index for track paths in MacOS music player
+    Return FTS5 query matching all words in text, with each word matched as prefix
     """
-    def __init__(self, client, path):
-        super().__init__(path, tables_sql=TABLES_SQL)
-        self.client = client
+    terms = []
+    for word in text.split():
+        word = word.replace('"', '""')
+        terms.append('"{}"*'.format(word))
+    return ' '.join(terms)
+
+
+def stat_directory(directory, tracks):
+    """
+    Read modification times for tracks in directory
+
+    Tracks is a list of (persistent ID, database ID, path) tuples for files in directory.
+    Files are looked up from one directory listing. Files not found in the listing are
+    checked with os.stat, in case listing uses different unicode normalization for names.
+
+    Returns list of (persistent ID, database ID, path, mtime) tuples. Mtime is None for
+    missing files.
+    """
+    mtimes = {}
+    wanted = set(os.path.basename(path) for key, database_id, path in tracks)
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name in wanted:
+                    try:
+                        mtimes[entry.name] = entry.stat().st_mtime
+                    except OSError:
+                        pass
+    except OSError:
+        pass
+
+    results = []
+    for key, database_id, path in tracks:
+        mtime = mtimes.get(os.path.basename(path))
+        if mtime is None:
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                mtime = None
+        results.append((key, database_id, path, mtime))
+    return results
+
+
+def stat_tracks(tracks, workers=DEFAULT_STAT_WORKERS):
+    """
+    Read modification times for track files
+
+    Tracks must be iterable of (persistent ID, database ID, path) tuples. Tracks are
+    grouped by directory and directories are read with stat_directory in a thread pool
+    of given number of workers.
+
+    Yields (persistent ID, database ID, path, mtime) tuples as directories are processed.
+    Mtime is None for tracks without path or existing file.
+    """
+    directories = {}
+    for key, database_id, path in tracks:
+        if not isinstance(path, str):
+            yield key, database_id, path, None
+            continue
+        directories.setdefault(os.path.dirname(path), []).append((key, database_id, path))
+
+    if not directories:
+        return
+
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    with ThreadPoolExecutor(max_workers=max(min(workers, len(directories)), 1)) as executor:
+        futures = [
+            executor.submit(stat_directory, directory, directory_tracks)
+            for directory, directory_tracks in directories.items()
+        ]
+        for future in as_completed(futures):
+            for result in future.result():
+                yield result
+
+
+class TrackIndexReader(object):
+    """
+    Track index database reader
+
+    Lookups and reads from the mirror tables using a read-only connection to the track
+    index database. Tables are not created or migrated, so the reader can be used with a
+    read-only database file and is not blocked by running updates (see TrackIndexDB).
+    """
+    def __init__(self, path, busy_timeout=DEFAULT_BUSY_TIMEOUT):
+        self.db_path = path
+        self.busy_timeout = busy_timeout
+        self.__reader__ = None
+
+    @property
+    def reader(self):
+        """
+        Read-only database connection
+
+        Opened on first access. Reads see the last committed state of the database. The
+        connection may be used from other threads, if callers serialize access to it (see
+        ClientServer).
+        """
+        if self.__reader__ is None:
+            try:
+                self.__reader__ = connect(
+                    'file:{}?mode=ro'.format(quote(os.path.abspath(self.db_path))),
+                    uri=True,
+                    timeout=self.busy_timeout / 1000,
+                    check_same_thread=False,
+                )
+            except OperationalError as e:
+                raise MusicPlayerError('Error opening {}: {}'.format(self.db_path, e))
+        return self.__reader__
 
     def __repr__(self):
         return '{}'.format(self.db_path)
 
-    def add_track(self, track):
+    def close(self):
         """
-        Add track to index
+        Close read-only database connection
+        """
+        if self.__reader__ is not None:
+            self.__reader__.close()
+            self.__reader__ = None
+
+    def lookup_index(self, path):
         """
+        Find track persistent ID for filename
 
+        Raises MusicPlayerError if path was not in database
+        """
+        path = normalize_path(os.path.realpath(path))
         try:
-            c = self.cursor
+            c = self.reader.cursor()
             c.execute(
-                """SELECT key, mtime FROM tracks WHERE key=?""",
+                """SELECT persistent_id FROM tracks WHERE normalized_path=?""",
                 (
-                    track.index,
+                    path,
                 )
             )
             res = c.fetchone()
         except OperationalError as e:
             raise MusicPlayerError(e)
+        if res:
+            return res[0]
+        else:
+            raise MusicPlayerError('Track not in index database: {}'.format(path))
+
+    def __resolve_path__(self, path, directories):
+        """
+        Resolve lookup path
+
+        Return normalized real path for path. Real paths of parent directories are cached
+        in directories dictionary, so only the file itself is checked for each path.
+        """
+        path = os.path.abspath(path)
+        if os.path.islink(path):
+            return normalize_path(os.path.realpath(path))
+        directory, filename = os.path.split(path)
+        if directory not in directories:
+            directories[directory] = os.path.realpath(directory)
+        return normalize_path(os.path.join(directories[directory], filename))
+
+    def lookup_indexes(self, paths, batch_size=DEFAULT_LOOKUP_BATCH_SIZE):
+        """
+        Find track persistent IDs for filenames
 
+        Paths can be any iterable and are consumed in batches of batch_size paths. Each
+        batch is resolved with a single join query against a temporary table.
+
+        Yields (path, persistent ID) tuples in order of paths. Persistent ID is None if
+        path was not in database. Raises ValueError if batch_size is less than 1.
+        """
+        if batch_size < 1:
+            raise ValueError('Invalid lookup batch size: {}'.format(batch_size))
+        directories = {}
         try:
-            mtime = os.stat(track.path).st_mtime
-        except OSError:
-            mtime = None
-        except IOError:
-            mtime = None
-
-        if res is not None:
-            if mtime:
-                if res[1] != mtime:
-                    c = self.cursor
-                    c.execute(
-                        """UPDATE tracks set mtime=? WHERE key=?""",
-                        (
-                            mtime,
-                            res[0]
-                        )
-                    )
-                    self.commit()
-            else:
-                c = self.cursor
-                c.execute("""DELETE FROM tracks WHERE key=?""", (res[0],))
-                self.commit()
+            c = self.reader.cursor()
+            c.execute(
+                """
+                CREATE TEMP TABLE IF NOT EXISTS lookup_paths (
+                    position INTEGER PRIMARY KEY,
+                    normalized_path TEXT
+                )
+                """
+            )
+        except OperationalError as e:
+            raise MusicPlayerError(e)
+
+        batch = []
+        paths = iter(paths)
+        while True:
+            batch.clear()
+            for path in paths:
+                batch.append(path)
+                if len(batch) >= batch_size:
+                    break
+            if not batch:
+                break
 
-        elif mtime is not None:
-            added = datetime.now(timezone('UTC'))
             try:
-                c = self.cursor
+                c = self.reader.cursor()
+                c.execute("""DELETE FROM lookup_paths""")
+                c.executemany(
+                    """INSERT INTO lookup_paths (position, normalized_path) VALUES (?, ?)""",
+                    ((position, self.__resolve_path__(path, directories)) for position, path in enumerate(batch))
+                )
                 c.execute(
-                    """INSERT INTO tracks VALUES (?, ?, ?, ?)""",
-                    (
-                        track.index,
-                        track.path,
-                        mtime,
-                        added
-                    )
+                    """SELECT l.position, t.persistent_id FROM lookup_paths l
+                    LEFT JOIN tracks t ON t.normalized_path=l.normalized_path ORDER BY l.position"""
                 )
-                self.commit()
+                rows = c.fetchall()
+                self.reader.commit()
             except OperationalError as e:
+                self.reader.rollback()
                 raise MusicPlayerError(e)
 
-    def lookup_index(self, path):
+            for position, persistent_id in rows:
+                yield batch[position], persistent_id
+
+    @property
+    def path_index_path(self):
+        """
+        Path to memory mapped path index file written next to the database
         """
-        Find index for filename
+        return path_index_file(self.db_path)
 
-        Raises MusicPlayerError if path was not in database
+    def read_playlists(self):
+        """
+        Read playlists from playlist mirror
+
+        Returns list of playlist details dictionaries in catalog entry format
         """
-        path = os.path.realpath(path)
         try:
-            c = self.cursor
+            c = self.reader.cursor()
+            c.execute("""SELECT persistent_id, id, name, smart, parent, path FROM playlists ORDER BY position""")
+            return [
+                {
+                    'persistent_ID': persistent_id,
+                    'id': playlist_id,
+                    'name': name,
+                    'smart': smart and True or False,
+                    'parent': parent,
+                    'path': path,
+                }
+                for persistent_id, playlist_id, name, smart, parent, path in c.fetchall()
+            ]
+        except OperationalError as e:
+            raise MusicPlayerError(e)
+
+    def count_metadata(self, playlist_id=None):
+        """
+        Count tracks in metadata mirror, or on given playlist
+        """
+        try:
+            c = self.reader.cursor()
+            if playlist_id is None:
+                c.execute("""SELECT COUNT(*) FROM metadata""")
+            else:
+                c.execute("""SELECT COUNT(*) FROM playlist_tracks WHERE playlist_id=?""", (playlist_id,))
+            return c.fetchone()[0]
+        except OperationalError as e:
+            raise MusicPlayerError(e)
+
+    def read_metadata(self, fields=METADATA_FIELDS, playlist_id=None, start=0, end=None, where=None):
+        """
+        Read tracks from metadata mirror
+
+        Reads given metadata fields for library tracks, or tracks on playlist with given
+        persistent ID, in range start - end (0 based, end not included). Where is a
+        dictionary of field values tracks must contain (case insensitive).
+
+        Returns list of (persistent ID, field values dictionary) tuples
+        """
+        for field in fields:
+            if field not in METADATA_FIELDS:
+                raise ValueError('Invalid track field: {}'.format(field))
+
+        columns = ', '.join(['m.persistent_id'] + ['m."{}"'.format(field) for field in fields])
+        if playlist_id is None:
+            query = """SELECT {} FROM metadata m""".format(columns)
+            conditions = []
+            args = []
+            order = """m."index", m.rowid"""
+        else:
+            query = """SELECT {} FROM playlist_tracks p JOIN metadata m ON m.persistent_id=p.track_id""".format(columns)
+            conditions = ['p.playlist_id=?']
+            args = [playlist_id]
+            order = 'p.position'
+
+        for field, value in (where or {}).items():
+            if field not in METADATA_FIELDS:
+                raise ValueError('Invalid track field: {}'.format(field))
+            conditions.append("""m."{}" LIKE ? ESCAPE '\\'""".format(field))
+            args.append('%{}%'.format(str(value).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')))
+
+        if conditions:
+            query += ' WHERE {}'.format(' AND '.join(conditions))
+        query += ' ORDER BY {} LIMIT ? OFFSET ?'.format(order)
+        args.extend([-1 if end is None else max(end - start, 0), start])
+
+        try:
+            c = self.reader.cursor()
+            c.execute(query, args)
+            rows = c.fetchall()
+        except OperationalError as e:
+            raise MusicPlayerError(e)
+
+        tracks = []
+        for row in rows:
+            values = {}
+            for field, value in zip(fields, row[1:]):
+                if field in TRACK_DATE_FIELDS and value is not None:
+                    value = datetime.strptime(value, TRACK_DATE_FORMAT)
+                values[field] = value
+            tracks.append((row[0], values))
+        return tracks
+
+    def search(self, text, fields=SEARCH_FIELDS, limit=DEFAULT_SEARCH_LIMIT):
+        """
+        Search tracks
+
+        Full text search of words in text from SEARCH_FIELDS of mirrored track metadata.
+        Words are matched as prefixes and all words must match. Results are ranked by
+        bm25 with SEARCH_FIELD_WEIGHTS.
+
+        Returns list of (persistent ID, field values dictionary) tuples for given metadata
+        fields, best match first.
+        """
+        if self.get_setting('mirror_metadata') != '1':
+            raise MusicPlayerError('Track metadata is not mirrored, run update-index with --metadata')
+
+        for field in fields:
+            if field not in METADATA_FIELDS:
+                raise ValueError('Invalid track field: {}'.format(field))
+
+        query = search_query(text)
+        if not query:
+            return []
+
+        try:
+            c = self.reader.cursor()
             c.execute(
-                """SELECT key FROM tracks WHERE path=?""",
-                (
-                    path,
-                )
+                """SELECT {} FROM track_search s JOIN metadata m ON m.rowid=s.rowid
+                WHERE track_search MATCH ? ORDER BY bm25(track_search, {}) LIMIT ?""".format(
+                    ', '.join(['m.persistent_id'] + ['m."{}"'.format(field) for field in fields]),
+                    ', '.join('{:f}'.format(weight) for weight in SEARCH_FIELD_WEIGHTS),
+                ),
+                (query, -1 if limit is None else limit)
             )
-            res = c.fetchone()
+            rows = c.fetchall()
+        except OperationalError as e:
+            raise MusicPlayerError('Error searching {}: {}'.format(text, e))
+
+        return [(row[0], dict(zip(fields, row[1:]))) for row in rows]
+
+
+class TrackIndexDB(SQLiteDatabase, TrackIndexReader):
+    """
+    Track index database
+
+    SQlite index for track paths in MacOS music player, keyed by track persistent ID
+
+    Database is used in WAL mode, so lookups and reads from the mirror tables use a
+    separate read-only connection (see TrackIndexReader) and are not blocked by running
+    updates. Opening the database creates and migrates tables, so callers only doing
+    lookups should use TrackIndexReader instead.
+    """
+    def __init__(self, client, path, batch_size=DEFAULT_BATCH_SIZE, stat_workers=DEFAULT_STAT_WORKERS,
+                 busy_timeout=DEFAULT_BUSY_TIMEOUT):
+        SQLiteDatabase.__init__(self, path, tables_sql=TABLES_SQL)
+        TrackIndexReader.__init__(self, path, busy_timeout)
+        self.client = client
+        self.batch_size = batch_size
+        self.stat_workers = stat_workers
+        self.__live_keys_filled__ = False
+
+        try:
+            c = self.cursor
+            c.execute('PRAGMA busy_timeout={:d}'.format(busy_timeout))
+            c.fetchone()
+            c.execute('PRAGMA journal_mode=WAL')
+            c.fetchone()
+            c.execute('PRAGMA synchronous=NORMAL')
         except OperationalError as e:
             raise MusicPlayerError(e)
-        if res:
-            return res[0]
-        else:
-            raise MusicPlayerError('Track not in index database: {}'.format(path))
 
-    def cleanup(self, ids):
+        self.__migrate__()
+
+    def get_setting(self, key, default=None):
+        """
+        Get setting value from database as string
+        """
+        c = self.cursor
+        c.execute("""SELECT value FROM settings WHERE key=?""", (key,))
+        res = c.fetchone()
+        return str(res[0]) if res is not None else default
+
+    def set_setting(self, key, value):
+        """
+        Set setting value in database. Changes are not committed.
+        """
+        c = self.cursor
+        c.execute(
+            """INSERT INTO settings (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value=excluded.value""",
+            (key, value)
+        )
+
+    def __migrate__(self):
+        """
+        Migrate database schema
+
+        Moves tracks keyed by library index from databases created by older versions to
+        tracks_v1 table and imports them (see __import_legacy_tracks__). Normalizes paths
+        when stored normalization form differs from PATH_NORMALIZATION.
+        """
+        try:
+            c = self.cursor
+            c.execute("""PRAGMA table_info(tracks)""")
+            columns = [row[1] for row in c.fetchall()]
+            if 'persistent_id' not in columns:
+                c.execute("""DROP INDEX IF EXISTS tracks_normalized_path""")
+                c.execute("""ALTER TABLE tracks RENAME TO tracks_v1""")
+                c.execute(TABLES_SQL[0])
+                c.execute("""DELETE FROM settings WHERE key LIKE 'watermark_%' OR key='path_normalization'""")
+
+            if self.get_setting('path_normalization') != PATH_NORMALIZATION:
+                self.__normalize_paths__()
+            if self.get_setting('search_index') != SEARCH_INDEX_VERSION:
+                c.execute("""INSERT INTO track_search (track_search) VALUES ('rebuild')""")
+                self.set_setting('search_index', SEARCH_INDEX_VERSION)
+            self.commit()
+        except OperationalError as e:
+            self.rollback()
+            raise MusicPlayerError('Error migrating {}: {}'.format(self.db_path, e))
+
+        self.__import_legacy_tracks__()
+
+    def __import_legacy_tracks__(self):
+        """
+        Import tracks keyed by library index
+
+        Older versions used track index in library playlist as key. The keys are mapped
+        to persistent IDs with bulk reads of library track indexes and persistent IDs. If
+        music player is not available, tracks_v1 table is kept until next time.
+        """
+        c = self.cursor
+        c.execute("""SELECT name FROM sqlite_master WHERE type='table' AND name='tracks_v1'""")
+        if c.fetchone() is None or self.client is None or getattr(self.client, 'offline', False):
+            return
+
+        try:
+            library = self.client.library.fetch(('index', 'database_ID'))
+        except MusicPlayerError:
+            return
+        keys = dict((track['index'], (persistent_id, track['database_ID'])) for persistent_id, track in library)
+
+        try:
+            c.execute("""SELECT key, path, mtime, added FROM tracks_v1""")
+            rows = [
+                keys[key] + (path, mtime, added, normalize_path(path))
+                for key, path, mtime, added in c.fetchall()
+                if key in keys and path is not None
+            ]
+            c.executemany(
+                """
+                INSERT OR IGNORE INTO tracks (persistent_id, database_id, path, mtime, added, normalized_path)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                rows
+            )
+            c.execute("""DROP TABLE tracks_v1""")
+            self.commit()
+        except OperationalError as e:
+            self.rollback()
+            raise MusicPlayerError('Error migrating {}: {}'.format(self.db_path, e))
+
+    def __normalize_paths__(self):
+        """
+        Normalize stored paths
+
+        Fill normalized_path column, drop tracks with duplicate normalized paths and create
+        unique index for normalized_path
+        """
+        c = self.cursor
+        c.execute("""DROP INDEX IF EXISTS tracks_normalized_path""")
+        c.execute("""SELECT persistent_id, path FROM tracks""")
+        rows = [(normalize_path(path), key) for key, path in c.fetchall() if path is not None]
+        c.executemany("""UPDATE tracks SET normalized_path=? WHERE persistent_id=?""", rows)
+        c.execute(
+            """
+            DELETE FROM tracks WHERE normalized_path IS NULL OR rowid NOT IN (
+                SELECT MIN(rowid) FROM tracks GROUP BY normalized_path
+            )
+            """
+        )
+        c.execute("""CREATE UNIQUE INDEX IF NOT EXISTS tracks_normalized_path ON tracks (normalized_path)""")
+        self.set_setting('path_normalization', PATH_NORMALIZATION)
+
+    def add_tracks(self, tracks):
+        """
+        Add tracks to index
+
+        Tracks must be iterable of (persistent ID, database ID, path) tuples. Tracks
+        with existing files are inserted or updated, other tracks are removed from
+        index. File modification times are read in parallel with stat_tracks. Changes
+        are not committed.
+        """
+        from pytz import timezone
+        added = datetime.now(timezone('UTC'))
+        upserts = {}
+        deletes = []
+        for key, database_id, path, mtime in stat_tracks(tracks, self.stat_workers):
+            if mtime is not None:
+                normalized_path = normalize_path(path)
+                upserts[normalized_path] = (key, database_id, path, mtime, added, normalized_path)
+            else:
+                deletes.append((key,))
+
+        try:
+            c = self.cursor
+            if upserts:
+                # Paths moved to other keys would violate unique normalized_path index
+                c.executemany(
+                    """DELETE FROM tracks WHERE normalized_path=? AND persistent_id!=?""",
+                    ((row[5], row[0]) for row in upserts.values())
+                )
+                c.executemany(UPSERT_TRACK_SQL, upserts.values())
+            if deletes:
+                c.executemany("""DELETE FROM tracks WHERE persistent_id=?""", deletes)
+        except OperationalError as e:
+            self.rollback()
+            raise MusicPlayerError(e)
+
+    def add_track(self, track):
+        """
+        Add track to index
+        """
+        self.add_tracks(((track.persistent_ID, track.database_ID, track.path),))
+        self.commit()
+
+    def __reset_live_keys__(self):
+        """
+        Create or empty temporary table for live track keys
+        """
+        c = self.cursor
+        c.execute("""CREATE TEMP TABLE IF NOT EXISTS live_keys (key TEXT PRIMARY KEY)""")
+        c.execute("""DELETE FROM live_keys""")
+        self.__live_keys_filled__ = True
+
+    def add_live_keys(self, keys):
+        """
+        Add persistent IDs to temporary table of live track keys used by cleanup()
+
+        The table is emptied when a full update starts.
+        """
+        if not self.__live_keys_filled__:
+            self.__reset_live_keys__()
+        try:
+            c = self.cursor
+            c.executemany("""INSERT OR IGNORE INTO live_keys (key) VALUES (?)""", ((key,) for key in keys))
+        except OperationalError as e:
+            raise MusicPlayerError(e)
+
+    def cleanup(self, ids=None):
         """
         Remove unknown IDs
 
-        Removes tracks with ID not provided in list 'ids'
+        Removes tracks with persistent IDs not in temporary live_keys table. If list 'ids' is given,
+        the table is filled with given keys in chunks of batch_size keys first. Otherwise the keys
+        must have been added with add_live_keys() in the same update pass.
+
+        Raises MusicPlayerError if ids is not given and live keys were not added in this pass.
+
+        Returns number of tracks removed
         """
+        if ids is None and not self.__live_keys_filled__:
+            raise MusicPlayerError('No live track keys for cleanup of {}'.format(self.db_path))
         try:
+            if ids is not None:
+                self.__reset_live_keys__()
+                for start in range(0, len(ids), self.batch_size):
+                    self.add_live_keys(ids[start:start + self.batch_size])
+
             c = self.cursor
             c.execute(
-                """DELETE FROM tracks WHERE key not in (?)""",
-                (
-                    ','.join(ids),
+                """
+                DELETE FROM tracks WHERE NOT EXISTS (
+                    SELECT 1 FROM live_keys WHERE live_keys.key=tracks.persistent_id
                 )
+                """
             )
+            removed = c.rowcount
+            c.execute(
+                """
+                DELETE FROM metadata WHERE NOT EXISTS (
+                    SELECT 1 FROM live_keys WHERE live_keys.key=metadata.persistent_id
+                )
+                """
+            )
+            c.execute("""DELETE FROM live_keys""")
             self.commit()
         except OperationalError as e:
+            self.rollback()
             raise MusicPlayerError(e)
+        finally:
+            self.__live_keys_filled__ = False
+        return removed
+
+    def __read_watermark__(self):
+        """
+        Read update watermark
+
+        Returns tuple of latest track modification date, latest track added date and
+        library track count from previous update, or None if not available
+        """
+        modified = self.get_setting('watermark_modified')
+        added = self.get_setting('watermark_added')
+        count = self.get_setting('watermark_count')
+        if modified is None or added is None or count is None:
+            return None
+        try:
+            return (
+                datetime.strptime(modified, TRACK_DATE_FORMAT),
+                datetime.strptime(added, TRACK_DATE_FORMAT),
+                int(count),
+            )
+        except ValueError:
+            return None
 
-    def update(self):
+    def __write_watermark__(self, modified, added, count):
+        """
+        Store update watermark. Changes are not committed.
+        """
+        if modified is None or added is None:
+            return
+        self.set_setting('watermark_modified', modified.strftime(TRACK_DATE_FORMAT))
+        self.set_setting('watermark_added', added.strftime(TRACK_DATE_FORMAT))
+        self.set_setting('watermark_count', '{:d}'.format(count))
+
+    def __update_fields__(self, metadata):
+        """
+        Return track fields read for index update
+        """
+        if not metadata:
+            return WATERMARK_FIELDS
+        fields = list(WATERMARK_FIELDS)
+        for field in METADATA_FIELDS:
+            if getattr(self.client, '__app_name__', None) == 'Music' and field in MUSIC_APP_IGNORED_FIELDS:
+                continue
+            if field not in fields:
+                fields.append(field)
+        return fields
+
+    def __update_changed__(self, library, count, watermark, batch_size, metadata):
+        """
+        Update tracks changed since watermark
+
+        Reads only tracks modified or added after watermark dates. Changed tracks are
+        written in transactions of batch_size tracks. Returns None if the library track
+        count does not match indexed count and added tracks, i.e. tracks have been removed
+        and full update is required.
+        """
+        modified, added, indexed_count = watermark
+        query = (bridge.its.modification_date > modified).OR(bridge.its.date_added > added)
+        with span('fetch'):
+            tracks = library.fetch(self.__update_fields__(metadata), where=query)
+
+        new_tracks = [
+            track for persistent_id, track in tracks
+            if track['date_added'] is not None and track['date_added'] > added
+        ]
+        if indexed_count + len(new_tracks) != count:
+            return None
+
+        for start in range(0, len(tracks), batch_size):
+            batch = tracks[start:start + batch_size]
+            with span('write', tracks=len(batch)):
+                self.add_tracks(
+                    (persistent_id, track['database_ID'], track['path'])
+                    for persistent_id, track in batch
+                )
+                if metadata:
+                    self.add_metadata(batch)
+                self.commit()
+
+        modification_dates = [track['modification_date'] for persistent_id, track in tracks]
+        self.__write_watermark__(
+            max([modified] + [date for date in modification_dates if date]),
+            max([added] + [track['date_added'] for track in new_tracks]),
+            count
+        )
+        self.commit()
+        return len(tracks), 0
+
+    def __update_full__(self, library, count, batch_size, metadata):
+        """
+        Update all library tracks
+
+        Tracks no longer in library are removed after all batches are processed, also when
+        library is empty.
+        """
+        if count == 0:
+            # Playlist length is 0 also when reading it fails, so check the library is empty
+            try:
+                count = len(self.client.get(library.playlist.file_tracks.persistent_ID))
+            except bridge.CommandError as e:
+                raise MusicPlayerError('Error reading library tracks: {}'.format(e))
+
+        try:
+            self.__reset_live_keys__()
+        except OperationalError as e:
+            raise MusicPlayerError(e)
+
+        processed = 0
+        modified = None
+        added = None
+        for start in range(0, count, batch_size):
+            with span('fetch'):
+                tracks = library.fetch(self.__update_fields__(metadata), start, start + batch_size)
+            for persistent_id, track in tracks:
+                if track['modification_date'] is not None:
+                    modified = max(modified, track['modification_date']) if modified else track['modification_date']
+                if track['date_added'] is not None:
+                    added = max(added, track['date_added']) if added else track['date_added']
+
+            with span('write', tracks=len(tracks)):
+                if metadata:
+                    self.add_metadata(tracks)
+                self.add_tracks(
+                    (persistent_id, track['database_ID'], track['path'])
+                    for persistent_id, track in tracks
+                )
+                self.add_live_keys(persistent_id for persistent_id, track in tracks)
+                self.commit()
+            processed += len(tracks)
+
+        with span('cleanup'):
+            removed = self.cleanup()
+        self.__write_watermark__(modified, added, count)
+        self.commit()
+        return processed, removed
+
+    def update(self, batch_size=None, full=False, metadata=None):
         """
         Update index
 
-        Update tracks track sqlite index
+        Update tracks track sqlite index. Latest track modification and added dates and
+        library track count are stored as watermark on each update. If watermark exists,
+        only tracks changed after it are read from the library, unless full is True or
+        tracks have been removed from library. Path index file is rewritten after update.
+
+        In full update library tracks are read and written to the database in batches
+        of batch_size tracks, one transaction per batch.
+
+        If metadata is True, all track fields and playlists are mirrored to metadata and
+        playlist tables (see Client offline mode). The setting is stored and used by
+        later updates if metadata is None.
+
+        Returns tuple with number of library tracks processed and tracks removed
         """
-        ids = []
-        for track in self.client.library:
-            if track.path is not None:
-                self.add_track(track)
-                ids.append('{}'.format(track.index))
-        # self.cleanup(ids)
+        if batch_size is None:
+            batch_size = self.batch_size
+
+        if metadata is None:
+            metadata = self.get_setting('mirror_metadata') == '1'
+        elif metadata and self.get_setting('mirror_metadata') != '1':
+            # Mirror must be filled with full update first
+            full = True
+
+        library = self.client.library
+        count = len(library)
+
+        result = None
+        watermark = self.__read_watermark__() if not full else None
+        if watermark is not None:
+            with span('update changed'):
+                result = self.__update_changed__(library, count, watermark, batch_size, metadata)
+        if result is None:
+            with span('update full'):
+                result = self.__update_full__(library, count, batch_size, metadata)
+
+        if metadata:
+            with span('update playlists'):
+                self.update_playlists(self.client.catalog, full=full)
+        self.set_setting('mirror_metadata', metadata and '1' or '0')
+        self.commit()
+        with span('write path index'):
+            self.write_path_index()
+        return result
+
+    def write_path_index(self):
+        """
+        Write memory mapped path index
+
+        Writes normalized paths and persistent IDs of all indexed tracks to path index file
+        (see pytunes.pathindex). Returns number of tracks written.
+        """
+        try:
+            c = self.cursor
+            c.execute("""SELECT normalized_path, persistent_id FROM tracks WHERE normalized_path IS NOT NULL""")
+            count = write_path_index(self.path_index_path, c)
+        except OperationalError as e:
+            raise MusicPlayerError(e)
+        except OSError as e:
+            raise MusicPlayerError('Error writing {}: {}'.format(self.path_index_path, e))
+        return count
+
+    def add_metadata(self, tracks):
+        """
+        Add track metadata to metadata mirror table
+
+        Tracks must be iterable of (persistent ID, field values dictionary) tuples, as
+        returned by Playlist.fetch. Changes are not committed.
+
+        Existing rows are updated in place to keep rowids of track_search entries stable.
+        """
+        rows = []
+        for persistent_id, track in tracks:
+            row = [persistent_id]
+            for field in METADATA_FIELDS:
+                value = track.get(field)
+                if field in TRACK_DATE_FIELDS and value is not None:
+                    value = value.strftime(TRACK_DATE_FORMAT)
+                elif value is not None and not isinstance(value, (int, float, str)):
+                    value = str(value)
+                row.append(value)
+            rows.append(row)
+
+        try:
+            c = self.cursor
+            c.executemany(
+                """INSERT INTO metadata (persistent_id, {}) VALUES ({})
+                ON CONFLICT(persistent_id) DO UPDATE SET {}""".format(
+                    ', '.join('"{}"'.format(field) for field in METADATA_FIELDS),
+                    ', '.join('?' for field in ('persistent_id',) + METADATA_FIELDS),
+                    ', '.join('"{0}"=excluded."{0}"'.format(field) for field in METADATA_FIELDS),
+                ),
+                rows
+            )
+        except OperationalError as e:
+            self.rollback()
+            raise MusicPlayerError(e)
+
+    def update_playlists(self, catalog, full=False):
+        """
+        Update playlist mirror
+
+        Catalog is reloaded and playlists from it are stored with persistent IDs of tracks
+        on each playlist. Playlists are compared with stored playlists: tracks are read
+        and stored only for new playlists and playlists with changed signature (see
+        PlaylistCatalog.signatures), or for all playlists if full is True. Details of other
+        changed playlists are updated and playlists no longer in catalog are removed.
+        """
+        catalog.reload()
+        signatures = catalog.signatures()
+        playlists = OrderedDict()
+        for position, entry in enumerate(catalog):
+            size, duration = signatures.get(entry['persistent_ID'], (None, None))
+            playlists[entry['persistent_ID']] = (
+                entry['persistent_ID'],
+                entry['id'],
+                entry['name'],
+                entry['smart'],
+                entry['parent'],
+                entry['path'],
+                size,
+                duration,
+                position,
+            )
+
+        try:
+            c = self.cursor
+            c.execute(
+                """SELECT persistent_id, id, name, smart, parent, path, size, duration, position FROM playlists"""
+            )
+            stored = dict((row[0], tuple(row)) for row in c.fetchall())
+        except OperationalError as e:
+            raise MusicPlayerError(e)
+
+        removed = [(persistent_id,) for persistent_id in stored if persistent_id not in playlists]
+        updated = [row for persistent_id, row in playlists.items() if stored.get(persistent_id) != row]
+        changed = [
+            entry for entry in catalog
+            if full or entry['persistent_ID'] not in stored
+            or stored[entry['persistent_ID']][6:8] != playlists[entry['persistent_ID']][6:8]
+        ]
+        if not removed and not updated and not changed:
+            return
+
+        playlist_tracks = []
+        for entry in changed:
+            tracks = catalog.playlist(entry).fetch(())
+            playlist_tracks.extend(
+                (entry['persistent_ID'], position, track_id)
+                for position, (track_id, values) in enumerate(tracks)
+            )
+
+        try:
+            c = self.cursor
+            c.executemany("""DELETE FROM playlists WHERE persistent_id=?""", removed)
+            c.executemany(
+                """DELETE FROM playlist_tracks WHERE playlist_id=?""",
+                removed + [(entry['persistent_ID'],) for entry in changed]
+            )
+            c.executemany(UPSERT_PLAYLIST_SQL, updated)
+            c.executemany("""INSERT INTO playlist_tracks VALUES (?, ?, ?)""", playlist_tracks)
+            self.commit()
+        except OperationalError as e:
+            self.rollback()
+            raise MusicPlayerError(e)
@@ -0,0 +1,197 @@
+"""
+Offline access to music player library
+
+Playlists and tracks served from metadata mirrored to track index database, without
+connecting to music player. See TrackIndexDB.update(metadata=True).
+"""
+
+import os
+
+from collections import OrderedDict
+
+from . import MusicPlayerError
+from .database import METADATA_FIELDS
+from .playlist import DEFAULT_FETCH_FIELDS, DEFAULT_PAGE_SIZE, PREFETCH_FIELDS, PlaylistCatalog, PlaylistIterator
+from .track import Track, TRACK_FIELD_ALIASES
+
+
+class OfflinePlaylist(object):
+    """
+    Offline music player playlist
+
+    Playlist with tracks read from track index database metadata mirror. Library playlist
+    is used if entry is None, otherwise entry is a playlist catalog entry.
+    """
+
+    def __init__(self, client, entry=None, page_size=DEFAULT_PAGE_SIZE):
+        self.client = client
+        self.entry = entry
+        self.page_size = page_size
+        self.name = entry['name'] if entry is not None else 'library'
+        self.__len_cached__ = None
+
+    def __repr__(self):
+        return 'playlist:{}'.format(self.name)
+
+    def __str__(self):
+        return self.name
+
+    def __len__(self):
+        if self.__len_cached__ is None:
+            self.__len_cached__ = self.client.index_reader.count_metadata(self.persistent_id)
+        return self.__len_cached__
+
+    def __iter__(self):
+        return PlaylistIterator(self, page_size=self.page_size)
+
+    def __getitem__(self, index):
+        """Get track by index
+
+        Slices return list of tracks
+        """
+        if isinstance(index, slice):
+            start, end, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError('Playlist slices do not support step')
+            return self.tracks(start, end)
+
+        try:
+            index = int(index)
+        except ValueError:
+            raise ValueError('Invalid playlist index: {}'.format(index))
+        if index < 0:
+            index = len(self) + index
+        tracks = self.tracks(index, index + 1)
+        if not tracks:
+            raise IndexError('Out of playlist: {:d}'.format(index))
+        return tracks[0]
+
+    @property
+    def persistent_id(self):
+        return self.entry['persistent_ID'] if self.entry is not None else None
+
+    @property
+    def parent(self):
+        """
+        Parent playlist name
+        """
+        if self.entry is None or self.entry['parent'] is None:
+            return None
+        for entry in self.client.catalog:
+            if entry['persistent_ID'] == self.entry['parent']:
+                return entry['name']
+        return None
+
+    @property
+    def is_smart(self):
+        """Is this smart playlist
+
+        """
+        return self.entry is not None and self.entry['smart']
+
+    @property
+    def path(self):
+        """Playlist path
+
+        """
+        return self.entry['path'] if self.entry is not None else self.name
+
+    def __read__(self, fields, start=0, end=None, where=None):
+        """Read tracks
+
+        Read tracks with given fields from metadata mirror. Returns list of (persistent ID,
+        field values dictionary) tuples with values named as requested in fields.
+        """
+        columns = []
+        for field in fields:
+            name = TRACK_FIELD_ALIASES.get(field, field)
+            if name in ('path', 'extension'):
+                name = 'location'
+            if name == 'persistent_ID':
+                continue
+            if name not in METADATA_FIELDS:
+                raise ValueError('Invalid track field: {}'.format(field))
+            if name not in columns:
+                columns.append(name)
+
+        tracks = []
+        for persistent_id, values in self.client.index_reader.read_metadata(
+                columns, self.persistent_id, start, end, where):
+            row = {}
+            for field in fields:
+                name = TRACK_FIELD_ALIASES.get(field, field)
+                if name == 'persistent_ID':
+                    value = persistent_id
+                elif name in ('path', 'extension'):
+                    value = values['location']
+                    if name == 'extension' and value is not None:
+                        value = os.path.splitext(value)[1][1:]
+                else:
+                    value = values[name]
+                row[field] = value
+            tracks.append((persistent_id, row))
+        return tracks
+
+    def fetch(self, fields=DEFAULT_FETCH_FIELDS, start=None, end=None, where=None):
+        """Fetch track fields
+
+        Fetch values of given track fields for tracks on playlist, like Playlist.fetch.
+        Where is a dictionary of field values tracks must contain.
+
+        Returns list of (persistent ID, field values dictionary) tuples in playlist order
+        """
+        return self.__read__(fields, start or 0, end, where)
+
+    def tracks(self, start=0, end=None, fields=PREFETCH_FIELDS):
+        """Get tracks in range
+
+        Return tracks in range start - end (0 based, end not included) with all fields
+        """
+        return [
+            Track(self.client, None, values=values)
+            for persistent_id, values in self.__read__(('persistent_ID', 'path') + METADATA_FIELDS, start, end)
+        ]
+
+    def find(self, **kwargs):
+        """
+        Find track with metadata field kwargs using AND filter
+        """
+        where = dict((TRACK_FIELD_ALIASES.get(key, key), value) for key, value in kwargs.items())
+        return [
+            Track(self.client, None, values=values)
+            for persistent_id, values in self.__read__(('persistent_ID', 'path') + METADATA_FIELDS, where=where)
+        ]
+
+    def add(self, files):
+        raise MusicPlayerError('Playlists can not be modified in offline mode')
+
+    def delete(self, entry):
+        raise MusicPlayerError('Playlists can not be modified in offline mode')
+
+
+class OfflinePlaylistCatalog(PlaylistCatalog):
+    """
+    Offline music player playlist catalog
+
+    Playlist catalog loaded from track index database playlist mirror
+    """
+
+    def load(self):
+        """Load catalog
+
+        Read playlists from track index database
+        """
+        entries = OrderedDict()
+        names = {}
+        for entry in self.client.index_reader.read_playlists():
+            entries[entry['persistent_ID']] = entry
+            names.setdefault(entry['name'], []).append(entry)
+        self.__entries__ = entries
+        self.__names__ = names
+
+    def playlist(self, entry):
+        """Playlist for entry
+
+        Return OfflinePlaylist object for catalog entry
+        """
+        return OfflinePlaylist(self.client, entry)
@@ -0,0 +1,161 @@
+"""
+Memory mapped track path index
+
+Read-only hash table file mapping normalized track path hashes to track persistent IDs,
+written by track index database updates. Lookups probe the memory mapped file directly
+without opening the sqlite database.
+
+File format (little endian): header with magic, version and slot count, followed by
+slot count slots of 64 bit path hash and 64 bit persistent ID. Empty slots have hash 0.
+Slot count is a power of two and collisions are resolved with linear probing.
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import unicodedata
+
+PATH_INDEX_MAGIC = b'PTPI'
+PATH_INDEX_VERSION = 1
+
+# Unicode normalization form for normalized paths. MacOS file system paths are NFD.
+PATH_NORMALIZATION = 'NFD'
+
+HEADER = struct.Struct('<4sIQ')
+SLOT = struct.Struct('<QQ')
+
+# Maximum ratio of entries to slots in hash table
+MAX_LOAD_FACTOR = 0.5
+
+
+def normalize_path(path, form=PATH_NORMALIZATION):
+    """
+    Normalize path
+
+    Return path with unicode normalization form used in index database
+    """
+    return unicodedata.normalize(form, path)
+
+
+def path_hash(normalized_path):
+    """
+    Return 64 bit hash of normalized path. Zero is reserved for empty slots.
+    """
+    value = int.from_bytes(
+        hashlib.blake2b(normalized_path.encode('utf-8', 'surrogateescape'), digest_size=8).digest(),
+        'little'
+    )
+    return value or 1
+
+
+def path_index_file(database_path):
+    """
+    Return path index file path for track index database path
+    """
+    return '{}.pathindex'.format(os.path.splitext(database_path)[0])
+
+
+def write_path_index(path, entries):
+    """
+    Write path index file
+
+    Entries must be iterable of (normalized path, persistent ID) tuples. Persistent IDs
+    that are not 16 digit uppercase hex strings are skipped, lookups for those tracks
+    fall back to sqlite.
+
+    The file is written to a temporary file in same directory and renamed over path, so
+    readers never see a partially written file. Returns number of entries written.
+    """
+    slots = []
+    for normalized_path, persistent_id in entries:
+        try:
+            value = int(persistent_id, 16)
+        except (TypeError, ValueError):
+            continue
+        if 0 <= value < 2 ** 64 and '{:016X}'.format(value) == persistent_id:
+            slots.append((path_hash(normalized_path), value))
+
+    count = 1
+    while count * MAX_LOAD_FACTOR < max(len(slots), 1):
+        count *= 2
+
+    table = bytearray(HEADER.size + count * SLOT.size)
+    HEADER.pack_into(table, 0, PATH_INDEX_MAGIC, PATH_INDEX_VERSION, count)
+    mask = count - 1
+    for key, value in slots:
+        slot = key & mask
+        while True:
+            offset = HEADER.size + slot * SLOT.size
+            existing = SLOT.unpack_from(table, offset)[0]
+            if existing == 0 or existing == key:
+                SLOT.pack_into(table, offset, key, value)
+                break
+            slot = (slot + 1) & mask
+
+    import tempfile
+    directory = os.path.dirname(path) or '.'
+    fd, tmp = tempfile.mkstemp(prefix='.{}.'.format(os.path.basename(path)), dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as fileobj:
+            fileobj.write(table)
+            fileobj.flush()
+            os.fsync(fileobj.fileno())
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return len(slots)
+
+
+class PathIndex(object):
+    """
+    Memory mapped path index
+
+    Raises OSError if file can't be opened and ValueError if file is not a valid path index
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fileobj:
+            self.__map__ = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            magic, version, count = HEADER.unpack_from(self.__map__, 0)
+        except struct.error:
+            magic, version, count = None, None, 0
+        if magic != PATH_INDEX_MAGIC or version != PATH_INDEX_VERSION or \
+                count == 0 or count & (count - 1) or len(self.__map__) != HEADER.size + count * SLOT.size:
+            self.close()
+            raise ValueError('Invalid path index file: {}'.format(path))
+        self.__mask__ = count - 1
+
+    def __repr__(self):
+        return '{}'.format(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.__map__.close()
+
+    def lookup(self, path):
+        """
+        Find track persistent ID for filename
+
+        Returns None if path was not in index
+        """
+        key = path_hash(normalize_path(os.path.realpath(path)))
+        slot = key & self.__mask__
+        while True:
+            existing, value = SLOT.unpack_from(self.__map__, HEADER.size + slot * SLOT.size)
+            if existing == key:
+                return '{:016X}'.format(value)
+            if existing == 0:
+                return None
+            slot = (slot + 1) & self.__mask__
@@ -1,10 +1,86 @@
 
 import os
-import appscript
-import mactypes
+
+from collections import deque, OrderedDict
 
 from . import MusicPlayerError
-from .track import Track
+from . import bridge
+from .constants import SKIPPED_PLAYLISTS, TRACK_FIELDS, TRACK_SYS_FIELDS
+from .track import Track, TRACK_FIELD_ALIASES, track_field_value
+
+# Default fields returned by Playlist.fetch
+DEFAULT_FETCH_FIELDS = (
+    'artist',
+    'album',
+    'name',
+    'path',
+)
+
+# Number of tracks read with one request by playlist iterator
+DEFAULT_PAGE_SIZE = 500
+
+# Number of times track field columns are read when their lengths differ
+COLUMN_READ_ATTEMPTS = 2
+
+# Track fields read in bulk for tracks returned by playlist iterator and slices
+PREFETCH_FIELDS = (
+    'persistent_ID',
+    'id',
+    'name',
+    'artist',
+    'album',
+    'year',
+    'path',
+)
+
+
+class PlaylistIterator(object):
+    """
+    Playlist track iterator
+
+    Iterates playlist tracks in pages of page_size tracks. Each page is read with range
+    references and bulk field reads, and at most one page of tracks is buffered ahead.
+    """
+
+    def __init__(self, playlist, page_size=DEFAULT_PAGE_SIZE, fields=PREFETCH_FIELDS, start=0, end=None):
+        if page_size < 1:
+            raise ValueError('Invalid page size: {}'.format(page_size))
+        self.playlist = playlist
+        self.page_size = page_size
+        self.fields = fields
+        self.position = start
+        self.end = end
+        self.__buffer__ = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.next() # noqa B305
+
+    def next(self):
+        """Next track
+
+        Return next track, reading next page of tracks when buffer is empty
+        """
+        if not self.__buffer__:
+            end = len(self.playlist)
+            if self.end is not None and self.end < end:
+                end = self.end
+            if self.position >= end:
+                raise StopIteration
+
+            page_end = min(self.position + self.page_size, end)
+            try:
+                self.__buffer__.extend(self.playlist.tracks(self.position, page_end, self.fields))
+            except IndexError:
+                raise StopIteration
+            self.position = page_end
+
+            if not self.__buffer__:
+                raise StopIteration
+
+        return self.__buffer__.popleft()
 
 
 class Playlist(object):
@@ -12,34 +88,47 @@ class Playlist(object):
     Music player playlist
 
     Abstraction of a single MacOS music player playlist
+
+    If playlist reference is given, the playlist is not looked up by name. Path, smart flag
+    and parent name can be given to avoid reading them from music player (see PlaylistCatalog).
     """
 
-    def __init__(self, client, name=None):
+    def __init__(self, client, name=None, page_size=DEFAULT_PAGE_SIZE,
+                 reference=None, path=None, smart=None, parent=None):
         self.client = client
+        self.page_size = page_size
         self.__index__ = 0
-
-        try:
-            if name is None:
-                self.playlist = self.client.get(self.client.library_playlists['library'])
-                name = 'library'
-            else:
-                self.playlist = self.client.get(self.client.user_playlists[name])
-        except appscript.reference.CommandError:
-            raise MusicPlayerError('No such playlist: {}'.format(name))
+        self.__len_cached__ = None
+        self.__path__ = path
+        self.__smart__ = smart
+        self.__parent__ = parent
+
+        if reference is not None:
+            self.playlist = reference
+        else:
+            try:
+                if name is None:
+                    self.playlist = self.client.get(self.client.library_playlists['library'])
+                    name = 'library'
+                else:
+                    self.playlist = self.client.get(self.client.user_playlists[name])
+            except bridge.CommandError:
+                raise MusicPlayerError('No such playlist: {}'.format(name))
 
         self.name = name
-        self.__update_len__()
 
     def __update_len__(self):
         try:
             self.__len_cached__ = self.client.get(self.playlist.file_tracks[-1].index)
-        except appscript.reference.CommandError:
+        except bridge.CommandError:
             self.__len_cached__ = 0
 
     def __repr__(self):
         return 'playlist:{}'.format(self.name)
 
     def __len__(self):
+        if self.__len_cached__ is None:
+            self.__update_len__()
         return self.__len_cached__
 
     def __str__(self):
@@ -52,9 +141,11 @@ class Playlist(object):
 
         Return parent playlist or playlist folder
         """
+        if self.__path__ is not None:
+            return self.__parent__
         try:
             return self.playlist.parent.get().name.get()
-        except appscript.reference.CommandError:
+        except bridge.CommandError:
             return None
 
     @property
@@ -64,6 +155,8 @@ class Playlist(object):
         Return true if this is a smart playlist
 
         """
+        if self.__smart__ is not None:
+            return self.__smart__
         return self.playlist.smart.get() and True or False
 
     @property
@@ -73,6 +166,9 @@ class Playlist(object):
         Return relative path for this playlist
 
         """
+        if self.__path__ is not None:
+            return self.__path__
+
         path = [self.name]
         try:
             p = self.playlist.parent.get()
@@ -80,7 +176,7 @@ class Playlist(object):
                 path.append(p.name.get())
                 p = p.parent.get()
 
-        except appscript.reference.CommandError:
+        except bridge.CommandError:
             pass
 
         path.reverse()
@@ -94,7 +190,7 @@ class Playlist(object):
         except AttributeError:
             pass
 
-        except appscript.reference.CommandError:
+        except bridge.CommandError:
             pass
 
         raise AttributeError('No such playlist item: {}'.format(attr))
@@ -102,14 +198,21 @@ class Playlist(object):
     def __getitem__(self, index):
         """Get track by index
 
+        Slices return list of tracks read with a single range reference
         """
+        if isinstance(index, slice):
+            start, end, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError('Playlist slices do not support step')
+            return self.tracks(start, end)
+
         try:
             index = int(index)
         except ValueError:
             raise ValueError('Invalid playlist index: {}'.format(index))
 
         if index < 0:
-            index = len(self) - index
+            index = len(self) + index
 
         try:
             index = int(index) + 1
@@ -119,12 +222,12 @@ class Playlist(object):
         except ValueError:
             self.__update_len__()
             raise ValueError('Invalid playlist index: {}'.format(index))
-        except appscript.reference.CommandError:
+        except bridge.CommandError:
             self.__update_len__()
             raise IndexError('Out of playlist: {:d}'.format(index))
 
     def __iter__(self):
-        return self
+        return PlaylistIterator(self, page_size=self.page_size)
 
     def __next__(self):
         return self.next() # noqa B305
@@ -159,6 +262,141 @@ class Playlist(object):
         self.__index__ = index + 1
         return self[self.__index__]
 
+    def __tracks_reference__(self, start, end):
+        """Tracks reference
+
+        Return reference to playlist file tracks in range start - end (0 based, end not included)
+        """
+        if start == 0 and end == len(self):
+            return self.playlist.file_tracks
+        return self.playlist.file_tracks[start + 1:end]
+
+    def __read_rows__(self, tracks, fields):
+        """Read track fields
+
+        Read given fields for all tracks in tracks reference with one request per field.
+        Other fields are not read if the first field has no values. Fields are read again if
+        the tracks change between requests.
+
+        Raises MusicPlayerError if the tracks keep changing.
+
+        Returns list of field value dictionaries
+        """
+        properties = []
+        for field in fields:
+            name = TRACK_FIELD_ALIASES.get(field, field)
+            if name in ('path', 'extension'):
+                name = 'location'
+            if name not in TRACK_SYS_FIELDS and name not in TRACK_FIELDS:
+                raise ValueError('Invalid track field: {}'.format(field))
+            if name not in properties:
+                properties.append(name)
+
+        # Columns of different length mean tracks changed between reads and rows can't be aligned
+        for attempt in range(COLUMN_READ_ATTEMPTS):
+            try:
+                columns = OrderedDict()
+                for name in properties:
+                    columns[name] = self.client.get(getattr(tracks, name))
+                    if not columns[name] and len(columns) == 1:
+                        # No matching tracks, other fields are not read
+                        columns.update((name, []) for name in properties)
+                        break
+            except bridge.CommandError as e:
+                self.__update_len__()
+                raise MusicPlayerError('Error reading tracks from {}: {}'.format(self.name, e))
+            lengths = set(len(column) for column in columns.values())
+            if len(lengths) <= 1:
+                break
+            self.__update_len__()
+        else:
+            raise MusicPlayerError('Tracks on {} changed while reading track fields'.format(self.name))
+
+        rows = []
+        for index in range(lengths.pop() if lengths else 0):
+            row = {}
+            for field in fields:
+                name = TRACK_FIELD_ALIASES.get(field, field)
+                if name in ('path', 'extension'):
+                    value = track_field_value('location', columns['location'][index])
+                    if name == 'extension' and value is not None:
+                        value = os.path.splitext(value)[1][1:]
+                else:
+                    value = track_field_value(name, columns[name][index])
+                row[field] = value
+            rows.append(row)
+        return rows
+
+    def fetch(self, fields=DEFAULT_FETCH_FIELDS, start=None, end=None, where=None):
+        """Fetch track fields
+
+        Fetch values of given track fields for all tracks on playlist, or tracks in
+        range start - end (0 based, end not included). Each field is read for all
+        tracks with a single request instead of one request per track and field.
+
+        If where filter (its test) is given, values are fetched for
+        matching tracks and range is ignored.
+
+        Fields can be any track fields or aliases, 'path' or 'extension'.
+
+        Returns list of (persistent ID, field values dictionary) tuples in playlist order.
+        Tracks on playlist more than once are returned once for each position.
+        """
+        if where is not None:
+            tracks = self.playlist.file_tracks[where]
+        else:
+            if start is None:
+                start = 0
+            if end is None or end > len(self):
+                end = len(self)
+            if start < 0 or start >= end:
+                return []
+            tracks = self.__tracks_reference__(start, end)
+
+        rows = []
+        for row in self.__read_rows__(tracks, ('persistent_ID',) + tuple(fields)):
+            if 'persistent_ID' in fields:
+                rows.append((row['persistent_ID'], row))
+            else:
+                rows.append((row.pop('persistent_ID'), row))
+        return rows
+
+    def tracks(self, start=0, end=None, fields=PREFETCH_FIELDS):
+        """Get tracks in range
+
+        Return tracks in range start - end (0 based, end not included) with one request for
+        track references and one request per prefetched field.
+        """
+        if end is None or end > len(self):
+            end = len(self)
+        if start < 0 or start >= end:
+            return []
+
+        tracks = self.__tracks_reference__(start, end)
+        try:
+            references = self.client.get(tracks)
+        except bridge.CommandError:
+            self.__update_len__()
+            raise IndexError('Out of playlist: {:d}-{:d}'.format(start, end))
+
+        rows = self.__read_rows__(tracks, fields) if fields else []
+        if len(rows) != len(references):
+            rows = [{} for reference in references]
+        return [Track(self.client, reference, values=row) for reference, row in zip(references, rows)]
+
+    def get_track(self, persistent_id):
+        """Get track by persistent ID
+
+        Raises MusicPlayerError if track is not on playlist
+        """
+        try:
+            tracks = self.client.get(self.playlist.file_tracks[bridge.its.persistent_ID == persistent_id])
+        except bridge.CommandError:
+            tracks = None
+        if not tracks:
+            raise MusicPlayerError('No such track on {}: {}'.format(self.name, persistent_id))
+        return Track(self.client, tracks[0])
+
     def add(self, files):
         """Add files to playlist
 
@@ -167,7 +405,7 @@ class Playlist(object):
         """
         if not isinstance(files, list):
             files = [files]
-        self.client.add([mactypes.Alias(entry) for entry in files], to=self.playlist)
+        self.client.add([bridge.Alias(entry) for entry in files], to=self.playlist)
         self.__update_len__()
 
     def delete(self, entry):
@@ -181,17 +419,191 @@ class Playlist(object):
             if self.__index__ > 0:
                 self.__index__ -= 1
             self.__update_len__()
-        except appscript.reference.CommandError as e:
+        except bridge.CommandError as e:
             raise MusicPlayerError('Error deleting track {}: {}'.format(entry.track, e))
 
     def find(self, **kwargs):
         """
         Find track with metadata field kwargs using AND filter
         """
-        args = [getattr(appscript.its, key).contains(value) for key, value in kwargs.items()]
+        args = [getattr(bridge.its, key).contains(value) for key, value in kwargs.items()]
         if args:
             query = args[0]
             for q in args[1:]:
                 query = query.AND(q)
 
         return [Track(self.client, track) for track in self.playlist.tracks[query].get()]
+
+
+class PlaylistCatalog(object):
+    """
+    Music player playlist catalog
+
+    Reads names, smart flags, persistent IDs and parents of all user playlists with bulk
+    requests and builds the playlist folder tree in memory. Playlists are returned as
+    Playlist objects referring to the playlist by ID, without further requests.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.__entries__ = None
+        self.__names__ = None
+
+    def __repr__(self):
+        return 'playlist catalog'
+
+    def __iter__(self):
+        return iter(self.entries.values())
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def entries(self):
+        """Catalog entries
+
+        Return OrderedDict of playlist details dictionaries by persistent ID
+        """
+        if self.__entries__ is None:
+            self.load()
+        return self.__entries__
+
+    def __read_parents__(self, playlists, folders):
+        """Read playlist parents
+
+        Persistent IDs of playlists in each folder are read with one whose request per
+        folder, so the number of requests depends on number of folders, not playlists.
+
+        Returns dictionary of parent folder persistent IDs by playlist persistent ID
+        """
+        parents = {}
+        for folder in folders:
+            try:
+                children = self.client.get(playlists[bridge.its.parent.persistent_ID == folder].persistent_ID)
+            except bridge.CommandError:
+                continue
+            for child in children:
+                parents[child] = folder
+        return parents
+
+    def load(self):
+        """Load catalog
+
+        Read all user playlists from music player
+        """
+        playlists = self.client.user_playlists
+        try:
+            ids = self.client.get(playlists.id)
+            persistent_ids = self.client.get(playlists.persistent_ID)
+            names = self.client.get(playlists.name)
+            smart = self.client.get(playlists.smart)
+            special_kinds = self.client.get(playlists.special_kind)
+        except bridge.CommandError as e:
+            raise MusicPlayerError('Error loading playlists: {}'.format(e))
+        parents = self.__read_parents__(playlists, [
+            persistent_id for persistent_id, special_kind in zip(persistent_ids, special_kinds)
+            if special_kind == bridge.k.folder
+        ])
+
+        entries = OrderedDict()
+        for playlist_id, persistent_id, name, is_smart in zip(ids, persistent_ids, names, smart):
+            entries[persistent_id] = {
+                'id': playlist_id,
+                'persistent_ID': persistent_id,
+                'name': name,
+                'smart': is_smart and True or False,
+                'parent': parents.get(persistent_id),
+            }
+
+        names = {}
+        for entry in entries.values():
+            path = [entry['name']]
+            parent = entries.get(entry['parent'])
+            while parent is not None and len(path) <= len(entries):
+                path.append(parent['name'])
+                parent = entries.get(parent['parent'])
+            path.reverse()
+            entry['path'] = os.sep.join(path)
+            names.setdefault(entry['name'], []).append(entry)
+
+        self.__entries__ = entries
+        self.__names__ = names
+
+    def reload(self):
+        """Reload catalog
+
+        Clear loaded playlist details. Catalog is loaded again on next access.
+        """
+        self.__entries__ = None
+        self.__names__ = None
+
+    def playlist(self, entry):
+        """Playlist for entry
+
+        Return Playlist object for catalog entry
+        """
+        parent = self.entries.get(entry['parent'])
+        return Playlist(
+            self.client,
+            entry['name'],
+            reference=self.client.user_playlists.ID(entry['id']),
+            path=entry['path'],
+            smart=entry['smart'],
+            parent=parent is not None and parent['name'] or None,
+        )
+
+    def find(self, name):
+        """Find playlists by name
+
+        Return list of catalog entries with given name
+        """
+        if self.__names__ is None:
+            self.load()
+        return self.__names__.get(name, [])
+
+    def get(self, name):
+        """Get playlist by name
+
+        Raises MusicPlayerError if playlist is not found
+        """
+        entries = self.find(name)
+        if not entries:
+            raise MusicPlayerError('No such playlist: {}'.format(name))
+        return self.playlist(entries[0])
+
+    def paths(self, smart=False, skipped=SKIPPED_PLAYLISTS):
+        """Playlists by path
+
+        Return list of (playlist path, Playlist object) tuples in catalog order. Playlists
+        with same path are all returned. If smart is True, only smart playlists are returned,
+        if False only other playlists and if None all playlists. Playlists with names in
+        skipped are excluded.
+        """
+        playlists = []
+        for entry in self:
+            if entry['name'] in skipped:
+                continue
+            if smart is not None and entry['smart'] != smart:
+                continue
+            playlists.append((entry['path'], self.playlist(entry)))
+        return playlists
+
+    def signatures(self):
+        """Read playlist signatures
+
+        Size and duration of all user playlists are read with bulk requests. They change when
+        tracks are added to or removed from a playlist, so changed playlists can be found
+        without reading tracks of each playlist.
+
+        Returns dictionary of (size, duration) tuples by playlist persistent ID
+        """
+        playlists = self.client.user_playlists
+        try:
+            persistent_ids = self.client.get(playlists.persistent_ID)
+            sizes = self.client.get(playlists.size)
+            durations = self.client.get(playlists.duration)
+        except bridge.CommandError as e:
+            raise MusicPlayerError('Error reading playlists: {}'.format(e))
+        if not len(persistent_ids) == len(sizes) == len(durations):
+            raise MusicPlayerError('Playlists changed while reading playlist signatures')
+        return dict(zip(persistent_ids, zip(sizes, durations)))
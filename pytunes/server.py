@@ -0,0 +1,422 @@
+"""
+Warm client server
+
+Optional local server process which keeps a connected Client, the playlist catalog and the
+track index database open, so console scripts do not pay the music player connection cost
+for every command. The server is started with pytunes-server console script and answers
+JSON-RPC 2.0 requests on a unix socket, one JSON object per line.
+
+Console scripts use the server when its socket is present and fall back to in-process
+Client when it is not. Socket path is set with PYTUNES_SERVER_SOCKET environment variable,
+and using the server is disabled with PYTUNES_SERVER=0.
+"""
+
+import inspect
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+
+from . import MusicPlayerError, __version__, bridge
+from .client import Client, PlayerSnapshot
+
+SERVER_ENVIRONMENT_VARIABLE = 'PYTUNES_SERVER'
+SOCKET_ENVIRONMENT_VARIABLE = 'PYTUNES_SERVER_SOCKET'
+DEFAULT_SOCKET_PATH = '~/Library/Application Support/Pytunes/pytunes.sock'
+
+# Seconds to wait for server connection before falling back to in-process client
+CONNECT_TIMEOUT = 0.5
+
+# Seconds to wait for a request line or a response
+REQUEST_TIMEOUT = 30
+
+# Seconds after which playlist catalog is reloaded from music player
+CATALOG_MAX_AGE = 60
+
+JSONRPC_VERSION = '2.0'
+
+# JSON-RPC 2.0 error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+SERVER_ERROR = -32000
+
+# Methods served by ClientServer
+SERVER_METHODS = (
+    'ping',
+    'status',
+    'snapshot',
+    'play',
+    'pause',
+    'stop',
+    'previous',
+    'next',
+    'shuffle',
+    'volume',
+    'playlists',
+    'reload',
+    'lookup_indexes',
+    'search',
+)
+
+
+def socket_path(path=None):
+    """
+    Return server socket path
+
+    Path defaults to PYTUNES_SERVER_SOCKET environment variable or DEFAULT_SOCKET_PATH.
+    """
+    if path is None:
+        path = os.environ.get(SOCKET_ENVIRONMENT_VARIABLE) or DEFAULT_SOCKET_PATH
+    return os.path.expandvars(os.path.expanduser(path))
+
+
+def server_enabled():
+    """
+    Check if console scripts should use the server
+    """
+    return os.environ.get(SERVER_ENVIRONMENT_VARIABLE, '1') not in ('', '0')
+
+
+class ServerClient(object):
+    """
+    Warm client server connection
+
+    Provides the playback subset of Client API with requests to the server. Errors returned
+    by the server are raised as MusicPlayerError.
+    """
+    def __init__(self, path=None, timeout=REQUEST_TIMEOUT):
+        self.path = socket_path(path)
+        self.timeout = timeout
+        self.__socket__ = None
+        self.__reader__ = None
+        self.__request_id__ = 0
+
+    def __repr__(self):
+        return 'pytunes server {}'.format(self.path)
+
+    def connect(self, timeout=CONNECT_TIMEOUT):
+        """
+        Connect to server
+
+        Raises OSError if server is not running
+        """
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.settimeout(timeout)
+        try:
+            connection.connect(self.path)
+        except OSError:
+            connection.close()
+            raise
+        connection.settimeout(self.timeout)
+        self.__socket__ = connection
+        self.__reader__ = connection.makefile('rb')
+        return self
+
+    def close(self):
+        """
+        Close server connection
+        """
+        if self.__socket__ is not None:
+            self.__reader__.close()
+            self.__socket__.close()
+            self.__socket__ = None
+            self.__reader__ = None
+
+    def call(self, method, **params):
+        """
+        Call server method
+
+        Returns method result
+        """
+        if self.__socket__ is None:
+            self.connect()
+        self.__request_id__ += 1
+        request = {
+            'jsonrpc': JSONRPC_VERSION,
+            'id': self.__request_id__,
+            'method': method,
+            'params': params,
+        }
+        try:
+            self.__socket__.sendall('{}\n'.format(json.dumps(request)).encode('utf-8'))
+            line = self.__reader__.readline()
+        except OSError as e:
+            self.close()
+            raise MusicPlayerError('Error calling {}: {}'.format(self, e))
+        if not line:
+            self.close()
+            raise MusicPlayerError('Connection to {} closed'.format(self))
+        try:
+            response = json.loads(line.decode('utf-8'))
+        except ValueError as e:
+            raise MusicPlayerError('Invalid response from {}: {}'.format(self, e))
+        if response.get('error') is not None:
+            raise MusicPlayerError(response['error'].get('message'))
+        return response.get('result')
+
+    @property
+    def status(self):
+        return self.call('status')
+
+    def snapshot(self, track=True):
+        return PlayerSnapshot(**self.call('snapshot', track=track))
+
+    def play(self, path=None):
+        if path is not None:
+            path = os.path.abspath(path)
+        self.call('play', path=path)
+
+    def pause(self):
+        self.call('pause')
+
+    def stop(self):
+        self.call('stop')
+
+    def previous(self):
+        self.call('previous')
+
+    def next(self):
+        self.call('next')
+
+    @property
+    def shuffle(self):
+        return self.call('shuffle')
+
+    @shuffle.setter
+    def shuffle(self, value):
+        self.call('shuffle', value=value)
+
+    @property
+    def volume(self):
+        return self.call('volume')
+
+    @volume.setter
+    def volume(self, value):
+        self.call('volume', value=value)
+
+    def playlists(self, smart=False):
+        """
+        Return playlist paths from server playlist catalog
+        """
+        return self.call('playlists', smart=smart)
+
+    def lookup_indexes(self, paths):
+        """
+        Lookup track persistent IDs for paths from server index database
+
+        Paths are sent as absolute paths. Returns list of (path, persistent ID) tuples.
+        """
+        results = self.call('lookup_indexes', paths=[os.path.abspath(path) for path in paths])
+        return [tuple(result) for result in results]
+
+
+def connect_server(path=None):
+    """
+    Connect to warm client server
+
+    Returns connected ServerClient, or None if server is disabled or not running.
+    """
+    if not server_enabled():
+        return None
+    try:
+        return ServerClient(path).connect()
+    except OSError:
+        return None
+
+
+class ClientRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Handle JSON-RPC requests from one connection
+    """
+    timeout = REQUEST_TIMEOUT
+
+    def handle(self):
+        while True:
+            try:
+                line = self.rfile.readline()
+            except OSError:
+                return
+            if not line:
+                return
+            response = self.server.process(line)
+            if response is None:
+                continue
+            try:
+                self.wfile.write('{}\n'.format(json.dumps(response, default=str)).encode('utf-8'))
+            except OSError:
+                return
+
+
+class ClientServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Warm client server
+
+    Each connection is handled in its own thread, so an idle connection does not block other
+    clients. Requests are processed one at a time while holding lock, because the music player
+    client and index database connections are shared by all connections. Socket is readable
+    only by the user running the server.
+
+    Raises MusicPlayerError if another server is running with the same socket.
+    """
+    daemon_threads = True
+
+    def __init__(self, path=None, client=None):
+        self.path = socket_path(path)
+        self.lock = threading.Lock()
+        self.__catalog_loaded__ = None
+
+        if os.path.exists(self.path):
+            try:
+                ServerClient(self.path).connect().close()
+            except OSError:
+                os.unlink(self.path)
+            else:
+                raise MusicPlayerError('Server is already running: {}'.format(self.path))
+        self.client = client if client is not None else Client()
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        umask = os.umask(0o177)
+        try:
+            super().__init__(self.path, ClientRequestHandler)
+        finally:
+            os.umask(umask)
+
+    def __repr__(self):
+        return 'pytunes server {}'.format(self.path)
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def warm(self):
+        """
+        Connect to music player, load playlist catalog and open index database
+        """
+        self.client.snapshot(track=False)
+        len(self.catalog)
+        try:
+            self.client.index_reader.reader
+        except MusicPlayerError:
+            pass
+
+    @property
+    def catalog(self):
+        """Playlist catalog
+
+        Reloaded when older than CATALOG_MAX_AGE seconds
+        """
+        catalog = self.client.catalog
+        if self.__catalog_loaded__ is None or time.monotonic() - self.__catalog_loaded__ > CATALOG_MAX_AGE:
+            catalog.reload()
+            self.__catalog_loaded__ = time.monotonic()
+        return catalog
+
+    def process(self, line):
+        """
+        Process one JSON-RPC request line
+
+        Methods are called while holding lock. Parameters not matching method signature are
+        returned as invalid parameters error, and errors raised by the method as server error.
+
+        Returns response dictionary, or None for notifications
+        """
+        try:
+            request = json.loads(line.decode('utf-8'))
+        except ValueError as e:
+            return self.error(None, PARSE_ERROR, 'Parse error: {}'.format(e))
+        if not isinstance(request, dict) or not isinstance(request.get('method'), str):
+            return self.error(None, INVALID_REQUEST, 'Invalid request')
+
+        request_id = request.get('id')
+        method = request['method']
+        params = request.get('params') or {}
+        if method not in SERVER_METHODS:
+            return self.error(request_id, METHOD_NOT_FOUND, 'Method not found: {}'.format(method))
+        if not isinstance(params, dict):
+            return self.error(request_id, INVALID_PARAMS, 'Parameters must be an object')
+
+        function = getattr(self, 'rpc_{}'.format(method))
+        try:
+            inspect.signature(function).bind(**params)
+        except TypeError as e:
+            return self.error(request_id, INVALID_PARAMS, 'Invalid parameters: {}'.format(e))
+
+        try:
+            with self.lock:
+                result = function(**params)
+        except (MusicPlayerError, bridge.CommandError) as e:
+            return self.error(request_id, SERVER_ERROR, str(e))
+        except Exception as e:
+            return self.error(request_id, SERVER_ERROR, 'Error in {}: {}'.format(method, e))
+        if 'id' not in request:
+            return None
+        return {'jsonrpc': JSONRPC_VERSION, 'id': request_id, 'result': result}
+
+    @staticmethod
+    def error(request_id, code, message):
+        return {'jsonrpc': JSONRPC_VERSION, 'id': request_id, 'error': {'code': code, 'message': message}}
+
+    def rpc_ping(self):
+        return {'pid': os.getpid(), 'version': __version__}
+
+    def rpc_status(self):
+        return self.client.status
+
+    def rpc_snapshot(self, track=True):
+        snapshot = self.client.snapshot(track=track)
+        return dict(snapshot._asdict(), track=dict(snapshot.track) if snapshot.track is not None else None)
+
+    def rpc_play(self, path=None):
+        self.client.play(path)
+
+    def rpc_pause(self):
+        self.client.pause()
+
+    def rpc_stop(self):
+        self.client.stop()
+
+    def rpc_previous(self):
+        self.client.previous()
+
+    def rpc_next(self):
+        self.client.next()
+
+    def rpc_shuffle(self, value=None):
+        if value is not None:
+            self.client.shuffle = value
+        return self.client.shuffle
+
+    def rpc_volume(self, value=None):
+        if value is not None:
+            self.client.volume = value
+        return self.client.volume
+
+    def rpc_playlists(self, smart=False):
+        return [path for path, playlist in self.catalog.paths(smart=smart)]
+
+    def rpc_reload(self):
+        self.__catalog_loaded__ = None
+
+    def rpc_lookup_indexes(self, paths):
+        # Relative paths would be resolved against server working directory
+        for path in paths:
+            if not os.path.isabs(path):
+                raise MusicPlayerError('Lookup paths must be absolute: {}'.format(path))
+        return list(self.client.index_reader.lookup_indexes(paths))
+
+    def rpc_search(self, text, fields=None, limit=None):
+        kwargs = {}
+        if fields is not None:
+            kwargs['fields'] = fields
+        if limit is not None:
+            kwargs['limit'] = limit
+        return self.client.index_reader.search(text, **kwargs)
@@ -6,12 +6,13 @@ Song change monitoring and XML reporting class
 import os
 import time
 import base64
-import appscript
 
 from lxml.builder import E
 
 from . import MusicPlayerError
+from . import bridge
 from .client import Client
+from .track import Track
 from systematic.shell import normalized
 
 INFO_KEY_ORDER = (
@@ -56,6 +57,140 @@ IGNORE_TRACK_FIELDS = (
     'location',
 )
 
+# Maximum delay between status polls when player is stopped or paused, in seconds
+IDLE_POLL_INTERVAL = 15
+
+# Maximum delay between status polls when track is playing, in seconds. Manual skips,
+# pauses and stops are noticed at most this late, so skipped tracks are not missed by
+# pytunesd history. Longer delays would save Apple Events on long tracks.
+PLAYING_POLL_INTERVAL = 5
+
+# Delay between status polls near expected track end, in seconds
+TRANSITION_POLL_INTERVAL = 0.25
+
+# Start polling with TRANSITION_POLL_INTERVAL this many seconds before expected track end
+TRANSITION_LEAD_TIME = 1
+
+
+class PollScheduler(object):
+    """Status polling scheduler
+
+    Schedules music player status polls based on last player snapshot. Polls are
+    sent with increasing delays up to idle_interval when player is stopped or paused.
+    When track is playing, scheduler sleeps until lead_time seconds before expected
+    end of track and polls every fast_interval after that. The sleep is max_interval at
+    most, which limits the delay in noticing manual track changes and pauses.
+
+    Clock and sleep functions can be replaced for simulations.
+
+    Counters contain number of polls, detected changes and total and maximum
+    change detection latency in seconds.
+    """
+
+    def __init__(self,
+                 interval=1,
+                 idle_interval=IDLE_POLL_INTERVAL,
+                 max_interval=PLAYING_POLL_INTERVAL,
+                 fast_interval=TRANSITION_POLL_INTERVAL,
+                 lead_time=TRANSITION_LEAD_TIME,
+                 clock=time.monotonic,
+                 sleep=time.sleep):
+        self.interval = interval
+        self.idle_interval = idle_interval
+        self.max_interval = max_interval
+        self.fast_interval = fast_interval
+        self.lead_time = lead_time
+        self.clock = clock
+        self.sleep = sleep
+
+        self.counters = {
+            'polls': 0,
+            'changes': 0,
+            'latency_total': 0.0,
+            'latency_max': 0.0,
+        }
+
+        self.__snapshot__ = None
+        self.__last_poll__ = None
+        self.__expected_end__ = None
+        self.__idle_delay__ = interval
+
+    def poll(self, snapshot):
+        """Register poll
+
+        Register player snapshot returned by a status poll. Snapshot is None if
+        polling failed.
+        """
+        now = self.clock()
+        self.counters['polls'] += 1
+        self.__snapshot__ = snapshot
+        self.__last_poll__ = now
+
+        if snapshot is None or snapshot.status != 'playing':
+            self.__expected_end__ = None
+            return
+
+        self.__idle_delay__ = self.interval
+        if snapshot.duration is not None and snapshot.position is not None:
+            self.__expected_end__ = now + max(snapshot.duration - snapshot.position, 0)
+        else:
+            self.__expected_end__ = None
+
+    def changed(self, expected_end=None, previous_poll=None):
+        """Register detected change
+
+        Register status or track change detected by last poll. Detection latency is
+        the time since expected track end, or since previous poll if the change was
+        not expected.
+        """
+        now = self.clock()
+        self.counters['changes'] += 1
+        self.__idle_delay__ = self.interval
+
+        if previous_poll is None:
+            return 0.0
+        if expected_end is not None and previous_poll < expected_end <= now:
+            latency = now - expected_end
+        else:
+            latency = now - previous_poll
+
+        self.counters['latency_total'] += latency
+        self.counters['latency_max'] = max(self.counters['latency_max'], latency)
+        return latency
+
+    @property
+    def expected_end(self):
+        return self.__expected_end__
+
+    @property
+    def last_poll(self):
+        return self.__last_poll__
+
+    def delay(self):
+        """Delay before next poll
+
+        Return delay in seconds before next status poll
+        """
+        snapshot = self.__snapshot__
+        if snapshot is None or snapshot.status != 'playing':
+            delay = self.__idle_delay__
+            self.__idle_delay__ = min(self.__idle_delay__ * 2, self.idle_interval)
+            return delay
+
+        if self.__expected_end__ is None:
+            return self.interval
+
+        remaining = self.__expected_end__ - self.clock()
+        if remaining > self.lead_time:
+            return min(remaining - self.lead_time, self.max_interval)
+        return self.fast_interval
+
+    def wait(self):
+        """Wait for next poll
+
+        """
+        self.sleep(self.delay())
+
 
 class musicPlayerStatus(object):
     """Song status change monitoring
@@ -63,22 +198,41 @@ class musicPlayerStatus(object):
     This class can monitor status of currently playing track and
     return track change information with next() iterator, when current
     track changes.
+
+    With adaptive polling, status is polled with PollScheduler based on
+    player state and track end time. Otherwise status is polled every
+    interval seconds.
     """
 
-    def __init__(self, interval=1, xml_output=False, export_albumart=False):
+    def __init__(self, interval=1, xml_output=False, export_albumart=False, adaptive=True, scheduler=None):
         self.interval = int(interval)
         self.xml_output = xml_output
         self.export_albumart = export_albumart
 
+        if scheduler is None:
+            if adaptive:
+                scheduler = PollScheduler(interval=self.interval)
+            else:
+                scheduler = PollScheduler(
+                    interval=self.interval,
+                    idle_interval=self.interval,
+                    max_interval=self.interval,
+                    fast_interval=self.interval,
+                    lead_time=0,
+                )
+        self.scheduler = scheduler
+
         self.__last_checked__ = None
 
         try:
             self.client = Client()
             try:
-                self.current = self.client.current_track
-                self.status = self.client.status
-            except appscript.reference.CommandError:
+                snapshot = self.client.snapshot()
+                self.current = self.__current_track__(snapshot)
+                self.status = snapshot.status
+            except bridge.CommandError:
                 self.current = None
+                self.status = None
         except MusicPlayerError:
             self.client = None
             self.current = None
@@ -87,72 +241,116 @@ class musicPlayerStatus(object):
     def __iter__(self):
         return self
 
+    def __current_track__(self, snapshot):
+        """Current track for snapshot
+
+        Return current track with properties from snapshot, or None if no track is selected.
+        Track refers to the library track by persistent ID, so no events are sent.
+        """
+        if snapshot.persistent_ID is None:
+            return None
+        return Track(self.client, self.client.track_reference(snapshot.persistent_ID), values=snapshot.track)
+
+    @property
+    def counters(self):
+        """Polling counters
+
+        Return poll count and change detection latency counters from scheduler
+        """
+        return self.scheduler.counters
+
     def next(self):
         """Return song info on song change
 
-        Iterate current object, sleeping self.interval time and returning
-        status and XML formatted track information when song is changed.
+        Iterate current object, sleeping between polls as scheduled by
+        self.scheduler and returning status and XML formatted track
+        information when song is changed.
+
+        Each check reads a single player state snapshot.
         """
         while True:
+            expected_end = self.scheduler.expected_end
+            previous_poll = self.scheduler.last_poll
+            snapshot = None
             try:
                 if self.client is None:
                     self.client = Client()
 
-                n = self.client.current_track
-                if self.client.status != self.status:
-                    self.status = self.client.status
+                snapshot = self.client.snapshot()
+                self.scheduler.poll(snapshot)
+
+                changed = snapshot.persistent_ID is not None and (
+                    self.current is None or snapshot.persistent_ID != self.current.persistent_ID
+                )
+                if changed:
+                    self.current = self.__current_track__(snapshot)
+
+                if snapshot.status != self.status:
+                    self.status = snapshot.status
+                    self.scheduler.changed(expected_end, previous_poll)
 
                     if self.status == 'playing':
-                        return self.status, self.songinfo(n)
+                        return self.status, self.songinfo(snapshot=snapshot)
                     else:
                         return self.status, None
 
-                if n is not None:
-                    if self.current is None or n.id != self.current.id:
-                        self.current = n
-                        return self.client.status, self.songinfo(n)
+                if changed:
+                    self.scheduler.changed(expected_end, previous_poll)
+                    return snapshot.status, self.songinfo(snapshot=snapshot)
 
             except MusicPlayerError:
                 self.client = None
-                pass
-            except appscript.reference.CommandError:
-                pass
+                if snapshot is None:
+                    self.scheduler.poll(None)
+            except bridge.CommandError:
+                if snapshot is None:
+                    self.scheduler.poll(None)
 
-            time.sleep(self.interval)
+            self.scheduler.wait()
 
-    def songinfo(self, track=None, xml_output=False, export_albumart=False):
+    def songinfo(self, track=None, xml_output=False, export_albumart=False, snapshot=None):
         """Current playing track info
 
         Return current playing track information as XML or None if no
         track was selected.
+
+        If snapshot is given, player state and current track properties are
+        taken from the snapshot instead of reading them from the player.
         """
 
         try:
-            if self.client.status in ('stopped', 'paused'):
+            if snapshot is None:
+                snapshot = self.client.snapshot(track=track is None)
+
+            if snapshot.status in ('stopped', 'paused'):
                 return None
 
-            if not track:
-                track = self.client.current_track
+            if track:
+                properties = track.properties()
+            elif snapshot.track is not None:
+                properties = snapshot.track
+            else:
+                return None
 
-            started = time.mktime(time.localtime()) - self.client.player_position()
+            started = time.mktime(time.localtime()) - (snapshot.position or 0)
             info = {
-                'path': track.path,
+                'path': properties.get('path'),
                 'started': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started)),
-                'album_artist':  track.album_artist,
-                'artist':  track.artist,
-                'album': track.album,
-                'name': track.name,
-                'comment': track.comment,
-                'genre': track.genre,
-                'length': track.time,
-                'track_number': track.track_number,
-                'track_count': track.track_count,
+                'album_artist':  properties.get('album_artist'),
+                'artist':  properties.get('artist'),
+                'album': properties.get('album'),
+                'name': properties.get('name'),
+                'comment': properties.get('comment'),
+                'genre': properties.get('genre'),
+                'length': properties.get('time'),
+                'track_number': properties.get('track_number'),
+                'track_count': properties.get('track_count'),
             }
 
-            if track.year != 0:
-                info['year'] = track.year
+            if properties.get('year', 0) != 0:
+                info['year'] = properties['year']
 
-            albumart = os.path.join(os.path.dirname(normalized(track.path)), 'artwork.jpg')
+            albumart = os.path.join(os.path.dirname(normalized(info['path'])), 'artwork.jpg')
             if os.path.isfile(albumart):
                 info['artwork'] = os.path.realpath(albumart)
 
@@ -161,7 +359,7 @@ class musicPlayerStatus(object):
 
             xml = E(
                 'pytunes',
-                persistent_ID=track.persistent_ID,
+                persistent_ID=properties.get('persistent_ID'),
                 started=info['started']
             )
 
@@ -194,8 +392,7 @@ class musicPlayerStatus(object):
                 except ValueError:
                     print('ERROR encoding key {} type {}: {}'.format(k, type(v), v))
 
-            for k in sorted(track.keys()):
-                v = track[k]
+            for k, v in sorted(properties.items()):
                 if k in INFO_KEY_ORDER or k in IGNORE_TRACK_FIELDS:
                     continue
 
@@ -0,0 +1,292 @@
+"""
+Timing traces
+
+Named, nested timing spans for console scripts. Tracing is enabled with --profile option
+of console scripts or PYTUNES_PROFILE environment variable, and the trace is written at
+exit in one of the formats:
+
+summary    human readable span timings by span path
+json       JSON trace with all spans
+collapsed  collapsed stacks with span self times in microseconds for flamegraph tools
+cprofile   cProfile statistics, written as pstats file or as text without output file
+
+Trace is written to file given with --profile-output option or PYTUNES_PROFILE_OUTPUT
+environment variable, or to stderr. Spans are no-ops when tracing is disabled.
+"""
+
+import atexit
+import os
+import sys
+import threading
+import time
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+PROFILE_ENVIRONMENT_VARIABLE = 'PYTUNES_PROFILE'
+PROFILE_OUTPUT_ENVIRONMENT_VARIABLE = 'PYTUNES_PROFILE_OUTPUT'
+PROFILE_ARGUMENT = '--profile'
+PROFILE_OUTPUT_ARGUMENT = '--profile-output'
+
+PROFILE_FORMATS = (
+    'summary',
+    'json',
+    'collapsed',
+    'cprofile',
+)
+DEFAULT_PROFILE_FORMAT = 'summary'
+
+# Number of functions in cProfile text output
+CPROFILE_REPORT_ROWS = 40
+
+__tracer__ = None
+
+
+class NullSpan(object):
+    """
+    Span context when tracing is disabled
+    """
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *args):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span(object):
+    """
+    Timing span
+
+    Time is measured with time.perf_counter
+    """
+    __slots__ = ('name', 'attributes', 'start', 'end', 'children')
+
+    def __init__(self, name, attributes=None, start=None):
+        self.name = name
+        self.attributes = attributes or {}
+        self.start = start if start is not None else time.perf_counter()
+        self.end = None
+        self.children = []
+
+    def __repr__(self):
+        return '{} {:.3f}s'.format(self.name, self.seconds)
+
+    @property
+    def seconds(self):
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    @property
+    def self_seconds(self):
+        return self.seconds - sum(child.seconds for child in self.children)
+
+    def as_dict(self, origin):
+        return {
+            'name': self.name,
+            'start': self.start - origin,
+            'seconds': self.seconds,
+            'attributes': self.attributes,
+            'children': [child.as_dict(origin) for child in self.children],
+        }
+
+
+class Tracer(object):
+    """
+    Span tracer
+
+    Spans are recorded from the thread which created the tracer. Spans opened in other
+    threads are not recorded.
+    """
+    def __init__(self, name):
+        self.root = Span(name)
+        self.stack = [self.root]
+        self.thread = threading.get_ident()
+        self.started = time.time()
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """
+        Record span as child of currently open span
+        """
+        span = Span(name, attributes)
+        self.stack[-1].children.append(span)
+        self.stack.append(span)
+        try:
+            yield span
+        finally:
+            span.end = time.perf_counter()
+            self.stack.pop()
+
+    def finish(self):
+        """
+        End all open spans
+        """
+        now = time.perf_counter()
+        for span in self.stack:
+            if span.end is None:
+                span.end = now
+
+    def paths(self):
+        """
+        Return span counts and times by span path
+
+        Returns ordered dictionary with tuples of span names as keys, and lists with count,
+        total seconds and self seconds as values in order of first occurrence.
+        """
+        paths = OrderedDict()
+
+        def add(span, parent):
+            path = parent + (span.name,)
+            if path not in paths:
+                paths[path] = [0, 0.0, 0.0]
+            paths[path][0] += 1
+            paths[path][1] += span.seconds
+            paths[path][2] += span.self_seconds
+            for child in span.children:
+                add(child, path)
+
+        add(self.root, ())
+        return paths
+
+    def summary(self):
+        """
+        Return human readable summary of span times
+        """
+        lines = ['{:>10s} {:>10s} {:>8s}  {}'.format('seconds', 'self', 'count', 'span')]
+        for path, (count, seconds, self_seconds) in self.paths().items():
+            lines.append('{:10.3f} {:10.3f} {:8d}  {}{}'.format(
+                seconds,
+                self_seconds,
+                count,
+                '  ' * (len(path) - 1),
+                path[-1],
+            ))
+        return '\n'.join(lines)
+
+    def as_dict(self):
+        """
+        Return trace as dictionary
+        """
+        return {
+            'name': self.root.name,
+            'started': self.started,
+            'pid': os.getpid(),
+            'spans': self.root.as_dict(self.root.start),
+        }
+
+    def collapsed(self):
+        """
+        Return span self times in collapsed stack format used by flamegraph tools
+        """
+        return '\n'.join(
+            '{} {:d}'.format(';'.join(path), int(self_seconds * 1000000))
+            for path, (count, seconds, self_seconds) in self.paths().items()
+        )
+
+
+def span(name, **attributes):
+    """
+    Return timing span context for name
+
+    Spans are nested in spans open when entered. Returns no-op context when tracing is not
+    enabled.
+    """
+    tracer = __tracer__
+    if tracer is None or tracer.thread != threading.get_ident():
+        return NULL_SPAN
+    return tracer.span(name, **attributes)
+
+
+def enable(name, format=DEFAULT_PROFILE_FORMAT, output=None):
+    """
+    Enable tracing
+
+    Trace is written in given format to output file, or to stderr, at exit.
+    """
+    global __tracer__
+    if format not in PROFILE_FORMATS:
+        raise ValueError('Invalid profile format: {}'.format(format))
+    if __tracer__ is not None:
+        return __tracer__
+
+    __tracer__ = Tracer(name)
+    profile = None
+    if format == 'cprofile':
+        import cProfile
+        profile = cProfile.Profile()
+        profile.enable()
+
+    def write_trace():
+        __tracer__.finish()
+        if profile is not None:
+            profile.disable()
+            if output:
+                profile.dump_stats(output)
+                return
+            import pstats
+            stats = pstats.Stats(profile, stream=sys.stderr)
+            stats.sort_stats('cumulative').print_stats(CPROFILE_REPORT_ROWS)
+            return
+
+        if format == 'json':
+            import json
+            data = json.dumps(__tracer__.as_dict(), indent=2)
+        elif format == 'collapsed':
+            data = __tracer__.collapsed()
+        else:
+            data = __tracer__.summary()
+        if output:
+            with open(output, 'w') as fileobj:
+                fileobj.write('{}\n'.format(data))
+        else:
+            sys.stderr.write('{}\n'.format(data))
+            sys.stderr.flush()
+
+    atexit.register(write_trace)
+    return __tracer__
+
+
+def add_profile_arguments(script, argv=None):
+    """
+    Add --profile and --profile-output options to console script
+
+    The options are handled before arguments are parsed and removed from argv, so tracing
+    starts before script subcommands are created and the options can be given anywhere in
+    command line. Tracing is also enabled by PYTUNES_PROFILE environment variable with
+    profile format as value.
+    """
+    if argv is None:
+        argv = sys.argv
+    script.add_argument(PROFILE_ARGUMENT, nargs='?', const=DEFAULT_PROFILE_FORMAT, choices=PROFILE_FORMATS,
+                        help='Write timing profile at exit')
+    script.add_argument(PROFILE_OUTPUT_ARGUMENT, help='Timing profile output file')
+
+    format = os.environ.get(PROFILE_ENVIRONMENT_VARIABLE) or None
+    output = os.environ.get(PROFILE_OUTPUT_ENVIRONMENT_VARIABLE) or None
+    arguments = [argv[0]]
+    index = 1
+    while index < len(argv):
+        argument = argv[index]
+        if argument == PROFILE_ARGUMENT:
+            format = DEFAULT_PROFILE_FORMAT
+            if index + 1 < len(argv) and argv[index + 1] in PROFILE_FORMATS:
+                format = argv[index + 1]
+                index += 1
+        elif argument.startswith(PROFILE_ARGUMENT + '='):
+            format = argument.split('=', 1)[1]
+        elif argument == PROFILE_OUTPUT_ARGUMENT and index + 1 < len(argv):
+            output = argv[index + 1]
+            index += 1
+        elif argument.startswith(PROFILE_OUTPUT_ARGUMENT + '='):
+            output = argument.split('=', 1)[1]
+        else:
+            arguments.append(argument)
+        index += 1
+    argv[:] = arguments
+
+    if format is not None:
+        if format not in PROFILE_FORMATS:
+            script.exit(1, 'Invalid profile format: {}'.format(format))
+        enable(os.path.basename(argv[0]), format, output)
@@ -1,9 +1,10 @@
 
-import appscript
 import os
 import re
+import time
 
 from . import MusicPlayerError
+from . import bridge
 
 from .constants import (
     TRACK_FIELDS,
@@ -14,30 +15,106 @@ from .constants import (
     MUSIC_APP_IGNORED_FIELDS
 )
 
+# Aliases accepted for track fields in addition to the appscript property names
+TRACK_FIELD_ALIASES = {
+    'ID': 'id',
+    'date': 'year',
+    'title': 'name',
+}
+
+
+def track_field_value(field, value):
+    """Convert track field value
+
+    Convert a value returned by appscript for track property field to python value
+    """
+    if value == bridge.k.missing_value:
+        value = None
+
+    try:
+        if field in TRACK_INT_FIELDS:
+            return int(value)
+        elif field in TRACK_FLOAT_FIELDS:
+            return float(value)
+        elif field in TRACK_DATE_FIELDS:
+            return value
+        elif field == 'location':
+            return value.path
+        return str(value)
+
+    except AttributeError:
+        return value
+    except TypeError:
+        return value
+
+
+def track_record_values(record):
+    """Convert track properties record
+
+    Convert track properties record returned by appscript to dictionary of python values
+    by field name. Path is set from track location.
+    """
+    values = {}
+    for key, value in record.items():
+        field = getattr(key, 'name', key)
+        if field in TRACK_SYS_FIELDS or field in TRACK_FIELDS:
+            values[field] = track_field_value(field, value)
+    if 'location' in values:
+        values['path'] = values['location']
+    return values
+
 
 class Track(object):
     """
     Track in music player library
+
+    Track field values are cached on first read or prefilled from values dictionary. If
+    cache_ttl is given, cached values expire after cache_ttl seconds. Call refresh() to
+    clear the cache.
     """
 
-    def __init__(self, client, track):
+    def __init__(self, client, track, cache_ttl=None, values=None):
         self.client = client
         self.track = track
+        self.cache_ttl = cache_ttl
+        self.__dict__['__cache__'] = {}
+        self.__dict__['__properties_loaded__'] = None
 
-        try:
-            self.path = self.client.get(self.track.location).path
-        except AttributeError:
-            self.path = None
-        except appscript.reference.CommandError:
-            self.path = None
+        if values is not None:
+            for item, value in values.items():
+                self.__set_cached__(TRACK_FIELD_ALIASES.get(item, item), value)
+            if all(key in self.__cache__ for key in self.keys()):
+                self.__dict__['__properties_loaded__'] = time.monotonic()
 
     def __repr__(self):
+        properties = self.properties()
         return '{} - {} - {}'.format(
-            self.artist,
-            self.album,
-            self.title,
+            properties.get('artist'),
+            properties.get('album'),
+            properties.get('name'),
         )
 
+    @property
+    def path(self):
+        """Track file path
+
+        Resolved from track location on first access
+        """
+        try:
+            return self.__get_cached__('path')
+        except KeyError:
+            pass
+
+        try:
+            path = self.client.get(self.track.location).path
+        except AttributeError:
+            path = None
+        except bridge.CommandError:
+            path = None
+
+        self.__set_cached__('path', path)
+        return path
+
     def __getattr__(self, attr):
         try:
             return self[attr]
@@ -52,38 +129,22 @@ class Track(object):
         if item == 'extension':
             return os.path.splitext(self.path)[1][1:]
 
-        if item in ('id', 'ID'):
-            item = 'id'
-
-        if item in ('date', 'year'):
-            item = 'year'
-
-        if item in ('title', 'name'):
-            item = 'name'
+        item = TRACK_FIELD_ALIASES.get(item, item)
 
         try:
-            value = self.client.get(self.track.__getattr__(item))
-            if value == appscript.k.missing_value:
-                value = None
+            return self.__get_cached__(item)
+        except KeyError:
+            pass
 
-            try:
-                if item in TRACK_INT_FIELDS:
-                    return int(value)
-                elif item in TRACK_FLOAT_FIELDS:
-                    return float(value)
-                elif item in TRACK_DATE_FIELDS:
-                    return value
-                elif item == 'location':
-                    return value.path
-                return str(value)
-
-            except AttributeError:
-                return value
+        try:
+            value = track_field_value(item, self.client.get(self.track.__getattr__(item)))
+            self.__set_cached__(item, value)
+            return value
 
         except AttributeError:
             pass
 
-        except appscript.reference.CommandError:
+        except bridge.CommandError:
             return None
 
         raise KeyError('Invalid Track item: {}'.format(item))
@@ -103,18 +164,41 @@ class Track(object):
             try:
                 entry = self.track.__getattr__(item)
                 self.client.set(entry, to=value)
-            except appscript.reference.CommandError as e:
+            except bridge.CommandError as e:
                 raise ValueError('ERROR setting {} to {}: {}'.format(item, value, e))
+            self.__set_cached__(item, value)
 
         elif item in TRACK_SYS_FIELDS:
             raise ValueError('Track attribute {} is read-only'.format(item))
 
-        elif item in ('client', 'track', 'path', 'log'):
+        elif item == 'path':
+            self.__set_cached__(item, value)
+
+        elif item in ('client', 'track', 'log', 'cache_ttl'):
             self.__dict__[item] = value
 
         else:
             raise AttributeError('Invalid Track attribute: {}'.format(item))
 
+    def __get_cached__(self, item):
+        """Get cached value
+
+        Returns cached value for item. Raises KeyError if item is not cached or cached value
+        is older than self.cache_ttl seconds.
+        """
+        value, updated = self.__cache__[item]
+        if self.cache_ttl is not None and time.monotonic() - updated > self.cache_ttl:
+            del self.__cache__[item]
+            raise KeyError(item)
+        return value
+
+    def __set_cached__(self, item, value, updated=None):
+        """Set cached value
+
+        Stores value for item with time.monotonic() time it was read, or given updated time.
+        """
+        self.__cache__[item] = (value, time.monotonic() if updated is None else updated)
+
     def updateTracknumber(self):
         """Update tracknumber
 
@@ -204,9 +288,40 @@ class Track(object):
     def refresh(self):
         """Refresh trck
 
+        Clears cached track values and refreshes track in music player
         """
+        self.__cache__.clear()
+        self.__dict__['__properties_loaded__'] = None
         self.client.refresh(self.track)
 
+    def properties(self):
+        """Track properties
+
+        Read all track properties with a single request and return values of fields in
+        self.keys() as dictionary. The properties are cached on the track after first call.
+        """
+        loaded = self.__properties_loaded__
+        if loaded is None or self.cache_ttl is not None and time.monotonic() - loaded > self.cache_ttl:
+            try:
+                record = self.client.get(self.track.properties)
+            except bridge.CommandError as e:
+                raise MusicPlayerError('Error reading track properties: {}'.format(e))
+
+            loaded = time.monotonic()
+            values = track_record_values(record)
+            for key in self.keys():
+                if key in values:
+                    self.__set_cached__(key, values[key], loaded)
+            self.__dict__['__properties_loaded__'] = loaded
+
+        properties = {}
+        for key in self.keys():
+            if key == 'path':
+                properties[key] = self.path
+            elif key in self.__cache__:
+                properties[key] = self.__cache__[key][0]
+        return properties
+
     def keys(self):
         keys = ['path']
         keys.extend(TRACK_SYS_FIELDS)
@@ -217,10 +332,4 @@ class Track(object):
         return keys
 
     def items(self):
-        items = []
-        for k in self.keys():
-            try:
-                items.append([k, self.__getattr__(k)])
-            except appscript.reference.CommandError:
-                pass
-        return items
+        return [[k, v] for k, v in self.properties().items()]
@@ -0,0 +1,33 @@
+"""
+Music library file tree
+"""
+
+import os
+
+from oodi.library.tree import Tree
+
+from . import MusicPlayerError
+from .client import detect_app
+
+
+class MusicTree(Tree):
+    """
+    MacOS music tree, representing one folder on disk configured as music player library path
+    """
+    def __init__(self, tree_path=None):
+        app, config = detect_app()
+
+        if tree_path is None:
+            tree_path_file = os.path.join(config['data_directory'], config['library_path_filename'])
+            if os.path.isfile(tree_path_file):
+                try:
+                    tree_path = open(tree_path_file, 'r').read().strip()
+                except IOError as e:
+                    raise MusicPlayerError('Error opening {}: {}'.format(tree_path, e))
+                except OSError as e:
+                    raise MusicPlayerError('Error opening {}: {}'.format(tree_path, e))
+
+            else:
+                tree_path = config['music_directory']
+
+        Tree.__init__(self, path=tree_path)
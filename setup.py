@@ -11,14 +11,15 @@ setup(
     description='iTunes / Music CLI control and python API',
     url='https://github.com/hile/pytunes/',
     license='PSF',
-    packages=find_packages(),
-    python_requires='>3.6.0',
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*']),
+    python_requires='>=3.7',
     entry_points={
         'console_scripts': [
             'pytunes=pytunes.bin.pytunes:main',
             'pytunes-playlists=pytunes.bin.pytunes_playlists:main',
             'pytunes-update=pytunes.bin.pytunes_update:main',
             'pytunesd=pytunes.bin.pytunesd:main',
+            'pytunes-server=pytunes.bin.pytunes_server:main',
         ],
     },
     setup_requires=['pytest-runner'],
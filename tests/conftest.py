@@ -0,0 +1,81 @@
+"""
+Test configuration
+
+Tests run against the synthetic Apple Event bridge, which is selected before pytunes is
+imported.
+"""
+
+import os
+import tempfile
+
+os.environ['PYTUNES_BRIDGE'] = 'synthetic'
+os.environ['HOME'] = tempfile.mkdtemp(prefix='pytunes-tests-')
+
+import pytest  # noqa: E402
+
+from pytunes.bridge import synthetic  # noqa: E402
+from pytunes.bridge.recording import RecordingApplication  # noqa: E402
+from pytunes.client import Client  # noqa: E402
+
+# Size of synthetic library used by tests
+TEST_TRACKS = 100
+TEST_PLAYLISTS = 10
+
+
+class EventRecorder(object):
+    """
+    Recorder collecting (event, property) tuples of Apple Events
+    """
+    def __init__(self):
+        self.events = []
+
+    def record(self, event, reference, property, seconds, error=False):
+        self.events.append((event, property))
+
+
+@pytest.fixture
+def application(tmp_path):
+    """
+    Synthetic music player application with a new library
+    """
+    root = str(tmp_path / 'Music')
+    return synthetic.configure(tracks=TEST_TRACKS, playlists=TEST_PLAYLISTS, root=root)
+
+
+@pytest.fixture
+def client(application):
+    """
+    Client connected to synthetic application
+    """
+    Client.__instance__ = None
+    client = Client()
+    client.__connect__()
+    application.reset_counters()
+    return client
+
+
+@pytest.fixture
+def recorder(client):
+    """
+    Event recorder for events sent by client
+    """
+    recorder = EventRecorder()
+    Client.__instance__.application = RecordingApplication(Client.__instance__.application, [recorder])
+    return recorder
+
+
+@pytest.fixture
+def indexdb(application, client):
+    """
+    Track index database of client in a temporary directory, with files for all library tracks
+    """
+    for track in application.library.library.tracks:
+        path = track.values['location'].path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, 'w').close()
+    client.__index_database__ = os.path.join(os.path.dirname(application.library.root), 'index.sqlite')
+    indexdb = client.indexdb
+    yield indexdb
+    indexdb.close()
+    indexdb.conn.close()
+    indexdb.conn = None
@@ -0,0 +1,200 @@
+"""
+Unit tests for track index database
+"""
+
+import os
+
+import pytest
+
+from pytunes import MusicPlayerError
+from pytunes.bridge import synthetic
+from pytunes.database import TrackIndexReader
+from pytunes.offline import OfflinePlaylist
+
+from conftest import TEST_TRACKS
+
+
+def count_tracks(indexdb):
+    c = indexdb.cursor
+    c.execute("""SELECT COUNT(*) FROM tracks""")
+    return c.fetchone()[0]
+
+
+def test_update_full_adds_library_tracks(indexdb):
+    """
+    Full update indexes all library tracks
+    """
+    assert indexdb.update(full=True) == (TEST_TRACKS, 0)
+    assert count_tracks(indexdb) == TEST_TRACKS
+
+
+def test_cleanup_without_live_keys_raises(indexdb):
+    """
+    Cleanup without ids or live keys from the same update does not remove tracks
+    """
+    with pytest.raises(MusicPlayerError):
+        indexdb.cleanup()
+    indexdb.update(full=True)
+    with pytest.raises(MusicPlayerError):
+        indexdb.cleanup()
+    assert count_tracks(indexdb) == TEST_TRACKS
+
+
+@pytest.mark.parametrize('full', (True, False))
+def test_update_removes_tracks_from_empty_library(application, indexdb, full):
+    """
+    Tracks are removed when library drops to zero tracks
+    """
+    indexdb.update(full=True)
+    application.library.library.tracks.clear()
+    application.library.library.modified()
+    assert indexdb.update(full=full) == (0, TEST_TRACKS)
+    assert count_tracks(indexdb) == 0
+
+
+def test_cleanup_removes_unknown_ids(application, indexdb):
+    """
+    Cleanup with ids removes tracks not in ids
+    """
+    indexdb.update(full=True)
+    ids = [track.values['persistent_ID'] for track in application.library.library.tracks[:10]]
+    assert indexdb.cleanup(ids) == TEST_TRACKS - 10
+    assert count_tracks(indexdb) == 10
+
+
+# Persistent IDs stored as numbers by columns with NUMERIC affinity
+NUMERIC_PERSISTENT_IDS = ('0000000000001234', '12E4000000000000')
+
+
+def test_numeric_persistent_ids_are_stored_as_text(application, indexdb):
+    """
+    Persistent IDs with only digits or looking like exponents are kept as text
+    """
+    for track, persistent_id in zip(application.library.library.tracks, NUMERIC_PERSISTENT_IDS):
+        track.values['persistent_ID'] = persistent_id
+    indexdb.update(full=True, metadata=True)
+    for table in ('tracks', 'metadata'):
+        c = indexdb.cursor
+        c.execute("""SELECT persistent_id FROM {} WHERE persistent_id IN (?, ?)""".format(table),
+                  NUMERIC_PERSISTENT_IDS)
+        assert sorted(row[0] for row in c.fetchall()) == sorted(NUMERIC_PERSISTENT_IDS)
+    assert count_tracks(indexdb) == TEST_TRACKS
+    assert indexdb.update(full=True) == (TEST_TRACKS, 0)
+
+
+def test_playlist_mirror_keeps_repeated_tracks(application, indexdb):
+    """
+    Playlist mirror stores tracks on playlist more than once in each position
+    """
+    playlist = application.library.playlists[1]
+    tracks = application.library.library.tracks
+    playlist.tracks = [tracks[3], tracks[1], tracks[3], tracks[2]]
+    playlist.modified()
+    indexdb.update(full=True, metadata=True)
+
+    entry = [entry for entry in indexdb.read_playlists() if entry['persistent_ID'] == playlist.values['persistent_ID']]
+    rows = OfflinePlaylist(indexdb.client, entry[0]).fetch(('name',))
+    assert [persistent_id for persistent_id, values in rows] == [
+        track.values['persistent_ID'] for track in playlist.tracks
+    ]
+    assert [values['name'] for persistent_id, values in rows] == ['Track 4', 'Track 2', 'Track 4', 'Track 3']
+
+
+def add_playlist(application, name, tracks):
+    library = application.library
+    playlist = synthetic.SyntheticPlaylist(library.__allocate_id__(), library.__persistent_id__(), name, tracks=tracks)
+    library.playlists.append(playlist)
+    return playlist
+
+
+def test_unchanged_playlists_are_not_read(application, indexdb, recorder):
+    """
+    Update without changes sends the same events regardless of number of playlists
+    """
+    indexdb.update(full=True, metadata=True)
+    recorder.events.clear()
+    assert indexdb.update() == (0, 0)
+    events = list(recorder.events)
+
+    tracks = application.library.library.tracks
+    for index in range(5):
+        add_playlist(application, 'Added {:d}'.format(index), tracks[index:index + 10])
+    indexdb.update()
+    assert [entry['name'] for entry in indexdb.read_playlists()][-5:] == ['Added {:d}'.format(i) for i in range(5)]
+    recorder.events.clear()
+    assert indexdb.update() == (0, 0)
+    assert recorder.events == events
+
+
+def test_playlist_mirror_updates_changed_playlists(application, indexdb, recorder):
+    """
+    Only tracks of changed playlists are read, and removed playlists are deleted from mirror
+    """
+    indexdb.update(full=True, metadata=True)
+    library = application.library
+    changed, renamed, removed = library.playlists[1], library.playlists[2], library.playlists[4]
+    changed.tracks = changed.tracks + library.library.tracks[:3]
+    changed.modified()
+    renamed.values['name'] = 'Renamed'
+    library.playlists.remove(removed)
+
+    recorder.events.clear()
+    indexdb.update()
+    # Lengths of library and changed playlist
+    assert recorder.events.count(('get', 'index')) == 2
+
+    assert [entry['name'] for entry in indexdb.read_playlists()] == [
+        playlist.values['name'] for playlist in library.playlists
+    ]
+    c = indexdb.cursor
+    c.execute("""SELECT track_id FROM playlist_tracks WHERE playlist_id=? ORDER BY position""",
+              (changed.values['persistent_ID'],))
+    assert [row[0] for row in c.fetchall()] == [track.values['persistent_ID'] for track in changed.tracks]
+    c.execute("""SELECT COUNT(*) FROM playlist_tracks WHERE playlist_id=?""", (removed.values['persistent_ID'],))
+    assert c.fetchone()[0] == 0
+
+
+def test_lookup_indexes_rejects_invalid_batch_size(application, indexdb):
+    """
+    Lookup batch size must be at least 1
+    """
+    indexdb.update(full=True)
+    paths = [track.values['location'].path for track in application.library.library.tracks[:3]]
+    assert len([persistent_id for path, persistent_id in indexdb.lookup_indexes(paths, 1) if persistent_id]) == 3
+    with pytest.raises(ValueError):
+        list(indexdb.lookup_indexes(paths, 0))
+
+
+def test_reader_is_not_blocked_by_writer(application, indexdb):
+    """
+    Reader finds committed tracks while a write transaction is open
+    """
+    indexdb.update(full=True)
+    track = application.library.library.tracks[0]
+    c = indexdb.cursor
+    c.execute("""BEGIN IMMEDIATE""")
+    c.execute("""DELETE FROM tracks""")
+    try:
+        reader = TrackIndexReader(indexdb.db_path, busy_timeout=0)
+        assert reader.lookup_index(track.values['location'].path) == track.values['persistent_ID']
+        reader.close()
+    finally:
+        indexdb.rollback()
+
+
+def test_reader_does_not_create_database(tmp_path):
+    """
+    Reader does not create missing database
+    """
+    path = str(tmp_path / 'missing.sqlite')
+    with pytest.raises(MusicPlayerError):
+        TrackIndexReader(path).lookup_index('/music/track.m4a')
+    assert not os.path.exists(path)
+
+
+def test_client_lookups_use_reader(client):
+    """
+    Client lookups use reader without opening the index database for writing
+    """
+    assert type(client.index_reader) is TrackIndexReader
+    assert client.__indexdb__ is None
@@ -0,0 +1,131 @@
+"""
+Unit tests for playlists
+"""
+
+import pytest
+
+from pytunes import MusicPlayerError
+from pytunes.bridge import synthetic
+from pytunes.bridge.recording import RecordingApplication
+from pytunes.playlist import COLUMN_READ_ATTEMPTS
+
+
+def test_fetch_keeps_repeated_tracks(application, client):
+    """
+    Tracks on playlist more than once are fetched once for each position
+    """
+    playlist = application.library.playlists[1]
+    tracks = application.library.library.tracks
+    playlist.tracks = [tracks[0], tracks[1], tracks[0], tracks[2]]
+    playlist.modified()
+
+    rows = client.get_playlist(playlist.values['name']).fetch(('name',))
+    assert [persistent_id for persistent_id, values in rows] == [
+        track.values['persistent_ID'] for track in playlist.tracks
+    ]
+    assert [values['name'] for persistent_id, values in rows] == [
+        'Track 1', 'Track 2', 'Track 1', 'Track 3',
+    ]
+
+
+def test_fetch_range(client):
+    """
+    Fetch returns rows in range in library order
+    """
+    library = client.library
+    rows = library.fetch(('name', 'persistent_ID'), 10, 15)
+    assert [values['name'] for persistent_id, values in rows] == ['Track {:d}'.format(i) for i in range(11, 16)]
+    assert all(persistent_id == values['persistent_ID'] for persistent_id, values in rows)
+    assert library.fetch(('name',), 20, 10) == []
+
+
+def test_catalog_reads_parents_per_folder(application, client, recorder):
+    """
+    Catalog is loaded with bulk requests and one request per folder
+    """
+    playlists = application.library.playlists
+    folders = [playlist for playlist in playlists if playlist.values['name'].startswith('Folder')]
+
+    catalog = client.catalog
+    assert len(catalog) == len(playlists)
+    assert len(recorder.events) == 5 + len(folders)
+
+    for playlist in playlists:
+        entry = catalog.entries[playlist.values['persistent_ID']]
+        parent = playlist.parent.values['persistent_ID'] if playlist.parent is not None else None
+        assert entry['parent'] == parent
+        if playlist.parent is not None:
+            assert entry['path'] == '{}/{}'.format(playlist.parent.values['name'], playlist.values['name'])
+
+
+def test_catalog_keeps_playlists_with_same_path(application, client):
+    """
+    Playlists with same name in same folder are all returned
+    """
+    library = application.library
+    playlist = library.playlists[2]
+    library.playlists.append(synthetic.SyntheticPlaylist(
+        library.__allocate_id__(),
+        library.__persistent_id__(),
+        playlist.values['name'],
+        parent=playlist.parent,
+    ))
+
+    path = '{}/{}'.format(playlist.parent.values['name'], playlist.values['name'])
+    assert [entry_path for entry_path, entry in client.catalog.paths()].count(path) == 2
+    assert [entry.path for entry in client.playlists].count(path) == 2
+
+
+class TrackAdder(object):
+    """
+    Recorder adding a track to playlist after each persistent_ID read while reads is positive
+    """
+    def __init__(self, playlist, track):
+        self.playlist = playlist
+        self.track = track
+        self.reads = 0
+
+    def record(self, event, reference, property, seconds, error=False):
+        if property == 'persistent_ID' and self.reads > 0:
+            self.reads -= 1
+            self.playlist.tracks.append(self.track)
+            self.playlist.modified()
+
+
+def test_fetch_reads_again_when_tracks_change(application, client):
+    """
+    Fields are read again when tracks change between column reads
+    """
+    playlist = application.library.playlists[1]
+    tracks = application.library.library.tracks
+    playlist.tracks = tracks[:3]
+    playlist.modified()
+    adder = TrackAdder(playlist, tracks[10])
+    client.__instance__.application = RecordingApplication(client.__instance__.application, [adder])
+    fetched = client.get_playlist(playlist.values['name'])
+    len(fetched)
+    adder.reads = 1
+
+    rows = fetched.fetch(('name',))
+    assert [values['name'] for persistent_id, values in rows] == ['Track 1', 'Track 2', 'Track 3', 'Track 11']
+    assert [persistent_id for persistent_id, values in rows] == [
+        track.values['persistent_ID'] for track in playlist.tracks
+    ]
+
+
+def test_fetch_raises_when_tracks_keep_changing(application, client):
+    """
+    Fetch raises MusicPlayerError instead of returning misaligned rows
+    """
+    playlist = application.library.playlists[1]
+    tracks = application.library.library.tracks
+    playlist.tracks = tracks[:3]
+    playlist.modified()
+    adder = TrackAdder(playlist, tracks[10])
+    client.__instance__.application = RecordingApplication(client.__instance__.application, [adder])
+    fetched = client.get_playlist(playlist.values['name'])
+    len(fetched)
+    adder.reads = COLUMN_READ_ATTEMPTS
+
+    with pytest.raises(MusicPlayerError):
+        fetched.fetch(('name',))
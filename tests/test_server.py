@@ -0,0 +1,90 @@
+"""
+Unit tests for warm client server
+"""
+
+import os
+import threading
+
+import pytest
+
+from pytunes import MusicPlayerError, bridge
+from pytunes.server import INVALID_PARAMS, SERVER_ERROR, ClientServer, ServerClient
+
+
+@pytest.fixture
+def server(client, tmp_path):
+    """
+    Client server serving in a background thread
+    """
+    server = ClientServer(str(tmp_path / 'pytunes.sock'), client)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def test_idle_connection_does_not_block_requests(server):
+    """
+    Requests are served while another connection is idle
+    """
+    idle = ServerClient(server.path).connect()
+    try:
+        other = ServerClient(server.path, timeout=5)
+        assert other.call('ping')['pid'] == os.getpid()
+        assert other.volume == 50
+        other.close()
+    finally:
+        idle.close()
+
+
+def test_command_error_is_returned_as_error(server, monkeypatch):
+    """
+    Music player command errors are returned as JSON-RPC errors and keep the connection open
+    """
+    def rpc_status():
+        raise bridge.CommandError('Player is not responding')
+
+    monkeypatch.setattr(server, 'rpc_status', rpc_status)
+    connection = ServerClient(server.path, timeout=5)
+    try:
+        with pytest.raises(MusicPlayerError) as e:
+            connection.status
+        assert 'Player is not responding' in str(e.value)
+        assert connection.call('ping')['pid'] == os.getpid()
+    finally:
+        connection.close()
+
+
+def test_invalid_parameters_and_internal_errors(server, monkeypatch):
+    """
+    Parameters are checked against method signature and other errors are returned as server errors
+    """
+    def rpc_status():
+        raise TypeError('Internal error')
+
+    monkeypatch.setattr(server, 'rpc_status', rpc_status)
+    response = server.process(b'{"jsonrpc": "2.0", "id": 1, "method": "volume", "params": {"level": 10}}')
+    assert response['error']['code'] == INVALID_PARAMS
+    response = server.process(b'{"jsonrpc": "2.0", "id": 2, "method": "status"}')
+    assert response['error']['code'] == SERVER_ERROR
+    assert 'Internal error' in response['error']['message']
+
+
+def test_lookup_indexes_sends_absolute_paths(application, indexdb, server, monkeypatch):
+    """
+    Relative lookup paths are resolved against client working directory
+    """
+    indexdb.update(full=True)
+    path = application.library.library.tracks[0].values['location'].path
+    monkeypatch.chdir(os.path.dirname(path))
+    connection = ServerClient(server.path, timeout=5)
+    try:
+        assert connection.lookup_indexes([os.path.basename(path)]) == [
+            (path, application.library.library.tracks[0].values['persistent_ID'])
+        ]
+        with pytest.raises(MusicPlayerError):
+            connection.call('lookup_indexes', paths=[os.path.basename(path)])
+    finally:
+        connection.close()
@@ -0,0 +1,232 @@
+"""
+Unit tests for status monitoring
+"""
+
+import pytest
+
+pytest.importorskip('lxml')
+
+from pytunes.client import PlayerSnapshot  # noqa: E402
+from pytunes.constants import REPEAT_VALUES  # noqa: E402
+from pytunes.status import (  # noqa: E402
+    IDLE_POLL_INTERVAL,
+    PLAYING_POLL_INTERVAL,
+    TRANSITION_LEAD_TIME,
+    TRANSITION_POLL_INTERVAL,
+    PollScheduler,
+    musicPlayerStatus,
+)
+
+
+def test_monitor_reads_one_snapshot_per_check(application, client, recorder):
+    """
+    Track change is detected and reported from one snapshot without other requests
+    """
+    monitor = musicPlayerStatus(scheduler=PollScheduler(sleep=lambda seconds: None))
+    assert monitor.status == 'stopped'
+    assert monitor.current is None
+
+    application.play()
+    recorder.events.clear()
+    status, info = monitor.next()
+
+    assert status == 'playing'
+    assert info['name'] == 'Track 1'
+    assert recorder.events == [('get', 'properties'), ('get', 'properties')]
+    assert monitor.current.persistent_ID == application.library.library.tracks[0].values['persistent_ID']
+    assert monitor.current.name == 'Track 1'
+    assert len(recorder.events) == 2
+
+
+def test_snapshot_repeat_matches_client(application, client):
+    """
+    Snapshot returns repeat mode name for client repeat value
+    """
+    assert client.snapshot(track=False).repeat == 'off'
+    assert client.repeat == REPEAT_VALUES['off']
+    client.repeat = 'all'
+    assert client.snapshot(track=False).repeat == 'all'
+    assert client.repeat == REPEAT_VALUES['all']
+
+
+class SimulatedClock(object):
+    """
+    Clock advanced only by sleep calls
+    """
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakePlayer(object):
+    """
+    Fake music player client playing tracks of given durations in order with simulated clock
+    """
+    __app_name__ = 'Music'
+
+    def __init__(self, clock, durations):
+        self.clock = clock
+        self.durations = durations
+        self.state = 'playing'
+        self.index = 0
+        self.started = clock()
+        self.position = 0.0
+        self.snapshots = 0
+
+    def __advance__(self):
+        if self.state != 'playing':
+            return
+        self.position = self.clock() - self.started
+        while self.index < len(self.durations) and self.position >= self.durations[self.index]:
+            self.started += self.durations[self.index]
+            self.position -= self.durations[self.index]
+            self.index += 1
+        if self.index >= len(self.durations):
+            self.stop()
+
+    def pause(self):
+        self.__advance__()
+        self.state = 'paused'
+
+    def stop(self):
+        self.state = 'stopped'
+        self.index = 0
+        self.position = 0.0
+
+    def track_reference(self, persistent_id):
+        return None
+
+    def snapshot(self, track=True):
+        self.__advance__()
+        self.snapshots += 1
+        values = None
+        if self.state != 'stopped':
+            values = {
+                'persistent_ID': '{:016X}'.format(self.index + 1),
+                'name': 'Track {:d}'.format(self.index + 1),
+                'path': '/Music/{:02d}.m4a'.format(self.index + 1),
+                'duration': float(self.durations[self.index]),
+            }
+        return PlayerSnapshot(
+            status=self.state,
+            position=self.position if values is not None else None,
+            persistent_ID=values['persistent_ID'] if values is not None else None,
+            duration=values['duration'] if values is not None else None,
+            volume=50,
+            shuffle=False,
+            repeat='off',
+            track=values,
+        )
+
+
+def simulated_monitor(clock, player, **kwargs):
+    """
+    Status monitor polling fake player with simulated clock
+    """
+    monitor = musicPlayerStatus(scheduler=PollScheduler(clock=clock, sleep=clock.sleep, **kwargs))
+    monitor.client = player
+    monitor.current = None
+    monitor.status = None
+    return monitor
+
+
+def test_scheduler_sleeps_until_track_end(client):
+    """
+    While playing, first sleep lasts until lead time before expected track end
+    """
+    clock = SimulatedClock()
+    player = FakePlayer(clock, [300, 200])
+    monitor = simulated_monitor(clock, player, max_interval=600)
+
+    status, info = monitor.next()
+    assert status == 'playing'
+    assert info['name'] == 'Track 1'
+
+    status, info = monitor.next()
+    assert info['name'] == 'Track 2'
+    assert clock.sleeps[0] == 300 - TRANSITION_LEAD_TIME
+    assert monitor.counters['polls'] <= 2 + TRANSITION_LEAD_TIME / TRANSITION_POLL_INTERVAL + 1
+    assert monitor.counters['latency_max'] <= TRANSITION_POLL_INTERVAL
+
+
+def test_scheduler_polls_fast_near_track_end(client):
+    """
+    Within lead time of expected track end, polls are sent every fast interval
+    """
+    clock = SimulatedClock()
+    player = FakePlayer(clock, [300])
+    scheduler = PollScheduler(clock=clock, sleep=clock.sleep, max_interval=600)
+
+    scheduler.poll(player.snapshot())
+    assert scheduler.delay() == 300 - TRANSITION_LEAD_TIME
+
+    clock.sleep(300 - TRANSITION_LEAD_TIME)
+    scheduler.poll(player.snapshot())
+    assert scheduler.delay() == TRANSITION_POLL_INTERVAL
+    clock.sleep(TRANSITION_POLL_INTERVAL)
+    scheduler.poll(player.snapshot())
+    assert scheduler.delay() == TRANSITION_POLL_INTERVAL
+
+
+def test_playing_sleep_is_capped(client):
+    """
+    Sleep while playing is limited to max interval, so manual changes are noticed
+    """
+    clock = SimulatedClock()
+    player = FakePlayer(clock, [600])
+    scheduler = PollScheduler(clock=clock, sleep=clock.sleep)
+
+    scheduler.poll(player.snapshot())
+    assert scheduler.delay() == PLAYING_POLL_INTERVAL
+
+
+def test_pause_is_detected_and_polls_back_off(client):
+    """
+    Pause is detected within max interval and paused player is polled with growing delays
+    """
+    clock = SimulatedClock()
+    player = FakePlayer(clock, [600])
+    monitor = simulated_monitor(clock, player)
+    assert monitor.next()[0] == 'playing'
+
+    clock.now += 100
+    player.pause()
+    paused = clock()
+    status, info = monitor.next()
+    assert status == 'paused'
+    assert info is None
+    assert clock() - paused <= PLAYING_POLL_INTERVAL
+
+    delays = []
+    for poll in range(8):
+        delays.append(monitor.scheduler.delay())
+    assert delays == [1, 2, 4, 8, IDLE_POLL_INTERVAL, IDLE_POLL_INTERVAL, IDLE_POLL_INTERVAL, IDLE_POLL_INTERVAL]
+
+
+def test_stop_is_detected(client):
+    """
+    Stop after last track is reported without track info
+    """
+    clock = SimulatedClock()
+    player = FakePlayer(clock, [120])
+    monitor = simulated_monitor(clock, player)
+    assert monitor.next()[0] == 'playing'
+
+    status, info = monitor.next()
+    assert status == 'stopped'
+    assert info is None
+    assert monitor.counters['latency_max'] <= TRANSITION_POLL_INTERVAL
+
+    polls = monitor.counters['polls']
+    for poll in range(10):
+        monitor.scheduler.poll(player.snapshot())
+        monitor.scheduler.wait()
+    assert monitor.counters['polls'] == polls + 10
+    assert clock.sleeps[-1] == IDLE_POLL_INTERVAL
@@ -0,0 +1,42 @@
+"""
+Unit tests for tracks
+"""
+
+import pytest
+
+from pytunes.track import Track
+
+
+def test_tracks_compared_by_id_do_not_read_location(client, recorder):
+    """
+    Constructing tracks and comparing them by id sends no location events
+    """
+    library = client.library
+    found = library.find(artist='Artist 1')
+    references = client.get(library.playlist.file_tracks[1:30])
+    tracks = [Track(client, reference) for reference in references]
+
+    assert [track.id for track in found] == [track.id for track in tracks]
+    assert ('get', 'id') in recorder.events
+    assert ('get', 'location') not in recorder.events
+
+
+def test_path_is_resolved_once(client, recorder):
+    """
+    Track path is read from location on first access and cached
+    """
+    track = Track(client, client.get(client.library.playlist.file_tracks[1]))
+    assert recorder.events.count(('get', 'location')) == 0
+    assert track.path.endswith('01 Track 1.m4a')
+    assert track.path == track['path']
+    assert recorder.events.count(('get', 'location')) == 1
+
+
+def test_cached_value_update_time_zero_is_kept(client):
+    """
+    Cached value with update time 0 is expired by cache_ttl
+    """
+    track = Track(client, client.get(client.library.playlist.file_tracks[1]), cache_ttl=0.001)
+    track.__set_cached__('name', 'Cached', updated=0)
+    with pytest.raises(KeyError):
+        track.__get_cached__('name')